@@ -0,0 +1,112 @@
+import threading
+import time
+from functools import cached_property
+
+import httpx
+import instructor
+from gigachat import GigaChat
+from gigachat.client import _get_kwargs
+from openai import OpenAI
+
+from clusters.instances import openrouter_token, gigachat_token
+
+# Токен обновляется заранее, за минуту до истечения срока действия
+TOKEN_REFRESH_MARGIN = 60
+POOL_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120)
+
+
+class PooledGigaChat(GigaChat):
+    """
+    GigaChat client meant to be shared between threads.
+
+    Keeps a keep-alive connection pool and refreshes the OAuth token once,
+    under a lock, shortly before it expires instead of after a failed call.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._token_lock = threading.Lock()
+
+    @cached_property
+    def _client(self) -> httpx.Client:
+        return httpx.Client(limits=POOL_LIMITS, **_get_kwargs(self._settings))
+
+    def _token_expired(self):
+        token = self._access_token
+        # expires_at приходит в миллисекундах
+        return token is None or (
+            token.expires_at and token.expires_at / 1000 - TOKEN_REFRESH_MARGIN <= time.time())
+
+    def _check_validity_token(self) -> bool:
+        if self._token_expired():
+            self._update_token()
+        return self._access_token is not None
+
+    def _update_token(self) -> None:
+        with self._token_lock:
+            # Другой поток мог уже обновить токен, пока мы ждали блокировку
+            if self._access_token is not None and not self._token_expired():
+                return
+            super()._update_token()
+
+    def _reset_token(self) -> None:
+        with self._token_lock:
+            super()._reset_token()
+
+
+class ClientRegistry:
+    """Process-wide registry of long-lived API clients."""
+
+    def __init__(self):
+        self._clients = {}
+        # RLock: фабрика одного клиента может запрашивать другой клиент из реестра
+        self._lock = threading.RLock()
+
+    def get(self, name, factory):
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = factory()
+                    self._clients[name] = client
+        return client
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                close = getattr(client, 'close', None)
+                if close:
+                    close()
+            self._clients.clear()
+
+
+registry = ClientRegistry()
+
+
+def _create_gigachat():
+    client = PooledGigaChat(credentials=gigachat_token, verify_ssl_certs=False, timeout=30)
+    # Создаём HTTP-клиенты сразу, чтобы потоки не инициализировали их одновременно
+    client._client
+    client._auth_client
+    return client
+
+
+def get_gigachat_client():
+    """Общий клиент GigaChat для чата и эмбеддингов"""
+    return registry.get('gigachat', _create_gigachat)
+
+
+def get_openai_client():
+    """Общий клиент OpenAI, настроенный на OpenRouter"""
+    return registry.get('openrouter', lambda: OpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=openrouter_token,
+        http_client=httpx.Client(limits=POOL_LIMITS, timeout=60),
+    ))
+
+
+def get_openrouter_client():
+    """Общая обёртка instructor над клиентом OpenRouter"""
+    return registry.get('openrouter-instructor', lambda: instructor.from_openai(
+        get_openai_client(), mode=instructor.Mode.TOOLS))
@@ -0,0 +1,88 @@
+import numpy as np
+
+# Пороговые значения по умолчанию для решения о полной перекластеризации
+DEFAULT_THRESHOLDS = {
+    'max_new_fraction': 0.2,
+    'max_far_fraction': 0.1,
+    'max_distance_ratio': 1.25,
+    'max_size_skew': 1.5,
+}
+
+
+def size_skew(sizes):
+    """Отношение размера самого большого кластера к среднему размеру"""
+    sizes = np.asarray(sizes, dtype=float)
+    if sizes.size == 0 or sizes.mean() == 0:
+        return 0.0
+    return float(sizes.max() / sizes.mean())
+
+
+def assignment_distances(scaled_embeddings, centroids):
+    """
+    Assign points to their nearest centroid.
+
+    Args:
+        scaled_embeddings (np.ndarray): (n, d) embeddings in the scaler space of the run
+        centroids (np.ndarray): (k, d) cluster centroids in the same space
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: index of the nearest centroid and the distance to it
+    """
+    # ||x - c||^2 = ||x||^2 - 2 x·c + ||c||^2, без материализации (n, k, d)
+    squared = (
+        np.einsum('ij,ij->i', scaled_embeddings, scaled_embeddings)[:, None]
+        - 2 * scaled_embeddings @ centroids.T
+        + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+    )
+    nearest = np.argmin(squared, axis=1)
+    distances = np.sqrt(np.maximum(squared[np.arange(len(nearest)), nearest], 0))
+    return nearest, distances
+
+
+def measure_drift(run, distances, nearest, cluster_sizes, new_since_run=None):
+    """
+    Compare freshly assigned points against the statistics of the last full run.
+
+    Args:
+        run (ClusteringRun): baseline recorded by the last full clustering
+        distances (np.ndarray): nearest-centroid distances of the new points
+        nearest (np.ndarray): index of the nearest centroid for every new point
+        cluster_sizes (np.ndarray): current sizes of the clusters, in centroid order
+        new_since_run (int): complaints added since the run, including those already
+            assigned incrementally; defaults to the number of new points
+
+    Returns:
+        dict: drift metrics
+    """
+    new_count = len(distances) if new_since_run is None else new_since_run
+    sizes_after = np.asarray(cluster_sizes, dtype=float) + np.bincount(
+        nearest, minlength=len(cluster_sizes))
+
+    report = {
+        'new_count': new_count,
+        'new_fraction': new_count / run.n_complaints if run.n_complaints else 1.0,
+        'far_fraction': 0.0,
+        'distance_ratio': 0.0,
+        'size_skew': 0.0,
+    }
+    if len(distances):
+        report['far_fraction'] = float(np.mean(distances > run.distance_p95))
+        if run.mean_distance:
+            report['distance_ratio'] = float(distances.mean() / run.mean_distance)
+    if run.size_skew:
+        report['size_skew'] = size_skew(sizes_after) / run.size_skew
+    return report
+
+
+def exceeded_thresholds(report, thresholds):
+    """Возвращает список метрик, превысивших допустимые пороги"""
+    checks = [
+        ('new_fraction', 'max_new_fraction'),
+        ('far_fraction', 'max_far_fraction'),
+        ('distance_ratio', 'max_distance_ratio'),
+        ('size_skew', 'max_size_skew'),
+    ]
+    return [
+        metric for metric, limit in checks
+        if report[metric] > thresholds.get(limit, DEFAULT_THRESHOLDS[limit])
+    ]
@@ -0,0 +1,43 @@
+import hashlib
+import numpy as np
+
+# Доля изменившихся участников кластера, после которой описание генерируется заново
+DEFAULT_SUMMARY_CHANGE_THRESHOLD = 0.2
+
+_MINHASH_PRIME = (1 << 31) - 1
+_MINHASH_PERMUTATIONS = 64
+_rng = np.random.RandomState(20240611)
+_MINHASH_A = _rng.randint(1, _MINHASH_PRIME, size=_MINHASH_PERMUTATIONS).astype(np.uint64)
+_MINHASH_B = _rng.randint(0, _MINHASH_PRIME, size=_MINHASH_PERMUTATIONS).astype(np.uint64)
+
+
+def membership_fingerprint(complaint_ids, model):
+    """Хэш отсортированного набора id жалоб кластера вместе с моделью"""
+    ids = np.sort(np.asarray(list(complaint_ids), dtype=np.int64))
+    digest = hashlib.sha256(ids.tobytes())
+    digest.update(str(model).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def minhash_signature(complaint_ids):
+    """
+    Compact MinHash signature of a cluster membership.
+
+    Args:
+        complaint_ids (Iterable[int]): ids of the cluster's complaints
+
+    Returns:
+        List[int]: signature that estimates Jaccard similarity between memberships
+    """
+    ids = np.asarray(list(complaint_ids), dtype=np.uint64) % _MINHASH_PRIME
+    if ids.size == 0:
+        return []
+    hashes = (_MINHASH_A[:, None] * ids[None, :] + _MINHASH_B[:, None]) % _MINHASH_PRIME
+    return hashes.min(axis=1).tolist()
+
+
+def membership_change(old_signature, new_signature):
+    """Оценка доли изменившихся участников (1 - Jaccard) по двум сигнатурам"""
+    if not old_signature or not new_signature or len(old_signature) != len(new_signature):
+        return 1.0
+    return 1.0 - float(np.mean(np.asarray(old_signature) == np.asarray(new_signature)))
@@ -14,6 +14,8 @@ class InstanceConfig:
             self.openrouter_token = self.env("OPENROUTER_TOKEN", default="openrouter")
             self.gigachat_token = self.env("GIGACHAT_TOKEN", default="gigachat")
             self.youtube_api_key = self.env("YOUTUBE_API_KEY", default="youtube_api_key")
+            # Провайдер эмбеддингов: gigachat (удалённый) или hashing (локальный, на CPU)
+            self.embedding_provider = self.env("EMBEDDING_PROVIDER", default="gigachat")
 
             # Mark as initialized to avoid re-initialization
             InstanceConfig._initialized = True
@@ -25,3 +27,4 @@ config = InstanceConfig()
 openrouter_token = config.openrouter_token
 gigachat_token = config.gigachat_token
 youtube_api_key = config.youtube_api_key
+embedding_provider = config.embedding_provider
@@ -0,0 +1,83 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer, ENGLISH_STOP_WORDS
+
+# Частые служебные слова русского языка, не несущие смысла для названия кластера
+RUSSIAN_STOP_WORDS = {
+    'без', 'более', 'больше', 'будет', 'будто', 'бы', 'был', 'была', 'были', 'было', 'быть',
+    'вам', 'вас', 'весь', 'во', 'вот', 'все', 'всего', 'всех', 'вы', 'где', 'да', 'даже',
+    'для', 'до', 'его', 'ее', 'её', 'если', 'есть', 'еще', 'ещё', 'же', 'за', 'здесь', 'из',
+    'или', 'им', 'их', 'как', 'какой', 'когда', 'кто', 'ли', 'либо', 'мне', 'много', 'может',
+    'можно', 'мой', 'моя', 'мы', 'на', 'над', 'надо', 'наш', 'не', 'него', 'нее', 'нет', 'ни',
+    'них', 'но', 'ну', 'об', 'однако', 'он', 'она', 'они', 'оно', 'от', 'очень', 'по', 'под',
+    'после', 'потом', 'потому', 'почему', 'при', 'про', 'раз', 'сам', 'свой', 'себя', 'со',
+    'так', 'также', 'такой', 'там', 'те', 'тем', 'то', 'того', 'тоже', 'только', 'том', 'тот',
+    'тут', 'ты', 'уже', 'хотя', 'чего', 'чем', 'через', 'что', 'чтобы', 'это', 'этого', 'этой',
+    'этот', 'эти', 'мои', 'меня', 'нам', 'нас', 'вообще', 'просто', 'всё', 'всем', 'какие',
+}
+STOP_WORDS = sorted(RUSSIAN_STOP_WORDS | set(ENGLISH_STOP_WORDS))
+DEFAULT_TOP_TERMS = 5
+
+
+def class_tfidf_keywords(texts, labels, top_n=DEFAULT_TOP_TERMS, max_features=50000):
+    """
+    Top terms of every cluster by class-based TF-IDF (c-TF-IDF).
+
+    All documents of a cluster are treated as one document: term counts are
+    summed per cluster with a single sparse matrix product and weighted by
+    ``log(1 + A / f_t)``, where ``A`` is the average number of words per
+    cluster and ``f_t`` the frequency of the term across all clusters.
+
+    Args:
+        texts (List[str]): complaint texts
+        labels (Sequence[int]): cluster label of every text
+        top_n (int): number of terms to return per cluster
+
+    Returns:
+        Dict[int, List[str]]: label -> top terms, most characteristic first
+    """
+    labels = np.asarray(labels)
+    classes, class_index = np.unique(labels, return_inverse=True)
+    vectorizer = CountVectorizer(
+        lowercase=True,
+        token_pattern=r"(?u)\b[^\W\d_]{3,}\b",
+        stop_words=STOP_WORDS,
+        max_features=max_features,
+    )
+    try:
+        counts = vectorizer.fit_transform(texts)
+    except ValueError:
+        # Пустой словарь: все тексты состоят из стоп-слов или чисел
+        return {int(label): [] for label in classes}
+
+    indicator = csr_matrix(
+        (np.ones(len(labels)), (class_index, np.arange(len(labels)))),
+        shape=(len(classes), len(labels)),
+    )
+    class_counts = indicator @ counts
+
+    words_per_class = np.asarray(class_counts.sum(axis=1)).ravel()
+    term_frequency = np.asarray(class_counts.sum(axis=0)).ravel()
+    average_words = words_per_class.mean()
+    idf = np.log1p(average_words / np.maximum(term_frequency, 1))
+
+    tf = class_counts.multiply(1 / np.maximum(words_per_class, 1)[:, None]).tocsr()
+    scores = tf.multiply(idf).tocsr()
+
+    terms = vectorizer.get_feature_names_out()
+    keywords = {}
+    for row, label in enumerate(classes):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        values, columns = scores.data[start:end], scores.indices[start:end]
+        top = np.argsort(-values, kind='stable')[:top_n]
+        keywords[int(label)] = [str(terms[columns[i]]) for i in top]
+    return keywords
+
+
+def provisional_name(keywords):
+    """Временное название кластера из ключевых слов"""
+    return ' '.join(keywords[:3]).capitalize() if keywords else ''
+
+
+def provisional_summary(keywords):
+    return f"Ключевые слова: {', '.join(keywords)}" if keywords else ''
@@ -0,0 +1,58 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+# Минимальное пересечение (Jaccard), при котором новый кластер считается продолжением старого
+MIN_MATCH_OVERLAP = 0.3
+
+
+def membership_overlap(old_ids, new_labels, old_cluster_ids, n_new):
+    """
+    Build the contingency table between previous clusters and new labels.
+
+    Args:
+        old_ids (Sequence[Optional[int]]): current cluster id of every clustered complaint
+        new_labels (np.ndarray): new K-Means label of every clustered complaint
+        old_cluster_ids (List[int]): ids of the previous clusters, in matrix row order
+        n_new (int): number of new labels
+
+    Returns:
+        np.ndarray: (len(old_cluster_ids), n_new) matrix of shared member counts
+    """
+    row_of = {cluster_id: row for row, cluster_id in enumerate(old_cluster_ids)}
+    rows = np.array([row_of.get(cluster_id, -1) for cluster_id in old_ids], dtype=int)
+    known = rows >= 0
+    overlap = np.zeros((len(old_cluster_ids), n_new), dtype=int)
+    np.add.at(overlap, (rows[known], np.asarray(new_labels)[known]), 1)
+    return overlap
+
+
+def match_clusters(old_centroids, new_centroids, overlap, old_sizes, new_sizes,
+                   min_overlap=MIN_MATCH_OVERLAP):
+    """
+    Match new clusters to previous ones with a Hungarian assignment.
+
+    The cost combines the normalised centroid distance and the Jaccard distance
+    of the memberships. Pairs whose Jaccard similarity is below ``min_overlap``
+    are not considered the same cluster.
+
+    Returns:
+        Dict[int, Tuple[int, float]]: new label -> (row of the matched old cluster, Jaccard similarity)
+    """
+    if len(old_centroids) == 0 or len(new_centroids) == 0:
+        return {}
+
+    old_centroids = np.asarray(old_centroids, dtype=float)
+    new_centroids = np.asarray(new_centroids, dtype=float)
+    distances = np.linalg.norm(old_centroids[:, None, :] - new_centroids[None, :, :], axis=2)
+    if distances.max() > 0:
+        distances = distances / distances.max()
+
+    union = np.asarray(old_sizes)[:, None] + np.asarray(new_sizes)[None, :] - overlap
+    jaccard = np.divide(overlap, union, out=np.zeros(overlap.shape, dtype=float), where=union > 0)
+
+    rows, cols = linear_sum_assignment(distances + (1 - jaccard))
+    return {
+        int(col): (int(row), float(jaccard[row, col]))
+        for row, col in zip(rows, cols)
+        if jaccard[row, col] >= min_overlap
+    }
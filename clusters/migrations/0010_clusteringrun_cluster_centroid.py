@@ -0,0 +1,36 @@
+# Generated by Django 4.2.17 on 2026-10-19 16:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0001_initial'),
+        ('clusters', '0009_alter_cluster_project'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cluster',
+            name='centroid',
+            field=models.JSONField(default=None, null=True),
+        ),
+        migrations.CreateModel(
+            name='ClusteringRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('n_complaints', models.IntegerField(default=0)),
+                ('n_clusters', models.IntegerField(default=0)),
+                ('max_complaint_id', models.BigIntegerField(default=0)),
+                ('scaler_mean', models.JSONField(default=list)),
+                ('scaler_scale', models.JSONField(default=list)),
+                ('mean_distance', models.FloatField(default=0.0)),
+                ('distance_p95', models.FloatField(default=0.0)),
+                ('size_skew', models.FloatField(default=0.0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='projects.project')),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.17 on 2026-10-19 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clusters', '0010_clusteringrun_cluster_centroid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cluster',
+            name='summary_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='cluster',
+            name='summary_signature',
+            field=models.JSONField(default=None, null=True),
+        ),
+        migrations.CreateModel(
+            name='SummaryCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('model', models.CharField(max_length=50)),
+                ('name', models.CharField(max_length=100)),
+                ('summary', models.TextField()),
+                ('model_name', models.CharField(default='No model', max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('fingerprint', 'model')},
+            },
+        ),
+    ]
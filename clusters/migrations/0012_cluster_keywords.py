@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-19 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clusters', '0011_summarycache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cluster',
+            name='keywords',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-19 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clusters', '0012_cluster_keywords'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clusteringrun',
+            name='embedding_version',
+            field=models.PositiveIntegerField(default=None, null=True),
+        ),
+    ]
@@ -1,8 +1,28 @@
 from django.db import models
 from gigachat.exceptions import GigaChatException
-from .mymodels import call_gigachat, call_openrouter
+from .mymodels import (
+    call_gigachat, call_openrouter, call_openrouter_batch, parse_output, max_summary_workers,
+    truncate_words, NAME_MAX_WORDS, SUMMARY_MAX_WORDS
+)
+from .router import router, DEFAULT_LATENCY_BUDGET
+from .resilience import retry_budget
+from .representatives import (
+    CANDIDATE_FACTOR, DEFAULT_REPRESENTATIVES, DEFAULT_TOKEN_BUDGET, estimate_tokens,
+    mean_embedding, nearest_to_centroid, mmr_select, pack_prompt
+)
+from .fingerprint import (
+    DEFAULT_SUMMARY_CHANGE_THRESHOLD, membership_fingerprint, minhash_signature, membership_change
+)
 from projects.models import Project
-import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Ограничения пакетной суммаризации нескольких кластеров одним запросом
+BATCH_TOKEN_BUDGET = 6000
+BATCH_MAX_CLUSTERS = 10
 
 
 class Cluster(models.Model):
@@ -15,70 +35,334 @@ class Cluster(models.Model):
         default=1,
         on_delete=models.SET_DEFAULT)
     size = models.IntegerField(default=0)
+    # Центроид в пространстве StandardScaler последнего запуска clusterising
+    centroid = models.JSONField(default=None, null=True)
+    # Состав кластера на момент генерации текущего описания
+    summary_fingerprint = models.CharField(max_length=64, blank=True, default='')
+    summary_signature = models.JSONField(default=None, null=True)
+    # Характерные слова кластера по c-TF-IDF, считаются локально без LLM
+    keywords = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def raw_centroid(self):
+        """Центроид в исходном пространстве эмбеддингов, если он известен"""
+        if not self.centroid:
+            return None
+        run = ClusteringRun.objects.filter(project_id=self.project_id).order_by('-created_at', '-id').first()
+        if run is None or len(run.scaler_mean) != len(self.centroid):
+            return None
+        return np.array(self.centroid) * np.array(run.scaler_scale) + np.array(run.scaler_mean)
+
+    def representative_ids(self, k=DEFAULT_REPRESENTATIVES):
+        """
+        Pick complaints closest to the centroid, diversified with MMR.
+
+        Only ids and embeddings are streamed from the database, so large clusters
+        are never materialised as model instances.
+
+        Returns:
+            List[int]: ids of the representative complaints, in prompt order
+        """
+        # Перемещаем импорт внутрь метода для избежания циклической зависимости
+        from complaints.models import Complaint
+
+        complaints = Complaint.objects.filter(cluster=self).exclude(embedding__isnull=True).order_by('id')
+
+        def rows():
+            return complaints.values_list('id', 'embedding').iterator(chunk_size=2000)
+
+        centroid = self.raw_centroid()
+        if centroid is None:
+            centroid = mean_embedding(rows())
+        if centroid is None:
+            # Эмбеддингов нет: берём первые жалобы кластера
+            return list(Complaint.objects.filter(cluster=self).order_by('id').values_list('id', flat=True)[:k])
+
+        ids, vectors, distances = nearest_to_centroid(rows(), centroid, k * CANDIDATE_FACTOR)
+        return [int(ids[index]) for index in mmr_select(vectors, distances, k)]
+
+    def summary_texts(self, token_budget=DEFAULT_TOKEN_BUDGET):
+        """Представительные жалобы кластера, объединённые в текст для промпта"""
+        # Перемещаем импорт внутрь метода для избежания циклической зависимости
+        from complaints.models import Complaint
+
+        ids = self.representative_ids()
+        if not ids:
+            return None
+        texts = dict(Complaint.objects.filter(id__in=ids).values_list('id', 'text'))
+        prompt = pack_prompt([texts[complaint_id] for complaint_id in ids if complaint_id in texts], token_budget)
+        if self.keywords:
+            # Ключевые слова подсказывают LLM тему всего кластера, а не только выбранных жалоб
+            prompt = f"Ключевые слова кластера: {', '.join(self.keywords)}\n{prompt}"
+        return prompt
+
+    def prepare_summary(self, model, force=False, max_change=DEFAULT_SUMMARY_CHANGE_THRESHOLD):
+        """
+        Decide whether the cluster needs a new LLM summary.
+
+        Summaries are cached by a fingerprint of the membership and the model, so a
+        previously seen membership is restored without calling the LLM.
+
+        Args:
+            model (str): model to generate the summary with
+            force (bool): regenerate even if the membership did not change
+            max_change (float): share of changed members tolerated without regeneration
+
+        Returns:
+            Optional[dict]: summary job with the prompt text, or None if no LLM call is needed
+        """
+        from complaints.models import Complaint
+
+        complaint_ids = list(Complaint.objects.filter(cluster=self).values_list('id', flat=True))
+        fingerprint = membership_fingerprint(complaint_ids, model)
+        signature = minhash_signature(complaint_ids)
+
+        if not force:
+            if fingerprint == self.summary_fingerprint:
+                return None
+            cached = SummaryCache.objects.filter(fingerprint=fingerprint, model=model).first()
+            if cached:
+                self.name = cached.name
+                self.summary = cached.summary
+                self.model = cached.model_name
+                self.summary_fingerprint = fingerprint
+                self.summary_signature = signature
+                self.save()
+                return None
+            if membership_change(self.summary_signature, signature) <= max_change:
+                return None
+
+        return {
+            'model': model,
+            'fingerprint': fingerprint,
+            'signature': signature,
+            'text': self.summary_texts(),
+        }
+
+    def apply_summary(self, job, response):
+        """
+        Store an LLM response produced for a summary job.
+
+        Raises:
+            ValueError: if the LLM returned an invalid result
+        """
+        if not isinstance(response, tuple):
+            raise ValueError(f"Invalid response from generate_summary: {response}")
+
+        self.name, self.summary = response[0], response[1]
+        if len(response) > 2:
+            self.model = response[2]
+        self.summary_fingerprint = job['fingerprint']
+        self.summary_signature = job['signature']
+        self.save()
+        SummaryCache.objects.update_or_create(
+            fingerprint=job['fingerprint'],
+            model=job['model'],
+            defaults={'name': self.name, 'summary': self.summary, 'model_name': self.model},
+        )
+
+    def refresh_summary(self, model, force=False, max_change=DEFAULT_SUMMARY_CHANGE_THRESHOLD,
+                        budget=DEFAULT_LATENCY_BUDGET):
+        """
+        Update name and summary only when the cluster membership really changed.
+
+        Returns:
+            bool: True if the LLM was called
+
+        Raises:
+            ValueError: if the LLM returned an invalid result
+        """
+        job = self.prepare_summary(model, force=force, max_change=max_change)
+        if job is None:
+            return False
+        self.apply_summary(job, summarize_text(job['text'], model, budget=budget))
+        return True
+
     def generate_summary(self, model):
-        try:
-            # Перемещаем импорт внутрь метода для избежания циклической зависимости
-            from complaints.models import Complaint
-
-            complaints = Complaint.objects.filter(cluster=self)
-            if not complaints.exists():
-                return "Нет жалоб для анализа"
-            amount = random.randint(10, 20)
-            complaints_list = list(complaints)
-            complaints_for_summary = random.sample(complaints_list, min(amount, len(complaints_list)))
-            complaints_texts = [f"Жалоба {i + 1}: {c.text}" for i, c in enumerate(complaints_for_summary)]
-
-            combined_text = "\n".join(complaints_texts)
-            name = "unable to generate name for cluster"
-            summary = "unable to generate summary for cluster. this value is generated by author for testint purposes. the length is at least 20 words. now 100 percent more"
-
-            if model == "GigaChat":
-                prompt_title = f"""Проанализируй следующие жалобы и создай название на русском языке, 
-                        обобщающее основные проблемы и тенденции. Не пиши "Обобщенное название:", "Список обобщенных проблем:" и т.д. ВАЖНО: Суммарная длина ответа должна быть строго 2-3 слова:
-
-                        {combined_text}
-                        """
-                prompt_summary = f"""Проанализируй следующие жалобы и создай краткое обобщение на русском языке, содержазее одно предложение. 
-                        ВАЖНО: Суммарная длина ответа должна быть строго 10-20 слов:
-
-                        {combined_text}
-                        """
-                counter = 0
-                while len(name.split(' ')) > 5:
-                    name = call_gigachat(prompt_title)
-                    counter+=1
-                    if counter > 5:
-                        break
-                counter = 0
-                while len(summary.split(' ')) > 25:
-                    summary = call_gigachat(prompt_summary)
-                    counter+=1
-                    if counter > 5:
-                        break
-                if name==None or summary==None:
-                    prompt = f"""Analyse the following complaints and create a brief summary, 
-                                highlighting the main problems and trends. Summary should containt 10-20 words:
-
-                                {combined_text}
-                                """
-                    response = call_openrouter(prompt)
-                    return response
-                return (name, summary)
-            else:
-                prompt = f"""Analyse the following complaints and create a brief summary, 
-                        highlighting the main problems and trends. Summary should containt 10-20 words:
-
-                        {combined_text}
-                        """
-                response = call_openrouter(prompt)
-            return response
-
-        except GigaChatException as e:
-            print(f"Ошибка GigaChat: {str(e)}")
-            return "Не удалось сгенерировать описание"
-        except Exception as e:
-            print(f"Общая ошибка: {str(e)}")
-            return "Ошибка генерации описания"
\ No newline at end of file
+        return summarize_text(self.summary_texts(), model)
+
+
+def _summarize_gigachat(combined_text):
+    prompt = f"""Проанализируй следующие жалобы и верни только JSON-объект вида
+            {{"name": "...", "summary": "..."}} без пояснений.
+            name — название на русском языке, обобщающее основные проблемы, строго 2-3 слова.
+            summary — краткое обобщение на русском языке в одно предложение, строго 10-20 слов.
+
+            {combined_text}
+            """
+    # Один структурированный запрос; ещё одна попытка только если JSON не разобран
+    # и глобальный бюджет повторов это позволяет
+    for attempt in range(2):
+        if attempt and not retry_budget.try_retry():
+            break
+        output = parse_output(call_gigachat(prompt))
+        if output is not None:
+            return (output.name, output.summary, "GigaChat")
+    return None
+
+
+def _summarize_openrouter(combined_text):
+    prompt = f"""Analyse the following complaints and create a brief summary, 
+            highlighting the main problems and trends. Summary should containt 10-20 words:
+
+            {combined_text}
+            """
+    return call_openrouter(prompt)
+
+
+def summarize_text(combined_text, model, budget=DEFAULT_LATENCY_BUDGET):
+    """
+    Генерирует название и описание кластера по тексту выбранных жалоб.
+
+    Выбранная модель опрашивается первой; если она не ответила за обычное для
+    неё время (p90) или вернула ошибку, запрос дублируется другому провайдеру.
+    """
+    try:
+        if combined_text is None:
+            return "Нет жалоб для анализа"
+        providers = [
+            ("GigaChat", lambda: _summarize_gigachat(combined_text)),
+            ("OpenRouter", lambda: _summarize_openrouter(combined_text)),
+        ]
+        if model != "GigaChat":
+            providers.reverse()
+        return router.call(providers, budget=budget)
+
+    except GigaChatException as e:
+        print(f"Ошибка GigaChat: {str(e)}")
+        return "Не удалось сгенерировать описание"
+    except Exception as e:
+        print(f"Общая ошибка: {str(e)}")
+        return "Ошибка генерации описания"
+
+
+def _summarize_group(group):
+    """Один запрос к OpenRouter для группы кластеров; номера кластеров — позиции в группе"""
+    sections = "\n\n".join(
+        f"Кластер {number}:\n{job['text']}" for number, (_, job) in enumerate(group, start=1))
+    prompt = f"""Analyse the complaints of each cluster below separately. For every cluster return
+            its cluster_id (the cluster number), a name of 2-3 words describing the main problem
+            and a brief summary of 10-20 words highlighting the main problems and trends:
+
+            {sections}
+            """
+    try:
+        response = call_openrouter_batch(prompt, len(group))
+    except Exception as e:
+        logger.warning(f"Batched summarization of {len(group)} clusters failed: {str(e)}")
+        return {}
+    if not response:
+        return {}
+    outputs, model_name = response
+    results = {}
+    for output in outputs:
+        if 1 <= output.cluster_id <= len(group) and output.name and output.summary:
+            key = group[output.cluster_id - 1][0]
+            results[key] = (
+                truncate_words(output.name, NAME_MAX_WORDS),
+                truncate_words(output.summary, SUMMARY_MAX_WORDS),
+                model_name,
+            )
+    return results
+
+
+def summarize_batched(jobs, token_budget=BATCH_TOKEN_BUDGET, max_clusters=BATCH_MAX_CLUSTERS):
+    """
+    Summarize many clusters with few LLM round trips.
+
+    Jobs are packed into groups that fit the prompt token budget, each group is
+    summarized in one structured OpenRouter request, and clusters the model
+    missed fall back to individual calls. Only jobs for the OpenRouter model
+    are batched; the rest are summarized individually by their own model.
+
+    Args:
+        jobs (Dict[Any, dict]): summary jobs from Cluster.prepare_summary keyed by any id
+
+    Returns:
+        Dict[Any, Union[tuple, str, Exception]]: LLM response (or error) for every job key
+    """
+    groups, group, used = [], [], 0
+    for key, job in jobs.items():
+        # Ответ пакетного запроса сохраняется под моделью задачи, поэтому пакетом идут только задачи OpenRouter
+        if job['text'] is None or job['model'] != "OpenRouter":
+            continue
+        cost = estimate_tokens(job['text'])
+        if group and (used + cost > token_budget or len(group) >= max_clusters):
+            groups.append(group)
+            group, used = [], 0
+        group.append((key, job))
+        used += cost
+    if group:
+        groups.append(group)
+
+    results = {}
+    if groups:
+        with ThreadPoolExecutor(max_workers=min(len(groups), max_summary_workers())) as executor:
+            for group_results in executor.map(_summarize_group, groups):
+                results.update(group_results)
+
+    missing = {key: job for key, job in jobs.items() if key not in results}
+    if missing:
+        logger.info(f"Batched summarization missed {len(missing)} clusters, summarizing them one by one")
+        results.update(summarize_concurrently(missing))
+    return results
+
+
+def summarize_concurrently(jobs):
+    """
+    Run summary jobs in parallel, bounded by the per-provider limits.
+
+    A failing job yields its error instead of a result, so one slow or broken
+    cluster does not stall the others.
+
+    Args:
+        jobs (Dict[Any, dict]): summary jobs from Cluster.prepare_summary keyed by any id
+
+    Returns:
+        Dict[Any, Union[tuple, str, Exception]]: LLM response (or error) for every job key
+    """
+    if not jobs:
+        return {}
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(len(jobs), max_summary_workers())) as executor:
+        futures = {
+            executor.submit(summarize_text, job['text'], job['model']): key
+            for key, job in jobs.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = e
+    return results
+
+
+class SummaryCache(models.Model):
+    """LLM name and summary generated for a particular cluster membership."""
+    fingerprint = models.CharField(max_length=64)
+    model = models.CharField(max_length=50)
+    name = models.CharField(max_length=100)
+    summary = models.TextField()
+    model_name = models.CharField(max_length=50, default='No model')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('fingerprint', 'model')
+
+
+class ClusteringRun(models.Model):
+    """Baseline statistics of a full clusterising run, used for drift monitoring."""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    n_complaints = models.IntegerField(default=0)
+    n_clusters = models.IntegerField(default=0)
+    max_complaint_id = models.BigIntegerField(default=0)
+    # Версия эмбеддингов проекта, на которых построен запуск (None у запусков до её учёта)
+    embedding_version = models.PositiveIntegerField(null=True, default=None)
+    scaler_mean = models.JSONField(default=list)
+    scaler_scale = models.JSONField(default=list)
+    mean_distance = models.FloatField(default=0.0)
+    distance_p95 = models.FloatField(default=0.0)
+    size_skew = models.FloatField(default=0.0)
+    created_at = models.DateTimeField(auto_now_add=True)
@@ -1,36 +1,133 @@
-from gigachat import GigaChat
 from gigachat.models import Chat, Messages, MessagesRole
 from instructor.exceptions import InstructorRetryException
 
-from clusters.instances import openrouter_token, gigachat_token
-from openai import OpenAI
+from clusters.clients import get_gigachat_client, get_openrouter_client
+from clusters.resilience import get_breaker, retry_budget
+from clusters.router import mark_call_started
 from pydantic import BaseModel, Field
-import instructor
+from typing import List
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+# Ограничения на параллельные запросы к провайдерам LLM
+PROVIDER_LIMITS = {
+    'GigaChat': {'concurrency': 2, 'min_interval': 0.5},
+    'OpenRouter': {'concurrency': 4, 'min_interval': 0.1},
+}
+_provider_semaphores = {
+    provider: threading.BoundedSemaphore(limits['concurrency'])
+    for provider, limits in PROVIDER_LIMITS.items()
+}
+_provider_last_call = {provider: 0.0 for provider in PROVIDER_LIMITS}
+_provider_lock = threading.Lock()
+
+
+def max_summary_workers():
+    """Размер пула потоков, достаточный для одновременной загрузки всех провайдеров"""
+    return sum(limits['concurrency'] for limits in PROVIDER_LIMITS.values())
+
+
+@contextmanager
+def provider_slot(provider):
+    """
+    Hold one of the provider's concurrency slots and respect its minimal
+    interval between request starts.
+    """
+    with _provider_semaphores[provider]:
+        with _provider_lock:
+            now = time.monotonic()
+            start = max(now, _provider_last_call[provider] + PROVIDER_LIMITS[provider]['min_interval'])
+            _provider_last_call[provider] = start
+        if start > now:
+            time.sleep(start - now)
+        mark_call_started()
+        yield
+
+# Ограничения длины названия и описания кластера в словах
+NAME_MAX_WORDS = 3
+SUMMARY_MAX_WORDS = 20
+
 
 class OutputFormat(BaseModel):
     name: str = Field(description="Name of the cluster, that describes the main problem, containing 2-3 words", default='Не удалось сгенерировать название')
     summary: str = Field(description="Summary of the complaints, containing 10-20 words", default='Не удалось сгенерировать описание')
 
+
+def truncate_words(text, max_words):
+    words = str(text).split()
+    return ' '.join(words[:max_words])
+
+
+def parse_output(content):
+    """
+    Parse a JSON ``{name, summary}`` answer and repair it locally.
+
+    Markdown fences and text around the JSON object are ignored, and fields that
+    are too long are truncated instead of re-prompting the model.
+
+    Args:
+        content (str): raw model answer
+
+    Returns:
+        Optional[OutputFormat]: parsed output, or None if no valid JSON object was found
+    """
+    if not content:
+        return None
+    start, end = content.find('{'), content.rfind('}')
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(content[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict) or not data.get('name') or not data.get('summary'):
+        return None
+    return OutputFormat(
+        name=truncate_words(data['name'], NAME_MAX_WORDS).strip(' .'),
+        summary=truncate_words(data['summary'], SUMMARY_MAX_WORDS),
+    )
+
+class ClusterOutput(OutputFormat):
+    cluster_id: int = Field(description="Number of the cluster exactly as given in the prompt")
+
+
+class BatchOutputFormat(BaseModel):
+    clusters: List[ClusterOutput] = Field(description="Name and summary for every cluster in the prompt", default_factory=list)
+
+
+def _openrouter_completion(prompt, response_model, max_tokens):
+    client = get_openrouter_client()
+    # instructor сам не повторяет запрос: каждая попытка проходит через автомат
+    # и слот провайдера, а повтор после неразобранного ответа — через общий бюджет
+    for attempt in range(2):
+        if attempt and not retry_budget.try_retry():
+            raise error
+        try:
+            with get_breaker('OpenRouter').guard(), provider_slot('OpenRouter'):
+                return client.chat.completions.create(
+                    model = "qwen/qwen-plus",
+                    extra_body={"models": ["deepseek/deepseek-chat-v3-0324", "qwen/qwen-max"], "provider": {"require_parameters": True}},
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    response_model=response_model,
+                    temperature=0,
+                    max_retries=1,
+                    max_tokens=max_tokens
+                )
+        except InstructorRetryException as e:
+            error = e
+    raise error
+
+
 def call_openrouter(prompt):
     try:
-        client = instructor.from_openai(OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=openrouter_token,
-        ), mode=instructor.Mode.TOOLS)
-        completion = client.chat.completions.create(
-            model = "qwen/qwen-plus",
-            extra_body={"models": ["deepseek/deepseek-chat-v3-0324", "qwen/qwen-max"], "provider": {"require_parameters": True}},
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            response_model=OutputFormat,
-            temperature=0,
-            max_retries=3,
-            max_tokens=500
-        )
+        completion = _openrouter_completion(prompt, OutputFormat, max_tokens=500)
         # Ensure we have valid name and summary
         name = completion.name if completion.name else 'Unnamed Cluster'
         summary = completion.summary if completion.summary else 'No summary available'
@@ -40,6 +137,20 @@ def call_openrouter(prompt):
     except InstructorRetryException as e:
         print(e.last_completion)
 
+
+def call_openrouter_batch(prompt, n_clusters):
+    """
+    Summarize several clusters in one structured request.
+
+    Returns:
+        Optional[Tuple[List[ClusterOutput], str]]: outputs of the clusters the model answered for and the model name
+    """
+    try:
+        completion = _openrouter_completion(prompt, BatchOutputFormat, max_tokens=120 * n_clusters + 200)
+        return completion.clusters, completion._raw_response.model
+    except InstructorRetryException as e:
+        print(e.last_completion)
+
 def call_gigachat(prompt):
     payload = Chat(
         messages=[
@@ -50,7 +161,7 @@ def call_gigachat(prompt):
         ],
         temperature=0
     )
-    with GigaChat(credentials=gigachat_token, verify_ssl_certs=False) as giga:
-        response = giga.chat(payload)
+    with get_breaker('GigaChat').guard(), provider_slot('GigaChat'):
+        response = get_gigachat_client().chat(payload)
     result = response.choices[0].message.content
     return result     
@@ -0,0 +1,114 @@
+import numpy as np
+
+# Количество жалоб, которые попадают в промпт для суммаризации
+DEFAULT_REPRESENTATIVES = 15
+# Сколько ближайших к центроиду жалоб рассматривается для MMR-отбора
+CANDIDATE_FACTOR = 4
+# Ограничение размера промпта и одной жалобы в токенах
+DEFAULT_TOKEN_BUDGET = 3000
+MAX_TOKENS_PER_COMPLAINT = 300
+# Баланс между близостью к центроиду и разнообразием в MMR
+MMR_LAMBDA = 0.7
+
+
+def estimate_tokens(text):
+    """Грубая оценка числа токенов (около трёх символов на токен для кириллицы)"""
+    return len(text) // 3 + 1
+
+
+def _chunks(rows, chunk_size):
+    ids, vectors = [], []
+    for complaint_id, embedding in rows:
+        if not isinstance(embedding, list) or not embedding:
+            continue
+        ids.append(complaint_id)
+        vectors.append(embedding)
+        if len(ids) >= chunk_size:
+            yield np.array(ids), np.array(vectors, dtype=np.float32)
+            ids, vectors = [], []
+    if ids:
+        yield np.array(ids), np.array(vectors, dtype=np.float32)
+
+
+def mean_embedding(rows, chunk_size=2000):
+    """Потоковое вычисление среднего эмбеддинга без загрузки всех строк в память"""
+    total, count = None, 0
+    for _, vectors in _chunks(rows, chunk_size):
+        chunk_sum = vectors.sum(axis=0, dtype=np.float64)
+        total = chunk_sum if total is None else total + chunk_sum
+        count += len(vectors)
+    return None if count == 0 else total / count
+
+
+def nearest_to_centroid(rows, centroid, n_candidates, chunk_size=2000):
+    """
+    Stream (id, embedding) rows and keep the ``n_candidates`` closest to the centroid.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: ids, embeddings and distances sorted by distance
+    """
+    centroid = np.asarray(centroid, dtype=np.float32)
+    best_ids = np.empty(0, dtype=np.int64)
+    best_vectors = np.empty((0, len(centroid)), dtype=np.float32)
+    best_distances = np.empty(0, dtype=np.float32)
+
+    for ids, vectors in _chunks(rows, chunk_size):
+        if vectors.shape[1] != len(centroid):
+            continue
+        distances = np.linalg.norm(vectors - centroid, axis=1)
+        best_ids = np.concatenate([best_ids, ids])
+        best_vectors = np.concatenate([best_vectors, vectors])
+        best_distances = np.concatenate([best_distances, distances])
+        if len(best_ids) > n_candidates:
+            keep = np.argpartition(best_distances, n_candidates)[:n_candidates]
+            best_ids, best_vectors, best_distances = best_ids[keep], best_vectors[keep], best_distances[keep]
+
+    # Стабильная сортировка по расстоянию, затем по id — промпт детерминирован
+    order = np.lexsort((best_ids, best_distances))
+    return best_ids[order], best_vectors[order], best_distances[order]
+
+
+def mmr_select(vectors, distances, k, mmr_lambda=MMR_LAMBDA):
+    """
+    Maximal marginal relevance selection: close to the centroid, but not redundant.
+
+    Args:
+        vectors (np.ndarray): candidate embeddings sorted by distance
+        distances (np.ndarray): candidate distances to the centroid
+        k (int): number of items to select
+
+    Returns:
+        List[int]: indices of the selected candidates
+    """
+    if len(vectors) <= k:
+        return list(range(len(vectors)))
+    normed = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    span = distances.max() - distances.min()
+    relevance = 1 - (distances - distances.min()) / span if span > 0 else np.ones(len(distances))
+
+    selected = [0]
+    max_similarity = normed @ normed[0]
+    for _ in range(k - 1):
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity
+        scores[selected] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        max_similarity = np.maximum(max_similarity, normed @ normed[chosen])
+    return selected
+
+
+def pack_prompt(texts, token_budget=DEFAULT_TOKEN_BUDGET, per_text_tokens=MAX_TOKENS_PER_COMPLAINT):
+    """Собирает нумерованный список жалоб, укладываясь в бюджет токенов"""
+    lines = []
+    used = 0
+    for text in texts:
+        text = ' '.join(str(text).split())
+        if estimate_tokens(text) > per_text_tokens:
+            text = text[:per_text_tokens * 3].rsplit(' ', 1)[0] + '…'
+        line = f"Жалоба {len(lines) + 1}: {text}"
+        cost = estimate_tokens(line)
+        if lines and used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
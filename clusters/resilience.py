@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker for one provider.
+
+    The breaker opens when at least ``failure_rate`` of the last ``window``
+    calls failed (and at least ``min_calls`` were made). After ``open_seconds``
+    it lets ``half_open_calls`` probe calls through; a successful probe closes
+    the circuit, a failed one opens it again.
+    """
+
+    def __init__(self, name, failure_rate=0.5, window=20, min_calls=5, open_seconds=30,
+                 half_open_calls=1, clock=time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+        self.state = CLOSED
+        self._results = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Возвращает True, если вызов провайдера разрешён"""
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+                logger.info(f"Circuit {self.name} is half-open")
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, success):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if success:
+                    self.state = CLOSED
+                    self._results.clear()
+                    logger.info(f"Circuit {self.name} closed")
+                else:
+                    self._open()
+                return
+            self._results.append(success)
+            failures = self._results.count(False)
+            if len(self._results) >= self.min_calls and failures / len(self._results) >= self.failure_rate:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = self.clock()
+        self._results.clear()
+        logger.warning(f"Circuit {self.name} opened")
+
+    @contextmanager
+    def guard(self):
+        """
+        Wrap one provider call: fail fast while the circuit is open and record
+        the outcome otherwise.
+
+        Raises:
+            CircuitOpenError: if the circuit does not allow the call
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable (circuit open)")
+        retry_budget.record_request()
+        try:
+            yield
+        except Exception:
+            self.record(False)
+            raise
+        self.record(True)
+
+
+class RetryBudget:
+    """
+    Global retry budget: every request deposits ``ratio`` tokens and every
+    retry withdraws one, so retries cannot exceed that share of traffic.
+    ``min_tokens`` keeps a small reserve for low-traffic periods.
+    """
+
+    def __init__(self, ratio=0.1, min_tokens=10, max_tokens=100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_retry(self):
+        """Списывает токен на повторный запрос; False, если бюджет исчерпан"""
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            logger.warning("Retry budget exhausted")
+            return False
+
+
+retry_budget = RetryBudget()
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider):
+    """Общий для процесса автомат для провайдера"""
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+        return _breakers[provider]
@@ -0,0 +1,167 @@
+import bisect
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from clusters.resilience import retry_budget
+
+logger = logging.getLogger(__name__)
+
+# Квантиль задержки основного провайдера, после которого отправляется дублирующий запрос
+HEDGE_QUANTILE = 0.9
+# Задержка до дублирующего запроса, пока для провайдера мало наблюдений
+DEFAULT_HEDGE_DELAY = 8.0
+MIN_SAMPLES = 5
+# Общий бюджет времени на один вызов по умолчанию
+DEFAULT_LATENCY_BUDGET = 60.0
+# Бюджет для запросов, которые пользователь ждёт в интерфейсе
+INTERACTIVE_LATENCY_BUDGET = 20.0
+
+# Границы корзин гистограммы в секундах (примерно логарифмическая шкала)
+BUCKETS = [0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90, 120]
+
+
+# Момент, когда вызов в текущем потоке получил слот провайдера (см. mark_call_started)
+_call_timing = threading.local()
+
+
+def mark_call_started():
+    """
+    Mark the moment the provider request actually starts in this thread.
+
+    Called once the provider's concurrency slot is acquired, so the recorded
+    latency excludes the wait for the slot.
+    """
+    _call_timing.started = time.monotonic()
+
+
+class LatencyHistogram:
+    """Thread-safe fixed-bucket latency histogram of one provider."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, success=True):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.total += 1
+            if not success:
+                self.failures += 1
+
+    def quantile(self, q):
+        """Верхняя граница корзины, в которую попадает квантиль q"""
+        with self._lock:
+            if not self.total:
+                return None
+            threshold = q * self.total
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= threshold:
+                    return self.buckets[index] if index < len(self.buckets) else self.buckets[-1] * 2
+        return None
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, failures = self.total, self.failures
+        return {
+            'total': total,
+            'failures': failures,
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['inf'], counts)),
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+        }
+
+
+class ProviderRouter:
+    """
+    Calls a primary provider and hedges to a secondary one when the primary
+    is slower than its usual p90 latency or fails. The first valid answer wins.
+    """
+
+    def __init__(self, max_workers=8):
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-router')
+
+    def histogram(self, provider):
+        with self._lock:
+            return self.histograms.setdefault(provider, LatencyHistogram())
+
+    def hedge_delay(self, provider):
+        histogram = self.histogram(provider)
+        if histogram.total < MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return histogram.quantile(HEDGE_QUANTILE)
+
+    def _timed(self, provider, call):
+        # Отсчёт начинается в рабочем потоке, а не при постановке в очередь пула,
+        # и переносится на момент получения слота провайдера, если вызов его ждал
+        _call_timing.started = time.monotonic()
+        try:
+            result = call()
+        except Exception as e:
+            logger.warning(f"Provider {provider} failed: {str(e)}")
+            result = None
+        self.histogram(provider).observe(time.monotonic() - _call_timing.started, success=result is not None)
+        return result
+
+    def call(self, calls, budget=DEFAULT_LATENCY_BUDGET, is_valid=lambda result: result is not None):
+        """
+        Run provider calls in order of preference with hedging.
+
+        Args:
+            calls (List[Tuple[str, Callable[[], Any]]]): (provider, call) pairs, primary first
+            budget (float): total latency budget in seconds
+            is_valid (Callable[[Any], bool]): whether a provider answer can be used
+
+        Returns:
+            Any: first valid answer, or None if no provider answered within the budget
+        """
+        deadline = time.monotonic() + budget
+        pending = {}
+        remaining = list(calls)
+
+        def launch():
+            provider, call = remaining.pop(0)
+            pending[self._executor.submit(self._timed, provider, call)] = provider
+            return provider
+
+        provider = launch()
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            timeout = deadline - now
+            if remaining:
+                timeout = min(timeout, self.hedge_delay(provider))
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished = pending.pop(future)
+                result = future.result()
+                if is_valid(result):
+                    return result
+                logger.info(f"Provider {finished} returned no valid answer")
+            if remaining and not pending and done:
+                # Основной провайдер ответил ошибкой (или его автомат разомкнут): переключаемся
+                provider = launch()
+                logger.info(f"Falling back to {provider}")
+            elif remaining and not done and retry_budget.try_retry():
+                # Основной провайдер медлит: отправляем дублирующий запрос, если позволяет бюджет
+                provider = launch()
+                logger.info(f"Hedging request to {provider}")
+        return None
+
+    def stats(self):
+        with self._lock:
+            providers = list(self.histograms)
+        return {provider: self.histogram(provider).snapshot() for provider in providers}
+
+
+router = ProviderRouter()
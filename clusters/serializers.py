@@ -1,8 +1,10 @@
 from rest_framework import serializers
 from .models import Cluster
-from complaints.serializers import ProjectValidatorSerializer
+from complaints.serializers import ProjectValidatorSerializer, FieldProjectionMixin
+
+class ClusterSerializer(FieldProjectionMixin, ProjectValidatorSerializer):
+    default_excluded = ('centroid', 'summary_signature')
 
-class ClusterSerializer(ProjectValidatorSerializer):
     class Meta:
         model = Cluster
         fields = '__all__'
\ No newline at end of file
@@ -2,11 +2,26 @@ from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Cluster
+from django.core.management import call_command
+import numpy as np
+from .models import Cluster, ClusteringRun, SummaryCache, summarize_batched
+from .drift import assignment_distances, measure_drift, exceeded_thresholds
+from .matching import membership_overlap, match_clusters
+from .mymodels import parse_output, ClusterOutput, call_openrouter
+from .clients import ClientRegistry, PooledGigaChat
+from .router import ProviderRouter, LatencyHistogram, mark_call_started
+from .resilience import CircuitBreaker, CircuitOpenError, RetryBudget
+from .representatives import mmr_select, pack_prompt
+from .keywords import class_tfidf_keywords, provisional_name
+from gigachat.models import AccessToken
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
 from complaints.models import Complaint
 from projects.models import Project
 from unittest.mock import patch, MagicMock
 from gigachat.exceptions import GigaChatException
+from instructor.exceptions import InstructorRetryException
 
 
 class ClustersAPITests(TestCase):
@@ -81,6 +96,38 @@ class ClustersAPITests(TestCase):
         complaints = response.data['complaints']
         self.assertEqual(complaints[0]['name'], "Test Complaint 1")
         self.assertEqual(complaints[1]['name'], "Test Complaint 2")
+        self.assertNotIn('embedding', complaints[0])
+        self.assertNotIn('centroid', response.data)
+
+    def test_cluster_detail_etag(self):
+        """Test that cluster details carry an ETag and are revalidated with 304"""
+        url = reverse('cluster-detail', kwargs={
+            'project_id': self.project.id,
+            'cluster_id': self.cluster.id
+        })
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).content, response.content)
+
+        self.cluster.name = "Renamed Cluster"
+        self.cluster.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], "Renamed Cluster")
+
+    def test_cluster_detail_paginates_complaints(self):
+        """Test cursor pagination and field projection of cluster complaints"""
+        url = reverse('cluster-detail', kwargs={
+            'project_id': self.project.id,
+            'cluster_id': self.cluster.id
+        })
+        response = self.client.get(url, {'page_size': 1, 'fields': 'id,name', 'complaint_fields': 'id,text'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data) - {'complaints', 'next', 'previous'}, {'id', 'name'})
+        self.assertEqual(response.data['complaints'], [{'id': self.complaint1.id, 'text': self.complaint1.text}])
+        self.assertIsNotNone(response.data['next'])
 
     def test_create_cluster_with_complaints(self):
         """Test creating a cluster with complaints"""
@@ -108,13 +155,13 @@ class ClustersAPITests(TestCase):
     def test_generate_summary(self, mock_openrouter, mock_gigachat):
         """Test cluster summary generation with mocked LLM API calls"""
         # Setup mock return values
-        mock_gigachat.side_effect = ["Test Cluster Name", "This is a mocked summary for testing purposes"]
+        mock_gigachat.return_value = '{"name": "Test Cluster Name", "summary": "This is a mocked summary for testing purposes"}'
         mock_openrouter.return_value = "OpenRouter summary for testing"
         
         # Test GigaChat model
         result = self.cluster.generate_summary("GigaChat")
-        self.assertEqual(result, ("Test Cluster Name", "This is a mocked summary for testing purposes"))
-        self.assertEqual(mock_gigachat.call_count, 2)  # Called once for name, once for summary
+        self.assertEqual(result, ("Test Cluster Name", "This is a mocked summary for testing purposes", "GigaChat"))
+        self.assertEqual(mock_gigachat.call_count, 1)  # Single structured call for name and summary
         
         # Reset mock
         mock_gigachat.reset_mock()
@@ -125,6 +172,41 @@ class ClustersAPITests(TestCase):
         mock_openrouter.assert_called_once()
         self.assertEqual(mock_gigachat.call_count, 0)
 
+    def test_parse_output_repairs_length(self):
+        """Test that overlong structured output is truncated locally"""
+        output = parse_output(
+            '```json\n{"name": "Очень длинное название для кластера", '
+            '"summary": "' + ' '.join(['слово'] * 30) + '"}\n```'
+        )
+        self.assertEqual(output.name, "Очень длинное название")
+        self.assertEqual(len(output.summary.split()), 20)
+        self.assertIsNone(parse_output("не JSON"))
+
+    @patch('clusters.models.summarize_text')
+    def test_refresh_summary_uses_cache(self, mock_summary):
+        """Test that summaries are regenerated only when membership changes"""
+        mock_summary.return_value = ("Cached Name", "Cached summary", "TestModel")
+
+        self.assertTrue(self.cluster.refresh_summary("OpenRouter"))
+        self.assertFalse(self.cluster.refresh_summary("OpenRouter"))
+        self.assertEqual(mock_summary.call_count, 1)
+        self.assertTrue(SummaryCache.objects.filter(
+            fingerprint=self.cluster.summary_fingerprint, model="OpenRouter").exists())
+
+        # Полное изменение состава требует новой генерации
+        self.complaint1.cluster = None
+        self.complaint1.save()
+        self.assertTrue(self.cluster.refresh_summary("OpenRouter", max_change=0.2))
+
+        # Возврат к прежнему составу берётся из кэша
+        self.complaint1.cluster = self.cluster
+        self.complaint1.save()
+        self.assertFalse(self.cluster.refresh_summary("OpenRouter"))
+        self.assertEqual(mock_summary.call_count, 2)
+
+        self.assertTrue(self.cluster.refresh_summary("OpenRouter", force=True))
+        self.assertEqual(mock_summary.call_count, 3)
+
     # @patch('clusters.models.call_gigachat')
     # def test_generate_summary_errors(self, mock_gigachat):
     #     """Test error handling in cluster summary generation"""
@@ -142,4 +224,373 @@ class ClustersAPITests(TestCase):
     #     with patch('complaints.models.Complaint.objects.filter') as mock_filter:
     #         mock_filter.return_value.exists.return_value = False
     #         result = self.cluster.generate_summary("GigaChat")
-    #         self.assertEqual(result, "Нет жалоб для анализа")
\ No newline at end of file
+    #         self.assertEqual(result, "Нет жалоб для анализа")
+
+class DriftTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create()
+        # Две хорошо разделённые группы точек
+        for i in range(20):
+            offset = 0.0 if i % 2 else 10.0
+            Complaint.objects.create(
+                text=f"Complaint {i}",
+                embedding=[offset + i * 0.01, offset - i * 0.01, offset],
+                project=self.project
+            )
+
+    def run_clusterising(self, **options):
+        with patch('clusters.models.call_openrouter', return_value=("Name", "Summary", "model")):
+            call_command('clusterising', project_id=self.project.id, n_clusters=2, **options)
+
+    def test_measure_drift(self):
+        """Test drift metrics against a recorded baseline"""
+        run = ClusteringRun(n_complaints=100, mean_distance=1.0, distance_p95=2.0, size_skew=1.0)
+        nearest, distances = assignment_distances(
+            np.array([[0.0, 0.0], [0.0, 3.0]]), np.array([[0.0, 0.0], [10.0, 10.0]]))
+        self.assertEqual(nearest.tolist(), [0, 0])
+        report = measure_drift(run, distances, nearest, [50, 50])
+        self.assertAlmostEqual(report['new_fraction'], 0.02)
+        self.assertAlmostEqual(report['far_fraction'], 0.5)
+        self.assertAlmostEqual(report['distance_ratio'], 1.5)
+        self.assertEqual(exceeded_thresholds(report, {}), ['far_fraction', 'distance_ratio'])
+
+    def test_incremental_assignment(self):
+        """Test that small imports are assigned without a full recluster"""
+        self.run_clusterising()
+        self.assertEqual(ClusteringRun.objects.filter(project=self.project).count(), 1)
+        cluster_ids = set(Cluster.objects.filter(project=self.project).values_list('id', flat=True))
+
+        new_complaint = Complaint.objects.create(
+            text="New complaint", embedding=[10.05, 9.95, 10.0], project=self.project)
+        self.run_clusterising(incremental=True)
+
+        new_complaint.refresh_from_db()
+        self.assertIn(new_complaint.cluster_id, cluster_ids)
+        self.assertEqual(ClusteringRun.objects.filter(project=self.project).count(), 1)
+        self.assertEqual(
+            set(Cluster.objects.filter(project=self.project).values_list('id', flat=True)), cluster_ids)
+
+    def test_small_imports_accumulate_towards_recluster(self):
+        """Test that complaints assigned incrementally still count as new for the drift check"""
+        self.run_clusterising()
+        for i in range(3):
+            Complaint.objects.create(
+                text=f"Import {i}", embedding=[10.05, 9.95, 10.0], project=self.project)
+            self.run_clusterising(incremental=True, max_new_fraction=0.1)
+        # Третья порция доводит долю новых жалоб до 3/20 > 0.1
+        self.assertEqual(ClusteringRun.objects.filter(project=self.project).count(), 2)
+
+    def test_first_run_summaries_use_raw_centroids(self):
+        """Test that representatives of a first run are picked around the new unscaled centroids"""
+        raw_centroid = Cluster.raw_centroid
+        centroids = []
+
+        def record(cluster):
+            centroid = raw_centroid(cluster)
+            centroids.append((centroid, cluster.centroid))
+            return centroid
+
+        with patch.object(Cluster, 'raw_centroid', autospec=True, side_effect=record):
+            self.run_clusterising()
+        self.assertEqual(len(centroids), 2)
+        run = ClusteringRun.objects.get(project=self.project)
+        for centroid, scaled in centroids:
+            self.assertIsNotNone(centroid)
+            np.testing.assert_allclose(
+                centroid, np.array(scaled) * run.scaler_scale + run.scaler_mean)
+
+    def test_reembedded_project_is_reclustered(self):
+        """Test that incremental assignment falls back to a full run after the embeddings change"""
+        self.run_clusterising()
+        # Как после reembed: все векторы другой модели и размерности
+        Project.objects.filter(id=self.project.id).update(embedding_version=1)
+        for complaint in Complaint.objects.filter(project=self.project):
+            complaint.embedding = complaint.embedding + [0.0]
+            complaint.embedding_version = 1
+            complaint.save()
+        new_complaint = Complaint.objects.create(
+            text="New complaint", embedding=[10.05, 9.95, 10.0, 0.0], embedding_version=1, project=self.project)
+
+        with self.assertLogs('complaints.management.commands.clusterising', level='WARNING') as logs:
+            self.run_clusterising(incremental=True)
+        self.assertIn("Embeddings changed since the last full run", logs.output[0])
+        self.assertEqual(ClusteringRun.objects.filter(project=self.project).count(), 2)
+        new_complaint.refresh_from_db()
+        self.assertIsNotNone(new_complaint.cluster_id)
+
+        # Запуски без версии эмбеддингов проверяются по размерности векторов
+        ClusteringRun.objects.filter(project=self.project).update(embedding_version=None, scaler_mean=[0.0] * 3)
+        Complaint.objects.create(
+            text="Another complaint", embedding=[10.0, 10.0, 10.0, 0.0], embedding_version=1, project=self.project)
+        with self.assertLogs('complaints.management.commands.clusterising', level='WARNING') as logs:
+            self.run_clusterising(incremental=True)
+        self.assertIn("Skipped 1 complaints whose embedding dimension differs", logs.output[0])
+        self.assertEqual(ClusteringRun.objects.filter(project=self.project).count(), 3)
+
+    def test_cluster_identity_is_stable_between_runs(self):
+        """Test that a rerun keeps matched clusters and their summaries"""
+        self.run_clusterising()
+        first_run = {
+            cluster.id: (cluster.name, cluster.summary)
+            for cluster in Cluster.objects.filter(project=self.project)
+        }
+
+        with patch('clusters.models.summarize_text') as mock_summary:
+            call_command('clusterising', project_id=self.project.id, n_clusters=2)
+            mock_summary.assert_not_called()
+
+        second_run = {
+            cluster.id: (cluster.name, cluster.summary)
+            for cluster in Cluster.objects.filter(project=self.project)
+        }
+        self.assertEqual(first_run, second_run)
+
+    def test_failed_summary_falls_back_to_keywords(self):
+        """Test that one failing cluster does not block the others"""
+        def summarize(text, model):
+            # Кластер с нечётными жалобами завершается ошибкой
+            if "Complaint 1\n" in text + "\n":
+                raise RuntimeError("LLM failure")
+            return ("Name", "Summary", "model")
+
+        with patch('clusters.models.summarize_text', side_effect=summarize):
+            call_command('clusterising', project_id=self.project.id, n_clusters=2)
+
+        names = sorted(Cluster.objects.filter(project=self.project).values_list('name', flat=True))
+        self.assertEqual(len(names), 2)
+        self.assertIn("Name", names)
+        # Без ответа LLM остаётся временное название из ключевых слов
+        self.assertIn("Complaint", names)
+
+    def test_class_tfidf_keywords(self):
+        """Test that c-TF-IDF ranks words specific to each cluster first"""
+        texts = [
+            "Задержка доставки посылки",
+            "Курьер сорвал доставку посылки",
+            "Списали деньги дважды с карты",
+            "Карта заблокирована, деньги не вернули",
+        ]
+        keywords = class_tfidf_keywords(texts, [0, 0, 1, 1], top_n=2)
+        self.assertEqual(keywords[0], ["посылки", "доставки"])
+        self.assertEqual(keywords[1], ["деньги", "вернули"])
+        self.assertEqual(class_tfidf_keywords(["и", "на"], [0, 1]), {0: [], 1: []})
+        self.assertEqual(provisional_name(keywords[1]), "Деньги вернули")
+
+    def test_match_clusters(self):
+        """Test Hungarian matching on centroid distance and member overlap"""
+        overlap = membership_overlap([1, 1, 2, 2, None], np.array([1, 1, 0, 0, 0]), [1, 2], 2)
+        self.assertEqual(overlap.tolist(), [[0, 2], [2, 0]])
+        matches = match_clusters(
+            [[0.0], [5.0]], [[5.0], [0.0]], overlap, overlap.sum(axis=1), [3, 2])
+        self.assertEqual(sorted(matches), [0, 1])
+        self.assertEqual(matches[1][0], 0)
+        self.assertEqual(matches[0][0], 1)
+
+
+class ClientRegistryTests(TestCase):
+    def test_registry_shares_clients_between_threads(self):
+        """Test that the registry creates a client only once"""
+        registry = ClientRegistry()
+        factory = MagicMock(side_effect=lambda: object())
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            clients = list(executor.map(lambda _: registry.get('client', factory), range(32)))
+        self.assertEqual(factory.call_count, 1)
+        self.assertTrue(all(client is clients[0] for client in clients))
+
+    def test_token_refreshed_before_expiry(self):
+        """Test that the pooled GigaChat client refreshes tokens ahead of expiry"""
+        client = PooledGigaChat(credentials="test", verify_ssl_certs=False)
+        fresh = AccessToken(access_token="fresh", expires_at=int((time.time() + 3600) * 1000))
+        expiring = AccessToken(access_token="old", expires_at=int((time.time() + 10) * 1000))
+
+        with patch('gigachat.client.GigaChatSyncClient._update_token', autospec=True) as mock_update:
+            mock_update.side_effect = lambda self: setattr(self, '_access_token', fresh)
+            client._access_token = expiring
+            self.assertTrue(client._check_validity_token())
+            self.assertEqual(client.token, "fresh")
+            self.assertTrue(client._check_validity_token())
+            self.assertEqual(mock_update.call_count, 1)
+
+
+class ProviderRouterTests(TestCase):
+    def test_hedges_slow_primary(self):
+        """Test that a slow primary is hedged and the first valid answer wins"""
+        provider_router = ProviderRouter(max_workers=2)
+        with patch('clusters.router.DEFAULT_HEDGE_DELAY', 0.05):
+            started = time.monotonic()
+            result = provider_router.call([
+                ("slow", lambda: time.sleep(1) or "slow answer"),
+                ("fast", lambda: "fast answer"),
+            ], budget=5)
+        self.assertEqual(result, "fast answer")
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_falls_back_on_failure(self):
+        """Test that a failing primary switches to the secondary immediately"""
+        provider_router = ProviderRouter(max_workers=2)
+
+        def failing():
+            raise RuntimeError("down")
+
+        result = provider_router.call([("primary", failing), ("secondary", lambda: "answer")], budget=5)
+        self.assertEqual(result, "answer")
+        stats = provider_router.stats()
+        self.assertEqual(stats["primary"]["failures"], 1)
+        self.assertEqual(stats["secondary"]["total"], 1)
+
+    def test_latency_excludes_slot_wait(self):
+        """Test that time spent waiting for a provider slot is not recorded as latency"""
+        provider_router = ProviderRouter(max_workers=1)
+        semaphore = threading.BoundedSemaphore(1)
+
+        def call():
+            with semaphore:
+                mark_call_started()
+                return "answer"
+
+        semaphore.acquire()
+        threading.Timer(0.3, semaphore.release).start()
+        self.assertEqual(provider_router.call([("slow", call)], budget=5), "answer")
+        histogram = provider_router.histogram("slow")
+        self.assertLess(histogram.quantile(1.0), 0.3)
+
+    def test_histogram_quantile(self):
+        """Test latency histogram quantiles"""
+        histogram = LatencyHistogram()
+        for seconds in [0.2] * 9 + [10]:
+            histogram.observe(seconds)
+        self.assertEqual(histogram.quantile(0.5), 0.25)
+        self.assertEqual(histogram.quantile(0.9), 0.25)
+        self.assertEqual(histogram.quantile(1.0), 13)
+
+
+class CircuitBreakerTests(TestCase):
+    def test_breaker_opens_and_recovers(self):
+        """Test closed -> open -> half-open -> closed transitions"""
+        now = [0.0]
+        breaker = CircuitBreaker("test", failure_rate=0.5, window=4, min_calls=4,
+                                 open_seconds=10, clock=lambda: now[0])
+        for success in [True, False, False, True]:
+            breaker.record(success)
+        self.assertEqual(breaker.state, "open")
+
+        with self.assertRaises(CircuitOpenError):
+            with breaker.guard():
+                pass
+
+        now[0] = 11
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, "half_open")
+        self.assertFalse(breaker.allow())  # Только один пробный вызов
+        breaker.record(True)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_failed_probe_reopens(self):
+        """Test that a failed half-open probe opens the circuit again"""
+        now = [0.0]
+        breaker = CircuitBreaker("test", window=2, min_calls=2, open_seconds=5, clock=lambda: now[0])
+        breaker.record(False)
+        breaker.record(False)
+        now[0] = 6
+        with self.assertRaises(RuntimeError):
+            with breaker.guard():
+                raise RuntimeError("still down")
+        self.assertEqual(breaker.state, "open")
+
+    def test_retry_budget(self):
+        """Test that retries are limited to a share of requests"""
+        budget = RetryBudget(ratio=0.5, min_tokens=1)
+        self.assertTrue(budget.try_retry())
+        self.assertFalse(budget.try_retry())
+        budget.record_request()
+        budget.record_request()
+        self.assertTrue(budget.try_retry())
+        self.assertFalse(budget.try_retry())
+
+
+    @patch('clusters.mymodels.get_openrouter_client')
+    def test_openrouter_retries_use_budget(self, mock_client):
+        """Test that OpenRouter validation retries go through the breaker and the retry budget"""
+        create = mock_client.return_value.chat.completions.create
+        create.side_effect = InstructorRetryException("invalid", n_attempts=1, total_usage=0)
+        for tokens, expected_calls in [(1, 2), (0, 1)]:
+            create.reset_mock()
+            breaker = CircuitBreaker("OpenRouter", min_calls=10)
+            with patch('clusters.mymodels.get_breaker', return_value=breaker), \
+                    patch('clusters.mymodels.retry_budget', RetryBudget(ratio=0, min_tokens=tokens)):
+                self.assertIsNone(call_openrouter("prompt"))
+            self.assertEqual(create.call_count, expected_calls)
+            self.assertEqual(create.call_args.kwargs['max_retries'], 1)
+            self.assertEqual(list(breaker._results), [False] * expected_calls)
+
+class RepresentativeSamplingTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create()
+        self.cluster = Cluster.objects.create(name="Cluster", summary="", project=self.project)
+        for i in range(50):
+            Complaint.objects.create(
+                text=f"Complaint {i}", embedding=[float(i), 0.0], project=self.project, cluster=self.cluster)
+
+    def test_representatives_are_nearest_and_deterministic(self):
+        """Test centroid-nearest selection without loading the whole cluster"""
+        ids = self.cluster.representative_ids(k=5)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(ids, self.cluster.representative_ids(k=5))
+        texts = dict(Complaint.objects.filter(id__in=ids).values_list('id', 'text'))
+        # Первой идёт жалоба, ближайшая к среднему (24.5)
+        self.assertIn(texts[ids[0]], ("Complaint 24", "Complaint 25"))
+        self.assertTrue(all(18 <= int(texts[i].split()[1]) <= 31 for i in ids))
+
+    def test_mmr_prefers_diverse_items(self):
+        """Test that MMR skips near-duplicates of already selected items"""
+        vectors = np.array([[1.0, 0.0], [1.0, 0.01], [0.0, 1.0]])
+        distances = np.array([0.0, 0.01, 0.5])
+        self.assertEqual(mmr_select(vectors, distances, 2, mmr_lambda=0.5), [0, 2])
+
+    def test_pack_prompt_respects_budget(self):
+        """Test that the prompt is packed to the token budget"""
+        prompt = pack_prompt(["слово " * 500, "короткая жалоба", "ещё одна"], token_budget=116,
+                             per_text_tokens=100)
+        self.assertTrue(prompt.startswith("Жалоба 1: "))
+        self.assertIn("Жалоба 2: короткая жалоба", prompt)
+        self.assertNotIn("Жалоба 3", prompt)
+
+
+class BatchedSummaryTests(TestCase):
+    @patch('clusters.models.summarize_text')
+    @patch('clusters.models.call_openrouter_batch')
+    def test_batched_summaries_with_fallback(self, mock_batch, mock_single):
+        """Test that clusters missed by the batched request are summarized individually"""
+        mock_batch.return_value = ([
+            ClusterOutput(cluster_id=1, name="First cluster", summary="Summary one"),
+            ClusterOutput(cluster_id=7, name="Unknown", summary="Ignored"),
+        ], "batch-model")
+        mock_single.return_value = ("Second cluster", "Summary two", "single-model")
+
+        jobs = {
+            'a': {'text': "Жалоба 1: first", 'model': 'OpenRouter'},
+            'b': {'text': "Жалоба 1: second", 'model': 'OpenRouter'},
+        }
+        results = summarize_batched(jobs)
+
+        mock_batch.assert_called_once()
+        self.assertEqual(results['a'], ("First cluster", "Summary one", "batch-model"))
+        self.assertEqual(results['b'], ("Second cluster", "Summary two", "single-model"))
+        mock_single.assert_called_once_with("Жалоба 1: second", 'OpenRouter')
+
+    @patch('clusters.models.call_openrouter_batch', return_value=([], "batch-model"))
+    def test_groups_respect_token_budget(self, mock_batch):
+        """Test that clusters are split into groups by the prompt token budget"""
+        jobs = {key: {'text': "слово " * 100, 'model': 'OpenRouter'} for key in range(5)}
+        with patch('clusters.models.summarize_concurrently', return_value={}):
+            summarize_batched(jobs, token_budget=450)
+        self.assertEqual(mock_batch.call_count, 3)
+
+    @patch('clusters.models.summarize_text', return_value=("Name", "Summary", "GigaChat"))
+    @patch('clusters.models.call_openrouter_batch')
+    def test_only_openrouter_jobs_are_batched(self, mock_batch, mock_single):
+        """Test that jobs for other models are not sent to the OpenRouter batch"""
+        results = summarize_batched({'a': {'text': "Жалоба 1: first", 'model': 'GigaChat'}})
+        mock_batch.assert_not_called()
+        mock_single.assert_called_once_with("Жалоба 1: first", 'GigaChat')
+        self.assertEqual(results['a'], ("Name", "Summary", "GigaChat"))
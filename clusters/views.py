@@ -3,6 +3,8 @@ from complaints.models import Complaint
 from rest_framework import generics
 from .serializers import ClusterSerializer
 from complaints.serializers import ComplaintSerializer
+from complaints.pagination import OptionalCursorPagination, NewestFirstCursorPagination
+from complaints.caching import VersionedReadMixin
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -11,19 +13,21 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-class ClusterListCreate(generics.ListCreateAPIView):
+class ClusterListCreate(VersionedReadMixin, generics.ListCreateAPIView):
     serializer_class = ClusterSerializer
+    pagination_class = NewestFirstCursorPagination
     
     def get_queryset(self):
         project_id = self.kwargs.get('project_id')
         logger.info(f"ClusterListCreate.get_queryset called with project_id={project_id}")
+        deferred = ClusterSerializer.deferred_fields({'request': self.request})
         
         if project_id:
-            queryset = Cluster.objects.filter(project_id=project_id).order_by("-id")
+            queryset = Cluster.objects.filter(project_id=project_id).defer(*deferred).order_by("-id")
             logger.info(f"Found {queryset.count()} clusters for project_id={project_id}")
             return queryset
         
-        queryset = Cluster.objects.order_by("-id").all()
+        queryset = Cluster.objects.defer(*deferred).order_by("-id")
         logger.info(f"Found {queryset.count()} clusters (all)")
         return queryset
     
@@ -32,9 +36,9 @@ class ClusterListCreate(generics.ListCreateAPIView):
         context.update({'view': self})
         return context
 
-class ClusterDetailAPI(APIView):
-    def get(self, request, cluster_id, project_id=None):
-        logger.info(f"ClusterDetailAPI.get called with cluster_id={cluster_id}, project_id={project_id}")
+class ClusterDetailAPI(VersionedReadMixin, APIView):
+    def retrieve(self, request, cluster_id, project_id=None):
+        logger.info(f"ClusterDetailAPI.retrieve called with cluster_id={cluster_id}, project_id={project_id}")
         # Получаем кластер по ID
         if project_id:
             cluster = get_object_or_404(Cluster, id=cluster_id, project_id=project_id)
@@ -43,23 +47,35 @@ class ClusterDetailAPI(APIView):
             cluster = get_object_or_404(Cluster, id=cluster_id)
             logger.info(f"Found cluster with id={cluster_id}")
 
-        # Получаем все жалобы, связанные с этим кластером
-        complaints = Complaint.objects.filter(cluster=cluster)
-        logger.info(f"Found {complaints.count()} complaints for cluster_id={cluster_id}")
-
         # Создаем контекст для сериализатора с view и kwargs
         serializer_context = {
             'request': request,
             'view': self,
             'kwargs': {'project_id': project_id} if project_id else {}
         }
+        # Поля жалоб задаются отдельным параметром complaint_fields=
+        complaint_context = {**serializer_context, 'fields': request.query_params.get('complaint_fields')}
+
+        # Получаем жалобы, связанные с этим кластером, без тяжёлых полей
+        complaints = Complaint.objects.filter(cluster=cluster).defer(
+            *ComplaintSerializer.deferred_fields(complaint_context)).order_by('id')
+        logger.info(f"Found {complaints.count()} complaints for cluster_id={cluster_id}")
+
+        # Жалобы постранично, если клиент передал cursor или page_size
+        paginator = OptionalCursorPagination()
+        page = paginator.paginate_queryset(complaints, request, view=self)
 
         # Сериализуем данные с контекстом
         cluster_data = ClusterSerializer(cluster, context=serializer_context).data
-        complaints_data = ComplaintSerializer(complaints, many=True, context=serializer_context).data
+        complaints_data = ComplaintSerializer(
+            complaints if page is None else page, many=True, context=complaint_context).data
 
         # Возвращаем данные
-        return Response({
+        data = {
             **cluster_data,
             'complaints': complaints_data,
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }
+        if page is not None:
+            data['next'] = paginator.get_next_link()
+            data['previous'] = paginator.get_previous_link()
+        return Response(data, status=status.HTTP_200_OK)
\ No newline at end of file
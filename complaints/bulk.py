@@ -0,0 +1,76 @@
+import numpy as np
+from django.db import connection, transaction
+from django.dispatch import Signal
+
+# Отправляется после bulk_update_columns (sender — модель, ids, columns — имена полей, project_id):
+# post_save при такой записи не вызывается
+columns_updated = Signal()
+# Отправляется после bulk_delete (sender — модель, project_ids — проекты удалённых строк)
+rows_deleted = Signal()
+
+
+def bulk_update_columns(model, ids, columns, batch_size=5000, project_id=None):
+    """
+    Write column values for many rows without building model instances.
+
+    Runs one prepared ``UPDATE ... SET col = %s ... WHERE id = %s`` through
+    ``executemany`` inside a single transaction, instead of the large
+    ``CASE WHEN`` statements produced by ``bulk_update``.
+
+    Args:
+        model: Django model class
+        ids (array-like): primary keys of the rows to update
+        columns (Dict[str, array-like]): field name -> values aligned with ``ids``;
+            NumPy arrays of numbers are passed as is, other values are prepared by the field
+        batch_size (int): rows per ``executemany`` call
+        project_id (int): project all rows belong to, if known; receivers of
+            ``columns_updated`` look it up otherwise
+
+    Returns:
+        int: number of rows written
+    """
+    ids = np.asarray(ids).tolist()
+    fields = [model._meta.get_field(name) for name in columns]
+    values = []
+    for field, column in zip(fields, columns.values()):
+        if isinstance(column, np.ndarray) and column.dtype.kind in 'biuf':
+            values.append(column.tolist())
+        else:
+            values.append([field.get_db_prep_save(value, connection) for value in column])
+        if len(values[-1]) != len(ids):
+            raise ValueError(f"Column {field.name} has {len(values[-1])} values for {len(ids)} ids")
+
+    quote = connection.ops.quote_name
+    assignments = ", ".join(f"{quote(field.column)} = %s" for field in fields)
+    sql = f"UPDATE {quote(model._meta.db_table)} SET {assignments} WHERE {quote(model._meta.pk.column)} = %s"
+    rows = list(zip(*values, ids))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+        if rows:
+            columns_updated.send(sender=model, ids=ids, columns=list(columns), project_id=project_id)
+    return len(rows)
+
+
+def bulk_delete(queryset):
+    """
+    Delete the rows of a queryset with one ``DELETE`` statement.
+
+    Unlike ``QuerySet.delete()`` no instances are collected and no per-row
+    ``post_delete`` is sent; receivers of ``rows_deleted`` get the affected
+    projects once instead. Only for models without relations pointing to them,
+    since cascades are not applied.
+
+    Returns:
+        int: number of rows deleted
+    """
+    model = queryset.model
+    if any(field.auto_created and not field.concrete for field in model._meta.get_fields()):
+        raise ValueError(f"{model.__name__} has related models, use QuerySet.delete()")
+    with transaction.atomic():
+        project_ids = set(queryset.order_by().values_list('project_id', flat=True).distinct())
+        deleted = queryset._raw_delete(queryset.db)
+        if deleted:
+            rows_deleted.send(sender=model, project_ids=project_ids)
+    return deleted
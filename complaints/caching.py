@@ -0,0 +1,87 @@
+import hashlib
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+
+from projects.models import Project
+
+# Ответы старых версий данных не запрашиваются и просто истекают
+PAYLOAD_CACHE_TIMEOUT = 300
+
+
+def versioned_response(request, project_id, build):
+    """
+    Answer a read request from the payload cache of the project's data version.
+
+    The ETag is made of the project id, its ``data_version`` and a digest of
+    the request (method, path with query, ``Accept`` and body), so any write
+    to the project's complaints, clusters or layout changes it. A matching
+    ``If-None-Match`` gets 304 without touching the data; otherwise a
+    successful response of ``build()`` is cached under the same key.
+
+    Args:
+        request: Django or DRF request
+        project_id (int): project the response depends on; None disables caching
+        build (Callable[[], HttpResponse]): produces the rendered response
+
+    Returns:
+        HttpResponse
+    """
+    row = None
+    if project_id is not None:
+        row = Project.objects.filter(id=project_id).values_list('data_version', 'created_at').first()
+    if row is None:
+        return build()
+    version, created_at = row
+
+    digest = hashlib.sha256()
+    # created_at отличает проект от удалённого проекта с тем же id
+    for part in (created_at.isoformat(), request.method, request.get_full_path(), request.headers.get('Accept', '')):
+        digest.update(part.encode() + b'\0')
+    digest.update(request.body)
+    digest = digest.hexdigest()[:16]
+    etag = f'"{project_id}.{version}.{digest}"'
+
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        key = f'payload:{project_id}:{version}:{digest}'
+        cached = cache.get(key)
+        if cached is None:
+            response = build()
+            if response.status_code != 200:
+                return response
+            cache.set(key, (response['Content-Type'], bytes(response.content)), PAYLOAD_CACHE_TIMEOUT)
+        else:
+            response = HttpResponse(cached[1], content_type=cached[0])
+    response['ETag'] = etag
+    # Браузер хранит ответ, но перепроверяет его по ETag при каждом запросе
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def versioned(view):
+    """Декоратор функции-представления только для чтения: ответ кэшируется по версии данных проекта"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        return versioned_response(request, kwargs.get('project_id'), lambda: view(request, *args, **kwargs))
+    return wrapper
+
+
+class VersionedReadMixin:
+    """
+    GET представлений DRF через ``versioned_response``; запись идёт как обычно.
+
+    Представления на базе APIView без собственного ``get`` описывают чтение в ``retrieve``.
+    """
+
+    def get(self, request, *args, **kwargs):
+        get = getattr(super(), 'get', None) or self.retrieve
+
+        def build():
+            # Ответ DRF отрисовывается сразу, чтобы его содержимое можно было закэшировать
+            response = self.finalize_response(request, get(request, *args, **kwargs), *args, **kwargs)
+            return response.render()
+
+        return versioned_response(request, kwargs.get('project_id'), build)
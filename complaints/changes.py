@@ -0,0 +1,111 @@
+import zlib
+
+import numpy as np
+
+from clusters.models import Cluster
+from projects.models import Project
+from .models import ChangeLog, Complaint
+
+MODEL_NAMES = {Complaint: 'complaint', Cluster: 'cluster'}
+# Поля строк, которые отдаёт лента изменений: ровно то, что нужно карте и панели кластеров
+DELTA_FIELDS = {
+    'complaint': ('id', 'x', 'y', 'cluster'),
+    'cluster': ('id', 'name', 'summary', 'keywords', 'size'),
+}
+# Больше изменённых строк клиенту дешевле перезагрузить модель целиком (points/, clusters/)
+MAX_DELTA_ROWS = 20000
+# Сколько последних версий хранит журнал и как часто он подрезается
+CHANGE_LOG_RETENTION = 5000
+TRIM_EVERY = 500
+# Порция id при чтении изменённых строк
+ROW_LOOKUP_CHUNK = 5000
+
+
+def pack_ids(ids):
+    """Упаковывает id как сжатые zlib разности отсортированных значений: подряд идущие id почти ничего не занимают"""
+    ids = np.unique(np.asarray(ids, dtype=np.int64))
+    return zlib.compress(np.diff(ids, prepend=0).astype('<i8').tobytes())
+
+
+def unpack_ids(data):
+    """Inverse of ``pack_ids``."""
+    return np.cumsum(np.frombuffer(zlib.decompress(bytes(data)), dtype='<i8'))
+
+
+def record_changes(project_ids, model, ids=None, columns=(), deleted=False):
+    """
+    Increment ``data_version`` of the projects and log the write under the new version.
+
+    Args:
+        project_ids (Iterable[int]): projects the written rows belong to
+        model: Complaint or Cluster
+        ids (array-like): written rows; None if the write may touch any row of the model
+        columns (Iterable[str]): written fields, empty for the whole row
+        deleted (bool): the rows were deleted
+    """
+    project_ids = {project_id for project_id in project_ids if project_id is not None}
+    if not project_ids:
+        return
+    if ids is not None and None in ids:
+        # Без первичных ключей (bulk_create на старой SQLite) строки не перечислить
+        ids = None
+    Project.bump_data_version(project_ids)
+    versions = list(Project.objects.filter(id__in=project_ids).values_list('id', 'data_version'))
+    packed = None if ids is None else pack_ids(ids)
+    ChangeLog.objects.bulk_create([
+        ChangeLog(project_id=project_id, version=version, model=MODEL_NAMES[model], ids=packed,
+                  columns=list(columns), deleted=deleted)
+        for project_id, version in versions
+    ])
+    for project_id, version in versions:
+        if version % TRIM_EVERY == 0:
+            ChangeLog.objects.filter(project_id=project_id, version__lte=version - CHANGE_LOG_RETENTION).delete()
+
+
+def _rows(model, project_id, ids, fields):
+    rows = []
+    ids = sorted(ids)
+    for start in range(0, len(ids), ROW_LOOKUP_CHUNK):
+        rows.extend(model.objects.filter(project_id=project_id, id__in=ids[start:start + ROW_LOOKUP_CHUNK])
+                    .order_by('id').values(*fields))
+    return rows
+
+
+def changes_since(project_id, since):
+    """
+    Rows of a project written after data version ``since``.
+
+    Returns a dict with the current ``version`` and, for ``complaints`` and
+    ``clusters``, the ``changed`` rows (``DELTA_FIELDS``), the ``deleted`` ids
+    and a ``reset`` flag. ``reset`` means the delta is not available — the
+    log was trimmed, a write was not row-level or too many rows changed — and
+    the client has to reload that model in full.
+
+    Raises:
+        Project.DoesNotExist: if there is no such project
+    """
+    current = Project.objects.values_list('data_version', flat=True).get(id=project_id)
+    entries = list(ChangeLog.objects.filter(project_id=project_id, version__gt=since, version__lte=current)
+                   .order_by('version').values_list('model', 'ids', 'deleted'))
+    # В журнале ровно одна запись на версию: пропуск означает, что часть изменений уже удалена
+    complete = len(entries) == current - since
+
+    result = {'version': current, 'since': since}
+    for name, key, model in (('complaint', 'complaints', Complaint), ('cluster', 'clusters', Cluster)):
+        changed, deleted = set(), set()
+        reset = not complete
+        for entry_model, ids, is_deleted in entries:
+            if entry_model != name or reset:
+                continue
+            if ids is None:
+                reset = True
+                continue
+            (deleted if is_deleted else changed).update(unpack_ids(ids).tolist())
+        changed -= deleted
+        reset = reset or len(changed) > MAX_DELTA_ROWS
+        result[key] = {
+            'reset': reset,
+            'changed': [] if reset else _rows(model, project_id, changed, DELTA_FIELDS[name]),
+            'deleted': [] if reset else sorted(deleted),
+        }
+    return result
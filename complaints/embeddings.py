@@ -0,0 +1,109 @@
+import threading
+from typing import List
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.random_projection import SparseRandomProjection
+
+from clusters.clients import get_gigachat_client
+from clusters.instances import embedding_provider
+from clusters.resilience import get_breaker
+from projects.models import Project
+
+
+class EmbeddingProvider:
+    """
+    Turns texts into embedding vectors.
+
+    ``name`` and ``model`` are stored on every complaint, so vectors of
+    different providers or model versions are never mixed unnoticed.
+    """
+    name = ''
+    model = ''
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+
+class GigaChatEmbeddingProvider(EmbeddingProvider):
+    """Remote embeddings from GigaChat, guarded by the provider circuit breaker."""
+    name = 'GigaChat'
+    model = 'Embeddings'
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        # Общий клиент процесса берётся лениво, чтобы не создавать его без необходимости
+        return self._client or get_gigachat_client()
+
+    def embed(self, texts):
+        with get_breaker(self.name).guard():
+            response = self.client.embeddings(texts)
+        return [item.embedding for item in response.data]
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Local CPU embeddings without network round trips.
+
+    Character n-grams are hashed into a sparse vector and reduced with a
+    seeded sparse random projection. Both steps are stateless, so the same
+    text always gets the same vector in every process and no fitting on a
+    corpus is required.
+    """
+    name = 'hashing'
+
+    def __init__(self, dim=256, n_features=2 ** 18, seed=42):
+        self.dim = dim
+        self.model = f'char3-5-h{n_features}-rp{dim}-s{seed}'
+        self._vectorizer = HashingVectorizer(
+            analyzer='char_wb', ngram_range=(3, 5), n_features=n_features,
+            alternate_sign=False, norm='l2')
+        # Проекция зависит только от размерности и seed, данные для fit не нужны
+        self._projection = SparseRandomProjection(n_components=dim, random_state=seed)
+        self._projection.fit(csr_matrix((1, n_features)))
+
+    def embed(self, texts):
+        vectors = self._projection.transform(self._vectorizer.transform(texts))
+        vectors = np.asarray(vectors.todense() if hasattr(vectors, 'todense') else vectors)
+        norms = np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return (vectors / norms).astype(np.float32).tolist()
+
+
+PROVIDERS = {
+    'gigachat': GigaChatEmbeddingProvider,
+    'hashing': HashingEmbeddingProvider,
+}
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_embedding_provider(name=None):
+    """
+    Shared provider instance by name (``EMBEDDING_PROVIDER`` by default).
+
+    Raises:
+        ValueError: if the provider is unknown
+    """
+    name = (name or embedding_provider).lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider: {name}")
+    with _providers_lock:
+        if name not in _providers:
+            _providers[name] = PROVIDERS[name]()
+        return _providers[name]
+
+
+def project_embedding(project_id):
+    """
+    Active embedding provider and embedding version of a project.
+
+    Returns:
+        Tuple[EmbeddingProvider, int]: provider and version new vectors are stored with
+    """
+    row = Project.objects.filter(id=project_id).values_list('embedding_provider', 'embedding_version').first()
+    name, version = row or ('', 0)
+    return get_embedding_provider(name or None), version
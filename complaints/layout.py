@@ -0,0 +1,302 @@
+import logging
+import time
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE
+from sklearn.neighbors import NearestNeighbors
+
+logger = logging.getLogger(__name__)
+
+# Эмбеддинги сжимаются PCA до этой размерности перед построением раскладки
+PCA_COMPONENTS = 50
+# До этого размера точная Barnes-Hut раскладка достаточно быстрая
+BARNES_HUT_MAX_POINTS = 10000
+# Число соседей, по которым размещаются новые точки
+PLACEMENT_NEIGHBORS = 10
+# Укороченное расписание оптимизации при тёплом старте
+WARM_MAX_ITER = 300
+# Начиная с этого размера раскладка строится по опорным точкам (landmarks)
+LANDMARK_AUTO_POINTS = 200000
+DEFAULT_LANDMARKS = 20000
+# Число центров k-means при выборе опорных точек: стоимость растёт как точки × центры,
+# поэтому центров немного, а опорные точки выбираются внутри них
+LANDMARK_KMEANS_CLUSTERS = 256
+# Размер порции при интерполяции остальных точек
+INTERPOLATION_CHUNK = 20000
+
+
+class LayoutEngine:
+    """
+    Builds a 2D layout of embeddings.
+
+    Engines backed by optional packages report ``available() == False``
+    when the package is not installed.
+    """
+    name = ''
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def fit(self, vectors, perplexity, max_iter, n_jobs, random_state, init=None):
+        """
+        Lay out the vectors; ``init`` holds starting coordinates for a warm start,
+        which skips early exaggeration.
+        """
+        raise NotImplementedError
+
+
+class BarnesHutTSNE(LayoutEngine):
+    """scikit-learn Barnes-Hut t-SNE with PCA init and automatic learning rate."""
+    name = 'barnes_hut'
+
+    def fit(self, vectors, perplexity, max_iter, n_jobs, random_state, init=None):
+        tsne = TSNE(
+            n_components=2,
+            perplexity=perplexity,
+            max_iter=max_iter,
+            init='pca' if init is None else init,
+            early_exaggeration=12.0 if init is None else 1.0,
+            learning_rate='auto',
+            method='barnes_hut',
+            n_jobs=n_jobs,
+            random_state=random_state,
+        )
+        return tsne.fit_transform(vectors)
+
+
+class FFTTSNE(LayoutEngine):
+    """FFT-accelerated interpolation t-SNE (FIt-SNE) from openTSNE."""
+    name = 'fft'
+
+    @classmethod
+    def available(cls):
+        try:
+            import openTSNE  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def fit(self, vectors, perplexity, max_iter, n_jobs, random_state, init=None):
+        from openTSNE import TSNE as OpenTSNE
+
+        tsne = OpenTSNE(
+            n_components=2,
+            perplexity=perplexity,
+            n_iter=max_iter,
+            initialization='pca' if init is None else init,
+            early_exaggeration_iter=250 if init is None else 0,
+            learning_rate='auto',
+            negative_gradient_method='fft',
+            n_jobs=n_jobs,
+            random_state=random_state,
+        )
+        return np.asarray(tsne.fit(vectors))
+
+
+class UMAPLayout(LayoutEngine):
+    """UMAP from umap-learn; perplexity is used as the number of neighbours."""
+    name = 'umap'
+
+    @classmethod
+    def available(cls):
+        try:
+            import umap  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def fit(self, vectors, perplexity, max_iter, n_jobs, random_state, init=None):
+        import umap
+
+        reducer = umap.UMAP(
+            n_components=2,
+            init='spectral' if init is None else init,
+            n_neighbors=max(2, int(perplexity)),
+            n_epochs=max_iter,
+            n_jobs=n_jobs,
+            random_state=random_state,
+        )
+        return reducer.fit_transform(vectors)
+
+
+ENGINES = {engine.name: engine for engine in (BarnesHutTSNE, FFTTSNE, UMAPLayout)}
+
+
+def choose_engine(n_points):
+    """Выбирает движок по размеру данных: точный t-SNE для небольших проектов, ускоренный для больших"""
+    if n_points > BARNES_HUT_MAX_POINTS:
+        for name in ('fft', 'umap'):
+            if ENGINES[name].available():
+                return name
+        logger.warning(f"{n_points} points but neither openTSNE nor umap-learn is installed, using Barnes-Hut")
+    return 'barnes_hut'
+
+
+def knn_place(known_vectors, known_coordinates, vectors, k=PLACEMENT_NEIGHBORS, chunk_size=INTERPOLATION_CHUNK):
+    """
+    Place points at the inverse-distance weighted mean of their nearest known neighbours.
+
+    The neighbour index is built once and queried in chunks, so memory stays
+    bounded for large point sets.
+
+    Args:
+        known_vectors (np.ndarray): (m, dim) vectors of points that already have coordinates
+        known_coordinates (np.ndarray): (m, 2) their coordinates
+        vectors (np.ndarray): (n, dim) vectors of the points to place
+
+    Returns:
+        np.ndarray: (n, 2) coordinates
+    """
+    k = min(k, len(known_vectors))
+    known_coordinates = np.asarray(known_coordinates, dtype=np.float64)
+    index = NearestNeighbors(n_neighbors=k).fit(known_vectors)
+    placed = np.empty((len(vectors), 2))
+    for start in range(0, len(vectors), chunk_size):
+        distances, indices = index.kneighbors(vectors[start:start + chunk_size])
+        weights = 1.0 / np.maximum(distances, 1e-9)
+        weights /= weights.sum(axis=1, keepdims=True)
+        placed[start:start + chunk_size] = np.einsum('nk,nkd->nd', weights, known_coordinates[indices])
+    return placed
+
+
+def select_landmarks(vectors, n_landmarks, method='stratified', strata=None, random_state=42):
+    """
+    Choose the points that get the full layout.
+
+    Args:
+        vectors (np.ndarray): (n, dim) reduced vectors
+        n_landmarks (int): number of landmarks
+        method (str): 'stratified' samples every stratum (e.g. cluster) proportionally to its size,
+            'kmeans' does the same inside at most LANDMARK_KMEANS_CLUSTERS MiniBatchKMeans clusters
+        strata (np.ndarray): stratum of every point for the stratified method
+
+    Returns:
+        np.ndarray: sorted indices of the landmarks
+    """
+    if n_landmarks >= len(vectors):
+        return np.arange(len(vectors))
+    rng = np.random.default_rng(random_state)
+    if method == 'kmeans':
+        n_clusters = min(LANDMARK_KMEANS_CLUSTERS, n_landmarks)
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, n_init=1,
+                                 batch_size=max(1024, 3 * n_clusters))
+        strata = kmeans.fit(vectors).labels_
+    elif method == 'stratified':
+        strata = np.zeros(len(vectors), dtype=np.int64) if strata is None else np.asarray(strata)
+    else:
+        raise ValueError(f"Unknown landmark method: {method}")
+    landmarks = []
+    for stratum in np.unique(strata):
+        members = np.flatnonzero(strata == stratum)
+        quota = max(1, round(n_landmarks * len(members) / len(vectors)))
+        landmarks.append(rng.choice(members, size=min(quota, len(members)), replace=False))
+    landmarks = np.concatenate(landmarks)
+    if len(landmarks) > n_landmarks:
+        # Округление квот вверх у мелких групп может дать лишние точки
+        landmarks = rng.choice(landmarks, size=n_landmarks, replace=False)
+    return np.sort(landmarks)
+
+
+def reduce_dimensions(vectors, random_state=42, sample=None):
+    """PCA до PCA_COMPONENTS измерений; при заданной выборке PCA обучается только на ней"""
+    n_components = min(PCA_COMPONENTS, *vectors.shape)
+    if vectors.shape[1] <= n_components:
+        return vectors
+    pca = PCA(n_components=n_components, random_state=random_state)
+    pca.fit(vectors if sample is None else vectors[sample])
+    return np.vstack([
+        pca.transform(vectors[start:start + INTERPOLATION_CHUNK])
+        for start in range(0, len(vectors), INTERPOLATION_CHUNK)
+    ]).astype(np.float32)
+
+
+def compute_layout(embeddings, engine='auto', perplexity=30, max_iter=1000, n_jobs=-1, random_state=42,
+                   init=None):
+    """
+    Reduce embeddings with PCA and lay them out in 2D.
+
+    Args:
+        embeddings (array-like): (n, dim) embedding matrix
+        engine (str): 'auto', 'barnes_hut', 'fft' or 'umap'
+        perplexity (float): t-SNE perplexity (number of neighbours for UMAP)
+        init (np.ndarray): (n, 2) starting coordinates for a warm start; rows with NaN
+            (points without a position yet) are placed by their nearest neighbours
+
+    Returns:
+        Tuple[np.ndarray, dict]: (n, 2) coordinates and timings per phase in seconds
+
+    Raises:
+        ValueError: if the engine is unknown or its package is not installed
+    """
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if engine == 'auto':
+        engine = choose_engine(len(vectors))
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown layout engine: {engine}")
+    if not ENGINES[engine].available():
+        raise ValueError(f"Layout engine {engine} requires an optional package that is not installed")
+
+    timings = {}
+    started = time.perf_counter()
+    vectors = reduce_dimensions(vectors, random_state)
+    timings['pca'] = time.perf_counter() - started
+
+    if init is not None:
+        started = time.perf_counter()
+        init = np.array(init, dtype=np.float64)
+        missing = np.isnan(init).any(axis=1)
+        if missing.any():
+            init[missing] = knn_place(vectors[~missing], init[~missing], vectors[missing])
+        timings['placement'] = time.perf_counter() - started
+
+    # Перплексия должна быть меньше числа точек
+    perplexity = max(1.0, min(float(perplexity), (len(vectors) - 1) / 3))
+    started = time.perf_counter()
+    coordinates = ENGINES[engine]().fit(vectors, perplexity, max_iter, n_jobs, random_state, init=init)
+    timings[engine] = time.perf_counter() - started
+
+    logger.info("Layout timings: " + ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in timings.items()))
+    return np.asarray(coordinates, dtype=np.float64), timings
+
+
+def compute_landmark_layout(embeddings, n_landmarks=DEFAULT_LANDMARKS, method='stratified', strata=None,
+                            engine='auto', perplexity=30, max_iter=1000, n_jobs=-1, random_state=42):
+    """
+    Lay out a sample of landmarks and interpolate every other point from its nearest landmarks.
+
+    Returns:
+        Tuple[np.ndarray, dict]: (n, 2) coordinates and timings per phase in seconds
+    """
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    timings = {}
+
+    started = time.perf_counter()
+    # PCA обучается на равномерной выборке, а применяется ко всем точкам порциями
+    sample = np.random.default_rng(random_state).choice(
+        len(vectors), size=min(len(vectors), 5 * n_landmarks), replace=False)
+    reduced = reduce_dimensions(vectors, random_state, sample=sample)
+    timings['pca'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    landmarks = select_landmarks(reduced, n_landmarks, method, strata, random_state)
+    timings['landmarks'] = time.perf_counter() - started
+
+    landmark_coordinates, layout_timings = compute_layout(
+        reduced[landmarks], engine=engine, perplexity=perplexity, max_iter=max_iter,
+        n_jobs=n_jobs, random_state=random_state)
+    timings.update({phase: seconds for phase, seconds in layout_timings.items() if phase != 'pca'})
+
+    started = time.perf_counter()
+    coordinates = np.empty((len(vectors), 2))
+    coordinates[landmarks] = landmark_coordinates
+    rest = np.setdiff1d(np.arange(len(vectors)), landmarks)
+    if len(rest):
+        coordinates[rest] = knn_place(reduced[landmarks], landmark_coordinates, reduced[rest])
+    timings['interpolation'] = time.perf_counter() - started
+
+    logger.info(f"Landmark layout of {len(landmarks)} of {len(vectors)} points: " +
+                ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in timings.items()))
+    return coordinates, timings
@@ -4,8 +4,8 @@ from googleapiclient.discovery import build
 from urllib.parse import urlparse, parse_qs
 from typing import List, Dict, Optional, Tuple
 from complaints.models import Complaint
-from gigachat import GigaChat
-from clusters.instances import youtube_api_key, gigachat_token
+from complaints.changes import record_changes
+from clusters.instances import youtube_api_key
 from tqdm import tqdm
 import random
 import logging
@@ -279,9 +279,6 @@ class Command(BaseCommand):
         
         logger.info(f"Processing {len(complaints)} complaints in {len(batches)} batches of {batch_size}")
         
-        # Initialize GigaChat client once
-        giga_client = GigaChat(credentials=gigachat_token, verify_ssl_certs=False)
-        
         # Create progress bar for batch processing
         batch_pbar = tqdm(batches, desc="Processing batches", unit="batch")
         
@@ -289,9 +286,9 @@ class Command(BaseCommand):
             batch_pbar.set_description(f"Processing batch {batch_index}/{len(batches)}")
             
             try:
-                # Use the static method for batch processing
+                # Use the static method for batch processing (provider of the complaints' project)
                 processed_batch = Complaint.batch_process_embeddings(
-                    complaint_batch, text_batch, giga_client
+                    complaint_batch, text_batch
                 )
                 processed_complaints.extend(processed_batch)
                 logger.info(f"Successfully processed batch {batch_index}/{len(batches)}")
@@ -346,9 +343,14 @@ class Command(BaseCommand):
             if not processed_complaints:
                 raise ValueError("Failed to process complaints")
                 
+            placed = Complaint.place_by_neighbours(processed_complaints)
+            logger.info(f"Placed {placed} complaints next to their nearest neighbours")
+
             created_complaints = Complaint.objects.bulk_create(processed_complaints, batch_size=100)
             if not created_complaints:
                 raise ValueError("Failed to save complaints to database")
+            # bulk_create не вызывает post_save, изменение записывается в журнал явно
+            record_changes([project_id], Complaint, [complaint.pk for complaint in created_complaints])
                 
             logger.info("Completed processing all YouTube comments")
             self.stdout.write(
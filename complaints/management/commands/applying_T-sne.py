@@ -1,24 +1,30 @@
+import hashlib
+import json
+import time
 import numpy as np
-from sklearn.manifold import TSNE
 from django.core.management import BaseCommand
-from tqdm import tqdm
-from complaints.models import Complaint
+from django.db.models import Count
+from complaints.models import Complaint, LayoutRun
+from complaints.bulk import bulk_update_columns
+from complaints.spatial import rebuild_spatial_index
+from complaints.tiles import rebuild_tiles
+from complaints.layout import (
+    ENGINES, WARM_MAX_ITER, LANDMARK_AUTO_POINTS, DEFAULT_LANDMARKS, compute_layout, compute_landmark_layout
+)
+from projects.models import Project
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Сколько последних раскладок проекта хранится для повторного использования
+MAX_CACHED_LAYOUTS = 10
 
-def calculate_tsne(embeddings, perplexity=500):
-    """Применяет t-SNE к эмбеддингам"""
-    tsne = TSNE(
-        n_components=2,
-        perplexity=perplexity,
-        max_iter=1000,
-        random_state=42,
-        verbose=1,
-        learning_rate=100
-    )
-    return tsne.fit_transform(np.array(embeddings))
+
+def calculate_tsne(embeddings, perplexity=30, engine='auto', n_jobs=-1, max_iter=1000, init=None):
+    """Применяет t-SNE (или другой движок раскладки) к эмбеддингам"""
+    coordinates, _ = compute_layout(
+        embeddings, engine=engine, perplexity=perplexity, n_jobs=n_jobs, max_iter=max_iter, init=init)
+    return coordinates
 
 
 class Command(BaseCommand):
@@ -43,53 +49,201 @@ class Command(BaseCommand):
             required=True,
             help='ID of the project to process complaints for'
         )
+        parser.add_argument(
+            '--engine',
+            choices=['auto'] + list(ENGINES),
+            default='auto',
+            help='Layout engine; auto picks Barnes-Hut for small projects and FFT t-SNE or UMAP for large ones'
+        )
+        parser.add_argument(
+            '--n-jobs',
+            type=int,
+            default=-1,
+            help='Number of CPU threads for the layout engine (-1 uses all cores)'
+        )
+        parser.add_argument(
+            '--max-iter',
+            type=int,
+            default=1000,
+            help='Number of optimization iterations'
+        )
+        parser.add_argument(
+            '--warm-start',
+            action='store_true',
+            help='Start from the current coordinates and place new complaints next to their neighbours'
+        )
+        parser.add_argument(
+            '--warm-max-iter',
+            type=int,
+            default=WARM_MAX_ITER,
+            help='Number of optimization iterations for a warm start'
+        )
+        parser.add_argument(
+            '--landmarks',
+            type=int,
+            default=None,
+            help=f'Lay out only this many landmarks and interpolate the rest '
+                 f'(default: {DEFAULT_LANDMARKS} for projects above {LANDMARK_AUTO_POINTS} complaints, 0 disables)'
+        )
+        parser.add_argument(
+            '--landmark-method',
+            choices=['stratified', 'kmeans'],
+            default='stratified',
+            help='Landmark selection: a sample stratified by cluster or by a few hundred k-means clusters'
+        )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Recompute the layout even if a cached one matches the embeddings and parameters'
+        )
 
     def handle(self, *args, **options):
         perplexity = options['perplexity']
         batch_size = options['batch_size']
         project_id = options['project_id']
 
-        # Получаем только жалобы с эмбеддингами для указанного проекта
-        queryset = Complaint.objects.filter(project_id=project_id).exclude(embedding__isnull=True)
-        total = queryset.count()
-
-        if total == 0:
+        # Получаем только жалобы с эмбеддингами текущей версии для указанного проекта
+        version = Project.objects.filter(id=project_id).values_list('embedding_version', flat=True).first() or 0
+        queryset = Complaint.objects.filter(
+            project_id=project_id, embedding_version=version, embedding_dim__isnull=False
+        ).exclude(embedding__isnull=True)
+        # Векторы другой размерности (например, от другой модели) в раскладку не попадают
+        dims = list(queryset.values('embedding_dim').annotate(n=Count('id')).order_by('-n'))
+        if not dims:
             logger.warning(f"No complaints with embeddings found for project ID {project_id}!")
             return
+        dim = dims[0]['embedding_dim']
+        if len(dims) > 1:
+            logger.warning(f"Project {project_id} has embeddings of {len(dims)} dimensions, using {dim}")
+        queryset = queryset.filter(embedding_dim=dim)
+        total = queryset.count()
 
         logger.info(f"Processing {total} complaints with t-SNE for project ID {project_id}...")
 
-        # Загружаем и фильтруем эмбеддинги за один проход
-        valid_complaints = []
-        valid_embeddings = []
-
-        for complaint in queryset.iterator():
-            try:
-                if isinstance(complaint.embedding, list) and all(
-                        isinstance(x, (int, float)) for x in complaint.embedding):
-                    valid_complaints.append(complaint)
-                    valid_embeddings.append(complaint.embedding)
-            except Exception as e:
-                logger.warning(f"Skipping complaint {complaint.id}: {str(e)}")
-
-        if not valid_embeddings:
-            logger.error(f"No valid embeddings found for project ID {project_id}!")
-            return
-
-        logger.info(f"Found {len(valid_embeddings)} valid embeddings for project ID {project_id}")
-
-        # Вычисляем t-SNE
-        tsne_results = calculate_tsne(valid_embeddings, perplexity)
+        landmarks = options['landmarks']
+        if landmarks is None:
+            landmarks = DEFAULT_LANDMARKS if total > LANDMARK_AUTO_POINTS else 0
+
+        # Холодная раскладка детерминирована: при тех же эмбеддингах и параметрах берём сохранённую
+        params = {
+            'engine': options['engine'],
+            'perplexity': float(perplexity),
+            'max_iter': options['max_iter'],
+            'landmarks': landmarks,
+            'landmark_method': options['landmark_method'] if landmarks else None,
+        }
+        fingerprint = self.embedding_fingerprint(queryset)
+        key = hashlib.sha256(f"{fingerprint}:{json.dumps(params, sort_keys=True)}".encode()).hexdigest()
+        cacheable = not options['warm_start']
+        if cacheable and not options['no_cache']:
+            cached = LayoutRun.objects.filter(project_id=project_id, key=key).order_by('-id').first()
+            if cached:
+                started = time.perf_counter()
+                ids, coordinates = cached.arrays()
+                self.write_coordinates(project_id, ids, coordinates, batch_size)
+                logger.info(f"Applied cached layout {cached.id} ({cached.engine}, {cached.n_points} points) "
+                            f"in {time.perf_counter() - started:.2f}s")
+                return
+
+        # Эмбеддинги загружаются сразу в массив, без экземпляров моделей
+        ids = np.empty(total, dtype=np.int64)
+        vectors = np.empty((total, dim), dtype=np.float32)
+        current = np.empty((total, 2))
+        in_layout = np.zeros(total, dtype=bool)
+        strata = np.empty(total, dtype=np.int64)
+        rows = queryset.order_by('id').values_list('id', 'embedding', 'x', 'y', 'in_layout', 'cluster_id')
+        count = 0
+        for complaint_id, embedding, x, y, placed, cluster_id in rows.iterator(chunk_size=2000):
+            if count == total:
+                break
+            ids[count], vectors[count] = complaint_id, embedding
+            current[count], in_layout[count] = (x, y), placed
+            strata[count] = -1 if cluster_id is None else cluster_id
+            count += 1
+        ids, vectors, current, in_layout, strata = \
+            ids[:count], vectors[:count], current[:count], in_layout[:count], strata[:count]
+
+        logger.info(f"Found {count} valid embeddings for project ID {project_id}")
+
+        started = time.perf_counter()
+        if landmarks and landmarks < count:
+            # Полная раскладка только для опорных точек, остальные интерполируются
+            tsne_results, timings = compute_landmark_layout(
+                vectors, n_landmarks=landmarks, method=options['landmark_method'], strata=strata,
+                engine=options['engine'], perplexity=perplexity, max_iter=options['max_iter'],
+                n_jobs=options['n_jobs'])
+        else:
+            # Тёплый старт: уже размещённые жалобы начинают с текущих координат, новые (NaN) —
+            # со взвешенного среднего координат ближайших соседей
+            init = None
+            max_iter = options['max_iter']
+            if options['warm_start']:
+                placed = int(in_layout.sum())
+                if placed < 2:
+                    logger.warning("Not enough complaints with layout coordinates, running a full layout")
+                else:
+                    init = np.where(in_layout[:, None], current, np.nan)
+                    max_iter = options['warm_max_iter']
+                    logger.info(f"Warm start from {placed} placed complaints, "
+                                f"{count - placed} new, {max_iter} iterations")
+
+            # Вычисляем t-SNE
+            tsne_results, timings = compute_layout(
+                vectors, engine=options['engine'], perplexity=perplexity, n_jobs=options['n_jobs'],
+                max_iter=max_iter, init=init)
+        layout_seconds = time.perf_counter() - started
 
         # Обновляем записи батчами
-        with tqdm(total=len(valid_complaints), desc="Updating coordinates") as pbar:
-            for i in range(0, len(valid_complaints), batch_size):
-                batch = valid_complaints[i:i + batch_size]
-                for j, complaint in enumerate(batch):
-                    complaint.x = tsne_results[i + j][0]
-                    complaint.y = tsne_results[i + j][1]
+        started = time.perf_counter()
+        self.write_coordinates(project_id, ids, tsne_results, batch_size)
+        write_seconds = time.perf_counter() - started
 
-                Complaint.objects.bulk_update(batch, ['x', 'y'])
-                pbar.update(len(batch))
+        phases = ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in timings.items())
+        logger.info(f"Layout {layout_seconds:.2f}s ({phases}), write {write_seconds:.2f}s")
 
+        if cacheable:
+            self.store_layout(project_id, key, fingerprint, params, ids, tsne_results, timings)
         logger.info(f"Successfully updated coordinates for project ID {project_id}!")
+
+    def embedding_fingerprint(self, queryset):
+        """
+        Hash of the embedding set: ids, embedding versions and modification times.
+
+        Coordinate writes do not change ``updated_at``, so a layout does not
+        invalidate itself.
+        """
+        digest = hashlib.sha256()
+        rows = queryset.order_by('id').values_list('id', 'embedding_version', 'embedding_dim', 'updated_at')
+        for row in rows.iterator(chunk_size=5000):
+            digest.update(repr(row).encode())
+        return digest.hexdigest()
+
+    def store_layout(self, project_id, key, fingerprint, params, ids, coordinates, timings):
+        """Сохраняет раскладку и удаляет самые старые сверх MAX_CACHED_LAYOUTS"""
+        engine = next((phase for phase in timings if phase in ENGINES), params['engine'])
+        run = LayoutRun.objects.create(
+            project_id=project_id,
+            key=key,
+            fingerprint=fingerprint,
+            engine=engine,
+            params=params,
+            n_points=len(ids),
+            ids=np.ascontiguousarray(ids, dtype=np.int64).tobytes(),
+            coordinates=np.ascontiguousarray(coordinates, dtype=np.float64).tobytes(),
+            timings=timings,
+        )
+        stale = LayoutRun.objects.filter(project_id=project_id).order_by('-id').values_list(
+            'id', flat=True)[MAX_CACHED_LAYOUTS:]
+        LayoutRun.objects.filter(id__in=list(stale)).delete()
+        logger.info(f"Stored layout {run.id} for reuse")
+
+    def write_coordinates(self, project_id, ids, coordinates, batch_size):
+        """Записывает координаты и перестраивает пространственный индекс и плитки проекта"""
+        coordinates = np.asarray(coordinates, dtype=np.float64)
+        bulk_update_columns(Complaint, ids, {
+            'x': coordinates[:, 0],
+            'y': coordinates[:, 1],
+            'in_layout': np.ones(len(ids), dtype=bool),
+        }, batch_size=batch_size, project_id=project_id)
+        rebuild_spatial_index(project_id)
+        rebuild_tiles(project_id)
@@ -3,8 +3,20 @@ from django.core.management import BaseCommand
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import silhouette_score
+from django.db import transaction
+from django.db.models import F
 from complaints.models import Complaint
-from clusters.models import Cluster
+from complaints.bulk import bulk_update_columns
+from complaints.tiles import rebuild_tiles
+from complaints.changes import record_changes
+from clusters.models import Cluster, ClusteringRun, summarize_concurrently, summarize_batched
+from clusters.router import router
+from clusters.fingerprint import DEFAULT_SUMMARY_CHANGE_THRESHOLD
+from clusters.keywords import class_tfidf_keywords, provisional_name, provisional_summary
+from clusters.matching import membership_overlap, match_clusters
+from clusters.drift import (
+    DEFAULT_THRESHOLDS, assignment_distances, measure_drift, exceeded_thresholds, size_skew
+)
 from projects.models import Project
 from tqdm import tqdm
 import logging
@@ -61,6 +73,51 @@ class Command(BaseCommand):
             type=int,
             help='ID of the project to cluster complaints for'
         )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Assign new complaints to existing clusters unless drift thresholds are exceeded'
+        )
+        parser.add_argument(
+            '--max-new-fraction',
+            type=float,
+            default=DEFAULT_THRESHOLDS['max_new_fraction'],
+            help='Recluster when new complaints exceed this share of the last run'
+        )
+        parser.add_argument(
+            '--max-far-fraction',
+            type=float,
+            default=DEFAULT_THRESHOLDS['max_far_fraction'],
+            help='Recluster when this share of new complaints is farther than the p95 radius from every centroid'
+        )
+        parser.add_argument(
+            '--max-distance-ratio',
+            type=float,
+            default=DEFAULT_THRESHOLDS['max_distance_ratio'],
+            help='Recluster when mean assignment distance grows by this factor'
+        )
+        parser.add_argument(
+            '--max-size-skew',
+            type=float,
+            default=DEFAULT_THRESHOLDS['max_size_skew'],
+            help='Recluster when the largest/mean cluster size ratio grows by this factor'
+        )
+        parser.add_argument(
+            '--force-summaries',
+            action='store_true',
+            help='Regenerate summaries for every cluster, ignoring the summary cache'
+        )
+        parser.add_argument(
+            '--summary-change-threshold',
+            type=float,
+            default=DEFAULT_SUMMARY_CHANGE_THRESHOLD,
+            help='Share of changed members after which a cluster summary is regenerated'
+        )
+        parser.add_argument(
+            '--batch-summaries',
+            action='store_true',
+            help='Summarize several clusters per OpenRouter request, falling back to per-cluster calls'
+        )
 
     def handle(self, *args, **options):
         logging.basicConfig(level=logging.INFO)
@@ -84,10 +141,16 @@ class Command(BaseCommand):
         if 'show_sizes' not in options:
             options['show_sizes'] = False
 
+        if options.get('incremental') and project:
+            if self.assign_incrementally(project, options):
+                return
+
         # Получение данных с фильтрацией по project, если указан
         complaints_query = Complaint.objects.exclude(embedding__isnull=True)
         if project:
-            complaints_query = complaints_query.filter(project=project)
+            # Только векторы текущей модели эмбеддингов проекта
+            complaints_query = complaints_query.filter(
+                project=project, embedding_version=project.embedding_version)
             
         total = complaints_query.count()
 
@@ -156,81 +219,105 @@ class Command(BaseCommand):
         logger.info(f"Created {len(unique_labels)} clusters")
         logger.info(f"Silhouette Score: {silhouette_score(scaled_embeddings, labels):.2f}")
 
-        # Создание кластеров в БД с учетом project_id
+        # Сопоставление с кластерами предыдущего запуска, чтобы сохранить их id, имя и описание
         clusters = {}
+        new_sizes = np.bincount(labels, minlength=n_clusters)
+        matches, previous = self.match_previous_clusters(
+            project, valid_complaints, labels, kmeans, scaler, new_sizes)
+
+        # Ключевые слова всех кластеров за один проход по разреженной матрице
+        keywords = class_tfidf_keywords([complaint.text for complaint in valid_complaints], labels)
+
         logger.info("Creating clusters")
         for label in unique_labels:
-            cluster_name = f"KMeans_Cluster_{label}"
-            cluster_defaults = {
-                'summary': f"K-Means cluster {label}",
-            }
-            
-            # Добавляем project в defaults, если project указан
-            if project:
-                cluster_defaults['project'] = project
-                
-            # Дополнительный фильтр для update_or_create при создании кластеров
-            filter_kwargs = {'name': cluster_name}
-            if project:
-                filter_kwargs['project'] = project
-                
-            cluster, created = Cluster.objects.update_or_create(
-                **filter_kwargs,
-                defaults=cluster_defaults
-            )
+            if label in matches:
+                cluster = previous[matches[label][0]]
+                logger.info(f"Cluster {label} matched to existing cluster {cluster.id} "
+                            f"(overlap {matches[label][1]:.2f})")
+            else:
+                # Временные имя и описание из ключевых слов видны сразу, до ответа LLM
+                cluster = Cluster(
+                    name=provisional_name(keywords[label]) or f"KMeans_Cluster_{label}",
+                    summary=provisional_summary(keywords[label]) or f"K-Means cluster {label}",
+                )
+                if project:
+                    cluster.project = project
+            cluster.keywords = keywords[label]
+            cluster.centroid = kmeans.cluster_centers_[label].tolist()
+            cluster.size = int(new_sizes[label])
+            if options['show_sizes']:
+                logger.info(f"Cluster {label} size: {cluster.size}")
+            cluster.save()
             clusters[label] = cluster
 
-        # Обновление жалоб
+        # Обновление только тех жалоб, у которых сменился кластер
         logger.info("Updating complaints with cluster info...")
-        for i in tqdm(range(0, len(valid_complaints), batch_size)):
-            batch = valid_complaints[i:i+batch_size]
-            label_batch = labels[i:i + batch_size]
+        cluster_ids = np.array([clusters[label].id for label in labels], dtype=np.int64)
+        complaint_ids = np.array([complaint.id for complaint in valid_complaints], dtype=np.int64)
+        current_ids = np.array([complaint.cluster_id or 0 for complaint in valid_complaints], dtype=np.int64)
+        changed = current_ids != cluster_ids
+        bulk_update_columns(Complaint, complaint_ids[changed], {'cluster': cluster_ids[changed]},
+                            batch_size=batch_size, project_id=project.id if project else None)
+        logger.info(f"Reassigned {int(changed.sum())} of {len(valid_complaints)} complaints")
 
-            for complaint, label in zip(batch, label_batch):
-                complaint.cluster = clusters[label]
+        # Кластеры предыдущего запуска без пары больше не нужны
+        matched_ids = {cluster.id for cluster in clusters.values()}
+        stale = [cluster.id for cluster in previous if cluster.id not in matched_ids]
+        if stale:
+            Cluster.objects.filter(id__in=stale).delete()
+            logger.info(f"Removed {len(stale)} clusters that have no successor")
 
-            Complaint.objects.bulk_update(batch, ['cluster'])
-            
-        # Подсчет размера кластеров
-        logger.info("Counting cluster sizes...")
-        cluster_sizes = Counter(labels)
-        for label, size in cluster_sizes.items():
-            if label in clusters:
-                clusters[label].size = size
-                if options['show_sizes']:
-                    logger.info(f"Cluster {label} size: {size}")
-        
-        # Сохранение обновленных размеров кластеров
-        for cluster in clusters.values():
-            cluster.save()
-            
-        # Генерация имени и описания для каждого кластера
+        # Доминирующие кластеры ячеек в плитках пересчитываются по новым меткам
+        for tile_project_id in sorted({complaint.project_id for complaint in valid_complaints}):
+            rebuild_tiles(tile_project_id)
+
+        # Запуск сохраняется до генерации описаний: по его масштабу raw_centroid
+        # переводит новые центроиды в пространство эмбеддингов для выбора представителей
+        if project:
+            self.record_run(project, valid_complaints, scaled_embeddings, labels, kmeans, scaler)
+
+        # Генерация имени и описания только для кластеров с заметно изменившимся составом
         logger.info("Generating cluster summaries...")
+        # Получаем модель из опций командной строки
+        model = options['model']
+        jobs = {}
         for label, cluster in clusters.items():
-            try:
-                # Получаем модель из опций командной строки
-                model = options['model']
-                response = cluster.generate_summary(model)
-                
-                # Обработка результата - метод может вернуть кортеж (имя, описание) или только описание
-                if isinstance(response, tuple):
-                    name, summary = response[0], response[1]
-                    cluster.name = name 
-                    cluster.summary = summary
-                    if len(response) > 2:
-                        cluster.model = response[2]
-                else:
-                    raise ValueError(f"Invalid response from generate_summary: {response}")
-                
-                cluster.save()
-                
-                logger.info(f"Generated summary for cluster {label}: {cluster.name} (size: {cluster.size})")
-            except Exception as e:
-                logger.warning(f"Failed to generate summary for cluster {label}: {str(e)}")
-                # Используем значения по умолчанию в случае ошибки
-                cluster.name = f"KMeans_Cluster_{label}"
-                cluster.summary = f"K-Means cluster {label} (auto-generated)"
-                cluster.save()
+            job = cluster.prepare_summary(
+                model,
+                force=options['force_summaries'],
+                max_change=options['summary_change_threshold'],
+            )
+            if job is None:
+                logger.info(f"Kept summary for cluster {label}: {cluster.name} (size: {cluster.size})")
+            else:
+                jobs[label] = job
+
+        # Запросы к LLM выполняются параллельно (или пакетами по несколько кластеров),
+        # результаты сохраняются одной транзакцией
+        if options['batch_summaries']:
+            responses = summarize_batched(jobs)
+        else:
+            responses = summarize_concurrently(jobs)
+        with transaction.atomic():
+            for label, job in jobs.items():
+                cluster = clusters[label]
+                try:
+                    response = responses.get(label)
+                    if isinstance(response, Exception):
+                        raise response
+                    cluster.apply_summary(job, response)
+                    logger.info(f"Generated summary for cluster {label}: {cluster.name} (size: {cluster.size})")
+                except Exception as e:
+                    logger.warning(f"Failed to generate summary for cluster {label}: {str(e)}")
+                    if label not in matches and not cluster.keywords:
+                        # Используем значения по умолчанию в случае ошибки
+                        cluster.name = f"KMeans_Cluster_{label}"
+                        cluster.summary = f"K-Means cluster {label} (auto-generated)"
+                        cluster.save()
+
+        for provider, stats in router.stats().items():
+            logger.info(f"{provider} latency: p50={stats['p50']}s, p90={stats['p90']}s, "
+                        f"calls={stats['total']}, failures={stats['failures']}")
 
         # Вывод статистики по кластерам
         logger.info("Clustering statistics:")
@@ -255,3 +342,127 @@ class Command(BaseCommand):
         logger.info(f"Total complaints assigned to clusters: {total_assigned}")
         project_info = f" for project ID: {project_id}" if project else ""
         logger.info(f"Clustering completed successfully{project_info}!")
+
+    def match_previous_clusters(self, project, valid_complaints, labels, kmeans, scaler, new_sizes):
+        """
+        Match the new K-Means labels to the clusters of the previous run.
+
+        Previous centroids are mapped into the scaler space of the current run
+        before comparison.
+
+        Returns:
+            Tuple[dict, List[Cluster]]: new label -> (index in previous, overlap) and the previous clusters
+        """
+        if not project:
+            return {}, []
+        run = ClusteringRun.objects.filter(project=project).order_by('-created_at', '-id').first()
+        previous = list(Cluster.objects.filter(project=project, centroid__isnull=False).order_by('id'))
+        if run is None or not previous:
+            return {}, previous
+        if len(run.scaler_mean) != len(scaler.mean_):
+            # Размерность эмбеддингов изменилась, сопоставление невозможно
+            return {}, previous
+
+        raw_centroids = np.array([cluster.centroid for cluster in previous]) * np.array(run.scaler_scale) \
+            + np.array(run.scaler_mean)
+        old_centroids = (raw_centroids - scaler.mean_) / scaler.scale_
+
+        overlap = membership_overlap(
+            [complaint.cluster_id for complaint in valid_complaints], labels,
+            [cluster.id for cluster in previous], len(new_sizes))
+        matches = match_clusters(
+            old_centroids, kmeans.cluster_centers_, overlap, overlap.sum(axis=1), new_sizes)
+        return matches, previous
+
+    def record_run(self, project, valid_complaints, scaled_embeddings, labels, kmeans, scaler):
+        """Сохраняет базовую статистику запуска для последующего мониторинга дрейфа"""
+        distances = np.linalg.norm(scaled_embeddings - kmeans.cluster_centers_[labels], axis=1)
+        ClusteringRun.objects.create(
+            project=project,
+            n_complaints=len(valid_complaints),
+            n_clusters=len(kmeans.cluster_centers_),
+            max_complaint_id=max(complaint.id for complaint in valid_complaints),
+            embedding_version=project.embedding_version,
+            scaler_mean=scaler.mean_.tolist(),
+            scaler_scale=scaler.scale_.tolist(),
+            mean_distance=float(distances.mean()),
+            distance_p95=float(np.percentile(distances, 95)),
+            size_skew=size_skew(np.bincount(labels)),
+        )
+
+    def assign_incrementally(self, project, options):
+        """
+        Assign unclustered complaints to the nearest existing centroid.
+
+        Falls back to a full recluster (returns False) when there is no baseline
+        run yet, when the project's embeddings no longer match the baseline
+        (model or dimension changed) or when any drift metric exceeds its threshold.
+
+        Returns:
+            bool: True if the incremental assignment was applied
+        """
+        run = ClusteringRun.objects.filter(project=project).order_by('-created_at', '-id').first()
+        clusters = list(Cluster.objects.filter(project=project, centroid__isnull=False).order_by('id'))
+        if run is None or not clusters:
+            logger.info("No previous clustering run found, performing full clustering")
+            return False
+
+        if run.embedding_version is not None and run.embedding_version != project.embedding_version:
+            logger.warning(f"Embeddings changed since the last full run (version {run.embedding_version} -> "
+                           f"{project.embedding_version}), performing full clustering")
+            return False
+
+        new_complaints = []
+        embeddings = []
+        skipped = 0
+        queryset = Complaint.objects.filter(
+            project=project, cluster__isnull=True, embedding_version=project.embedding_version
+        ).exclude(embedding__isnull=True)
+        for complaint in queryset.only('id', 'embedding').iterator():
+            if not isinstance(complaint.embedding, list):
+                continue
+            if len(complaint.embedding) != len(run.scaler_mean):
+                skipped += 1
+                continue
+            new_complaints.append(complaint)
+            embeddings.append(complaint.embedding)
+
+        if skipped:
+            # Центроиды в другом пространстве: такие жалобы можно распределить только полным запуском
+            logger.warning(f"Skipped {skipped} complaints whose embedding dimension differs from the last "
+                           f"full run ({len(run.scaler_mean)}), performing full clustering")
+            return False
+
+        if not new_complaints:
+            logger.info("No new complaints to assign")
+            return True
+
+        scaled = (np.array(embeddings) - np.array(run.scaler_mean)) / np.array(run.scaler_scale)
+        centroids = np.array([cluster.centroid for cluster in clusters])
+        nearest, distances = assignment_distances(scaled, centroids)
+
+        # Новыми считаются все жалобы после полного запуска, а не только ещё не распределённые:
+        # иначе каждая инкрементальная порция обнуляла бы счётчик
+        new_since_run = Complaint.objects.filter(project=project, id__gt=run.max_complaint_id).count()
+        report = measure_drift(run, distances, nearest, [cluster.size for cluster in clusters], new_since_run)
+        logger.info(
+            f"Drift: new={report['new_count']} ({report['new_fraction']:.1%}), "
+            f"far={report['far_fraction']:.1%}, distance ratio={report['distance_ratio']:.2f}, "
+            f"size skew growth={report['size_skew']:.2f}"
+        )
+        exceeded = exceeded_thresholds(report, options)
+        if exceeded:
+            logger.info(f"Drift thresholds exceeded ({', '.join(exceeded)}), performing full clustering")
+            return False
+
+        cluster_ids = np.array([cluster.id for cluster in clusters], dtype=np.int64)[nearest]
+        bulk_update_columns(Complaint, [complaint.id for complaint in new_complaints], {'cluster': cluster_ids},
+                            batch_size=options['batch_size'], project_id=project.id)
+
+        for index, count in Counter(nearest.tolist()).items():
+            Cluster.objects.filter(id=clusters[index].id).update(size=F('size') + count)
+        record_changes([project.id], Cluster, [clusters[index].id for index in set(nearest.tolist())], ['size'])
+        rebuild_tiles(project.id)
+
+        logger.info(f"Incrementally assigned {len(new_complaints)} complaints to {len(clusters)} clusters")
+        return True
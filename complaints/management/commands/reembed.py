@@ -0,0 +1,145 @@
+import time
+import logging
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from complaints.models import Complaint, EmbeddingMigration
+from complaints.embeddings import get_embedding_provider
+from complaints.bulk import bulk_update_columns
+from complaints.changes import record_changes
+from projects.models import Project
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Re-embed project complaints with a new model in the background and switch over atomically"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project-id',
+            type=int,
+            required=True,
+            help='ID of the project to re-embed'
+        )
+        parser.add_argument(
+            '--provider',
+            type=str,
+            required=True,
+            help='Embedding provider to migrate to (gigachat or hashing)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Number of complaints embedded per request'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.5,
+            help='Pause between batches in seconds, to throttle the load'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Stop after this many batches; the next run resumes where this one stopped'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Discard an unfinished migration to another provider and start over'
+        )
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO)
+        try:
+            project = Project.objects.get(id=options['project_id'])
+            provider = get_embedding_provider(options['provider'])
+        except (Project.DoesNotExist, ValueError) as e:
+            raise CommandError(str(e))
+
+        migration = self.get_migration(project, provider, options['restart'])
+        logger.info(f"Re-embedding project {project.id} with {provider.name} ({provider.model}), "
+                    f"version {migration.version}, resuming after complaint {migration.last_id}")
+
+        batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            if not self.embed_batch(migration, provider, options['batch_size']):
+                self.switch(project, migration, provider, options['batch_size'])
+                return
+            batches += 1
+            time.sleep(options['sleep'])
+        logger.info(f"Stopped after {batches} batches ({migration.processed} complaints), run again to resume")
+
+    def get_migration(self, project, provider, restart):
+        """Незавершённая миграция проекта или новая"""
+        migration = EmbeddingMigration.objects.filter(project=project, finished_at__isnull=True).first()
+        if migration and migration.model != provider.model:
+            if not restart:
+                raise CommandError(
+                    f"Project {project.id} is being migrated to {migration.provider} ({migration.model}), "
+                    f"use --restart to discard it")
+            migration.delete()
+            Complaint.objects.filter(project=project).update(pending_embedding=None)
+            migration = None
+        if migration is None:
+            migration = EmbeddingMigration.objects.create(
+                project=project,
+                provider=provider.name,
+                model=provider.model,
+                version=project.embedding_version + 1,
+            )
+        return migration
+
+    def embed_batch(self, migration, provider, batch_size):
+        """
+        Embed the next complaints after ``migration.last_id`` into the shadow field.
+
+        Returns:
+            bool: False when there is nothing left to embed
+        """
+        rows = list(
+            Complaint.objects.filter(project_id=migration.project_id, id__gt=migration.last_id)
+            .order_by('id').values_list('id', 'text')[:batch_size])
+        if not rows:
+            return False
+        vectors = provider.embed([text for _, text in rows])
+        # Векторы и позиция продолжения сохраняются вместе: прерванный запуск продолжится с того же места
+        with transaction.atomic():
+            bulk_update_columns(Complaint, [complaint_id for complaint_id, _ in rows], {'pending_embedding': vectors})
+            migration.last_id = rows[-1][0]
+            migration.processed += len(rows)
+            migration.save(update_fields=['last_id', 'processed'])
+        logger.info(f"Embedded {migration.processed} complaints (last id {migration.last_id})")
+        return True
+
+    def switch(self, project, migration, provider, batch_size):
+        """Переключает проект на новые векторы одной транзакцией"""
+        with transaction.atomic():
+            # Жалобы, добавленные после последнего батча, досчитываются внутри транзакции
+            while self.embed_batch(migration, provider, batch_size):
+                pass
+            pending = Complaint.objects.filter(project=project, pending_embedding__isnull=False)
+            dim = len(pending.values_list('pending_embedding', flat=True).first() or [])
+            switched = pending.update(
+                embedding=F('pending_embedding'),
+                pending_embedding=None,
+                embedding_provider=provider.name,
+                embedding_model=provider.model,
+                embedding_dim=dim or None,
+                embedding_version=migration.version,
+            )
+            Project.objects.filter(id=project.id).update(
+                embedding_provider=provider.name,
+                embedding_version=migration.version,
+            )
+            # Векторы сменились у всех жалоб проекта
+            record_changes([project.id], Complaint, columns=['embedding', 'embedding_version'])
+            migration.finished_at = timezone.now()
+            migration.save(update_fields=['finished_at'])
+        logger.info(f"Project {project.id} switched to {provider.name} ({provider.model}), "
+                    f"{switched} complaints re-embedded. Run clusterising and applying_T-sne to rebuild the layout")
+
@@ -9,10 +9,12 @@ from django.core.management import BaseCommand
 from django.db import transaction
 from django.conf import settings
 from tqdm import tqdm
-from gigachat import GigaChat
 from gigachat.exceptions import GigaChatException
 from complaints.models import Complaint
-from clusters.instances import gigachat_token
+from complaints.bulk import bulk_delete
+from complaints.changes import record_changes
+from complaints.embeddings import project_embedding
+from clusters.resilience import CircuitOpenError, retry_budget
 
 class Command(BaseCommand):
     help = "Load complaint data from CSV file into database with embeddings generation"
@@ -36,7 +38,8 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
-        Complaint.objects.all().delete()
+        # Одним DELETE, без загрузки жалоб и сигнала на каждую строку
+        bulk_delete(Complaint.objects.all())
 
         csv_path = options['csv_path']
         chunk_size = options['chunk_size']
@@ -52,13 +55,10 @@ class Command(BaseCommand):
             self.stderr.write(self.style.ERROR(f"Fatal error: {str(e)}"))
             raise
 
-    def _init_gigachat(self):
-        """Инициализация клиента GigaChat"""
-        return GigaChat(
-            credentials=gigachat_token,
-            verify_ssl_certs=False,
-            timeout=30
-        )
+    def _init_provider(self):
+        """Провайдер эмбеддингов проекта, в который загружаются жалобы (по умолчанию)"""
+        provider, _ = project_embedding(Complaint._meta.get_field('project').get_default())
+        return provider
 
     def _process_file(self, csv_path, chunk_size):
         """Основной процесс обработки файла"""
@@ -76,10 +76,10 @@ class Command(BaseCommand):
         chunks = pd.read_csv(csv_path, chunksize=chunk_size)
 
         with tqdm(total=total_rows, desc="Processing complaints") as progress_bar:
-            giga_client = self._init_gigachat()
+            provider = self._init_provider()
 
             for chunk in chunks:
-                processed_count = self._process_batch(chunk, giga_client)
+                processed_count = self._process_batch(chunk, provider)
                 progress_bar.update(processed_count)
         self.stdout.write(self.style.SUCCESS(
             f"Successfully processed {progress_bar.n} complaints"
@@ -90,45 +90,64 @@ class Command(BaseCommand):
         with open(file_path, 'r', encoding='utf-8') as f:
             return sum(1 for line in f) - 1  # Исключаем заголовок
 
-    def _process_batch_with_resize(self, complaints, texts, giga_client):
-        """Process a batch with automatic resizing on errors"""
+    def _process_batch_with_resize(self, complaints, texts, provider, individual):
+        """
+        Process a batch with automatic resizing on errors.
+
+        Complaints embedded one by one are collected in ``individual`` and
+        saved by ``_save_individual`` once the whole batch is done.
+        """
         if not complaints:
             return 0
             
         # Base case: Individual processing when batch size is 1
         if len(complaints) <= self.MIN_BATCH_SIZE:
-            processed_count = 0
             for complaint, text in zip(complaints, texts):
                 try:
-                    complaint.call_gigachat_embeddings(text, giga_client)
-                    complaint.save()
-                    processed_count += 1
+                    complaint.compute_embedding(text, provider)
+                    individual.append(complaint)
+                except CircuitOpenError:
+                    break
                 except Exception as e:
                     pass
-            return processed_count
+            return 0
             
         try:
             # Try to process the entire batch
             processed_complaints = Complaint.batch_process_embeddings(
                 complaints=complaints,
                 texts=texts,
-                giga_client=giga_client
+                provider=provider
             )
+            # Coordinates from the nearest already laid-out complaints
+            Complaint.place_by_neighbours(processed_complaints)
             # Save to database - use bulk_create
             # Note: bulk_create bypasses the save() method, but embeddings are already set
             Complaint.objects.bulk_create(processed_complaints, batch_size=len(processed_complaints))
+            # bulk_create не вызывает post_save, изменение записывается в журнал явно
+            record_changes({complaint.project_id for complaint in processed_complaints}, Complaint,
+                           [complaint.pk for complaint in processed_complaints])
             return len(processed_complaints)
-            
+
+        except CircuitOpenError as e:
+            # Сервис недоступен: не дробим батч, чтобы не умножать нагрузку
+            self.stderr.write(self.style.WARNING(f"Skipping {len(complaints)} complaints: {str(e)}"))
+            return 0
+
         except GigaChatException as e:
+            if not retry_budget.try_retry():
+                self.stderr.write(self.style.WARNING(
+                    f"Skipping {len(complaints)} complaints: retry budget exhausted"))
+                return 0
             # Silent splitting - no warnings
             # Split the batch in half
             mid = len(complaints) // 2
-            first_half_count = self._process_batch_with_resize(complaints[:mid], texts[:mid], giga_client)
-            second_half_count = self._process_batch_with_resize(complaints[mid:], texts[mid:], giga_client)
+            first_half_count = self._process_batch_with_resize(complaints[:mid], texts[:mid], provider, individual)
+            second_half_count = self._process_batch_with_resize(complaints[mid:], texts[mid:], provider, individual)
             
             return first_half_count + second_half_count
     
-    def _process_batch(self, chunk, giga_client):
+    def _process_batch(self, chunk, provider):
         """Обработка пакета записей с батчевой генерацией эмбеддингов"""
         complaints = []
         texts = []
@@ -161,5 +180,19 @@ class Command(BaseCommand):
                 skipped_count += 1
         
         # Process the batch with automatic resizing
-        processed_count = self._process_batch_with_resize(complaints, texts, giga_client)
+        individual = []
+        processed_count = self._process_batch_with_resize(complaints, texts, provider, individual)
+        processed_count += self._save_individual(individual)
+        return processed_count
+
+    def _save_individual(self, complaints):
+        """Сохраняет жалобы, обработанные по одной; координаты всех считаются одним вызовом"""
+        Complaint.place_by_neighbours(complaints)
+        processed_count = 0
+        for complaint in complaints:
+            try:
+                complaint.save()
+                processed_count += 1
+            except Exception as e:
+                pass
         return processed_count
\ No newline at end of file
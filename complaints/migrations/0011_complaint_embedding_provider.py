@@ -0,0 +1,31 @@
+# Generated by Django 4.2.17 on 2026-10-19 16:56
+
+from django.db import migrations, models
+
+
+def mark_gigachat_embeddings(apps, schema_editor):
+    # До появления провайдеров все эмбеддинги считались через GigaChat
+    Complaint = apps.get_model('complaints', 'Complaint')
+    Complaint.objects.filter(embedding__isnull=False).update(
+        embedding_provider='GigaChat', embedding_model='Embeddings')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0010_remove_complaint_clusters_complaint_cluster'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='embedding_model',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='complaint',
+            name='embedding_provider',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.RunPython(mark_gigachat_embeddings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.17 on 2026-10-19 16:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_embedding_dim(apps, schema_editor):
+    # Размерность существующих векторов; некорректные векторы остаются без размерности
+    Complaint = apps.get_model('complaints', 'Complaint')
+    batch = []
+    rows = Complaint.objects.filter(embedding__isnull=False).values_list('id', 'embedding')
+    for complaint_id, embedding in rows.iterator(chunk_size=2000):
+        if isinstance(embedding, list) and embedding and all(
+                isinstance(value, (int, float)) for value in embedding):
+            batch.append(Complaint(id=complaint_id, embedding_dim=len(embedding)))
+        if len(batch) >= 1000:
+            Complaint.objects.bulk_update(batch, ['embedding_dim'])
+            batch = []
+    Complaint.objects.bulk_update(batch, ['embedding_dim'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_project_embedding_version'),
+        ('complaints', '0011_complaint_embedding_provider'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='embedding_dim',
+            field=models.PositiveIntegerField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='complaint',
+            name='embedding_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='complaint',
+            name='pending_embedding',
+            field=models.JSONField(default=None, null=True),
+        ),
+        migrations.CreateModel(
+            name='EmbeddingMigration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=100)),
+                ('version', models.PositiveIntegerField()),
+                ('last_id', models.IntegerField(default=0)),
+                ('processed', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(default=None, null=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='projects.project')),
+            ],
+        ),
+        migrations.RunPython(backfill_embedding_dim, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-19 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0012_embedding_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='in_layout',
+            field=models.BooleanField(default=False),
+        ),
+    ]
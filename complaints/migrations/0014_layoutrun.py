@@ -0,0 +1,31 @@
+# Generated by Django 4.2.17 on 2026-10-19 17:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_project_embedding_version'),
+        ('complaints', '0013_complaint_in_layout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LayoutRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, max_length=64)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('engine', models.CharField(max_length=20)),
+                ('params', models.JSONField(default=dict)),
+                ('n_points', models.IntegerField()),
+                ('ids', models.BinaryField()),
+                ('coordinates', models.BinaryField()),
+                ('timings', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='projects.project')),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.17 on 2026-10-19 17:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_project_embedding_version'),
+        ('complaints', '0014_layoutrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpatialGrid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_x', models.FloatField()),
+                ('min_y', models.FloatField()),
+                ('cell_width', models.FloatField()),
+                ('cell_height', models.FloatField()),
+                ('side', models.IntegerField()),
+                ('n_points', models.IntegerField()),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='complaint',
+            name='grid_cell',
+            field=models.IntegerField(default=None, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['project', 'grid_cell'], name='complaints__project_59abed_idx'),
+        ),
+        migrations.AddField(
+            model_name='spatialgrid',
+            name='project',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='projects.project'),
+        ),
+    ]
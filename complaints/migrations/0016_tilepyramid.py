@@ -0,0 +1,44 @@
+# Generated by Django 4.2.17 on 2026-10-19 17:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_project_embedding_version'),
+        ('complaints', '0015_spatialgrid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TilePyramid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_x', models.FloatField()),
+                ('min_y', models.FloatField()),
+                ('extent', models.FloatField()),
+                ('tile_size', models.IntegerField()),
+                ('max_zoom', models.IntegerField()),
+                ('n_points', models.IntegerField()),
+                ('built_at', models.DateTimeField(auto_now_add=True)),
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='projects.project')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AggregateTile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.IntegerField()),
+                ('tx', models.IntegerField()),
+                ('ty', models.IntegerField()),
+                ('n_points', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('pyramid', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tiles', to='complaints.tilepyramid')),
+            ],
+            options={
+                'unique_together': {('pyramid', 'zoom', 'tx', 'ty')},
+            },
+        ),
+    ]
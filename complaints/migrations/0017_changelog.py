@@ -0,0 +1,31 @@
+# Generated by Django 4.2.17 on 2026-10-19 17:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0003_project_data_version'),
+        ('complaints', '0016_tilepyramid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField()),
+                ('model', models.CharField(max_length=20)),
+                ('ids', models.BinaryField(default=None, null=True)),
+                ('columns', models.JSONField(default=list)),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='projects.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'version'], name='complaints__project_a2c860_idx')],
+            },
+        ),
+    ]
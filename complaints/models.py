@@ -1,21 +1,44 @@
 from django.db import models
 from clusters.models import Cluster
 from projects.models import Project
-from gigachat import GigaChat
 from gigachat.exceptions import GigaChatException
-from clusters.instances import gigachat_token
+from clusters.resilience import CircuitOpenError
+from .embeddings import EmbeddingProvider, GigaChatEmbeddingProvider, project_embedding
+from .layout import knn_place
+from collections import OrderedDict, defaultdict
+import numpy as np
+import threading
 from typing import List
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Сколько размещённых жалоб проекта используется как опорные точки для новых
+MAX_PLACEMENT_ANCHORS = 5000
+# Сколько наборов опорных точек (по проекту и версии эмбеддингов) держит процесс
+ANCHOR_CACHE_SIZE = 8
+_anchor_cache = OrderedDict()
+_anchor_cache_lock = threading.Lock()
+
 class Complaint(models.Model):
     email = models.CharField(max_length=100, default='No Email')
     name = models.CharField(max_length=100, default='Unnamed Complaint')
     text = models.TextField()
     x = models.FloatField(default=0.0)
     y = models.FloatField(default=0.0)
+    # True, если x/y получены из раскладки эмбеддингов, а не заданы случайно
+    in_layout = models.BooleanField(default=False)
     embedding = models.JSONField(default=None, null=True)
+    # Провайдер и версия модели, которыми посчитан embedding
+    embedding_provider = models.CharField(max_length=50, blank=True, default='')
+    embedding_model = models.CharField(max_length=100, blank=True, default='')
+    embedding_dim = models.PositiveIntegerField(null=True, default=None)
+    # Версия эмбеддингов проекта (Project.embedding_version), к которой относится вектор
+    embedding_version = models.PositiveIntegerField(default=0)
+    # Вектор новой модели, который считается командой reembed до переключения проекта
+    pending_embedding = models.JSONField(default=None, null=True)
+    # Ячейка сетки SpatialGrid проекта; None — координаты изменились после построения индекса
+    grid_cell = models.IntegerField(null=True, default=None)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     cluster = models.ForeignKey(
@@ -29,35 +52,73 @@ class Complaint(models.Model):
         default=1,
         on_delete=models.SET_DEFAULT)
 
-    def call_gigachat_embeddings(self, text=None, giga_client=None):
+    class Meta:
+        indexes = [models.Index(fields=['project', 'grid_cell'])]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Координаты на момент загрузки: по ним save() узнаёт, что ячейка индекса устарела
+        if 'x' in field_names and 'y' in field_names:
+            instance._indexed_xy = (instance.x, instance.y)
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.grid_cell is not None and getattr(self, '_indexed_xy', None) != (self.x, self.y):
+            self.grid_cell = None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'grid_cell'}
+        super().save(*args, **kwargs)
+        self._indexed_xy = (self.x, self.y)
+
+    def set_embedding(self, vector, provider, version):
+        """Сохраняет вектор вместе с провайдером, моделью, размерностью и версией"""
+        self.embedding = vector
+        self.embedding_provider = provider.name
+        self.embedding_model = provider.model
+        self.embedding_dim = len(vector)
+        self.embedding_version = version
+
+    def compute_embedding(self, text=None, provider=None):
+        """
+        Embed the complaint text with the given provider (the project one by default).
+
+        Raises:
+            CircuitOpenError: if the provider circuit is open
+            GigaChatException: if the embedding could not be generated
+        """
         try:
             # Проверяем, что text не пустой
             if not text or not isinstance(text, str):
                 text = self.text
-                
+
             if not text or not isinstance(text, str):
                 raise ValueError("Text must be a non-empty string")
-            
-            # Если клиент не передан, создаем новый экземпляр
-            if giga_client is None:
-                giga_client = GigaChat(credentials=gigachat_token, verify_ssl_certs=False)
-                
-            response = giga_client.embeddings(text)
-            self.embedding = response.data[0].embedding
+
+            project_provider, version = project_embedding(self.project_id)
+            provider = provider or project_provider
+            self.set_embedding(provider.embed([text])[0], provider, version)
             return self.embedding
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"Error generating embeddings: {str(e)}")
             raise GigaChatException(f"Ошибка генерации: {str(e)}")
-    
+
+    def call_gigachat_embeddings(self, text=None, giga_client=None):
+        """Эмбеддинг через GigaChat независимо от активного провайдера"""
+        return self.compute_embedding(text, GigaChatEmbeddingProvider(giga_client))
+
     @staticmethod
-    def batch_process_embeddings(complaints: List['Complaint'], texts: List[str], giga_client) -> List['Complaint']:
+    def batch_process_embeddings(complaints: List['Complaint'], texts: List[str], provider=None) -> List['Complaint']:
         """
         Process embeddings for multiple complaints in a batch.
         
         Args:
             complaints (List[Complaint]): List of complaint objects to process
             texts (List[str]): List of complaint texts for embedding
-            giga_client: GigaChat client instance
+            provider: EmbeddingProvider (the project one by default) or a GigaChat client instance
             
         Returns:
             List[Complaint]: List of processed complaints with embeddings
@@ -67,13 +128,222 @@ class Complaint(models.Model):
         
         if not complaints:
             return []
+
+        project_provider, version = project_embedding(complaints[0].project_id)
+        if provider is None:
+            provider = project_provider
+        elif not isinstance(provider, EmbeddingProvider):
+            provider = GigaChatEmbeddingProvider(provider)
             
         processed_complaints = []
 
-        batch_response = giga_client.embeddings(texts)
-        for i, (complaint, text) in enumerate(zip(complaints, texts)):
-            complaint.embedding = batch_response.data[i].embedding
+        vectors = provider.embed(texts)
+        for complaint, vector in zip(complaints, vectors):
+            complaint.set_embedding(vector, provider, version)
             processed_complaints.append(complaint)
             
-        logger.info(f"Batch processed {len(complaints)} complaints for embeddings")
-        return processed_complaints
\ No newline at end of file
+        logger.info(f"Batch processed {len(complaints)} complaints for embeddings ({provider.name})")
+        return processed_complaints
+
+    @staticmethod
+    def place_by_neighbours(complaints: List['Complaint']) -> int:
+        """
+        Compute coordinates of embedded complaints from their nearest laid-out neighbours.
+
+        Every complaint is placed at the inverse-distance weighted mean of the
+        coordinates of its nearest complaints of the same project that already
+        have layout coordinates, in one vectorized pass per project. Complaints
+        without an embedding or without anchors keep their coordinates.
+
+        Args:
+            complaints (List[Complaint]): complaints with embeddings, saved or not
+
+        Returns:
+            int: number of placed complaints
+        """
+        groups = defaultdict(list)
+        for complaint in complaints:
+            if isinstance(complaint.embedding, list) and complaint.embedding_dim:
+                groups[(complaint.project_id, complaint.embedding_version, complaint.embedding_dim)].append(complaint)
+
+        placed = 0
+        for (project_id, version, dim), group in groups.items():
+            anchor_ids, anchor_vectors, anchor_coordinates = placement_anchors(project_id, version, dim)
+            # Уже сохранённые жалобы группы не служат опорными точками сами себе
+            keep = ~np.isin(anchor_ids, [complaint.id for complaint in group if complaint.id])
+            if not keep.any():
+                continue
+            coordinates = knn_place(
+                anchor_vectors[keep],
+                anchor_coordinates[keep],
+                np.array([complaint.embedding for complaint in group], dtype=np.float32),
+            )
+            for complaint, (x, y) in zip(group, coordinates):
+                complaint.x, complaint.y = float(x), float(y)
+                complaint.in_layout = True
+            placed += len(group)
+        return placed
+
+
+def placement_anchors(project_id, version, dim):
+    """
+    Sample of laid-out complaints of a project used by ``Complaint.place_by_neighbours``.
+
+    At most ``MAX_PLACEMENT_ANCHORS`` complaints, spread evenly by id. The
+    sample is kept in the process until the project gets a new layout run, so
+    placing every created complaint does not reload and parse the embeddings.
+    Projects without layout runs are cached per data version.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: ids, (n, dim) embeddings and (n, 2) coordinates
+    """
+    layout = LayoutRun.objects.filter(project_id=project_id).order_by('-id').values_list('id', 'created_at').first()
+    if layout is None:
+        layout = Project.objects.filter(id=project_id).values_list('data_version', 'created_at').first()
+    key = (project_id, version, dim, layout)
+    with _anchor_cache_lock:
+        if key in _anchor_cache:
+            _anchor_cache.move_to_end(key)
+            return _anchor_cache[key]
+
+    anchors = Complaint.objects.filter(
+        project_id=project_id, in_layout=True, embedding_version=version, embedding_dim=dim)
+    # Равномерная выборка опорных точек по id, чтобы не загружать эмбеддинги всего проекта
+    anchor_ids = list(anchors.order_by('id').values_list('id', flat=True))
+    step = max(1, -(-len(anchor_ids) // MAX_PLACEMENT_ANCHORS))
+    rows = list(Complaint.objects.filter(id__in=anchor_ids[::step]).order_by('id').values_list('id', 'embedding', 'x', 'y'))
+    anchors = (
+        np.array([row[0] for row in rows], dtype=np.int64),
+        np.array([row[1] for row in rows], dtype=np.float32).reshape(len(rows), dim),
+        np.array([row[2:] for row in rows], dtype=np.float64).reshape(len(rows), 2),
+    )
+    with _anchor_cache_lock:
+        _anchor_cache[key] = anchors
+        while len(_anchor_cache) > ANCHOR_CACHE_SIZE:
+            _anchor_cache.popitem(last=False)
+    return anchors
+
+
+class EmbeddingMigration(models.Model):
+    """
+    Progress of re-embedding a project with a new model.
+
+    New vectors are written to ``Complaint.pending_embedding`` in id order,
+    so an interrupted run resumes after ``last_id``. Reads keep using the old
+    vectors until the project is switched over.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    provider = models.CharField(max_length=50)
+    model = models.CharField(max_length=100)
+    version = models.PositiveIntegerField()
+    last_id = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, default=None)
+
+
+class LayoutRun(models.Model):
+    """
+    Coordinates produced by one layout run, reusable while the embedding set is unchanged.
+
+    ``key`` combines the fingerprint of the project's embedding set with the
+    engine and its parameters; ids and coordinates are stored as packed
+    int64/float64 arrays.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    key = models.CharField(max_length=64, db_index=True)
+    fingerprint = models.CharField(max_length=64)
+    engine = models.CharField(max_length=20)
+    params = models.JSONField(default=dict)
+    n_points = models.IntegerField()
+    ids = models.BinaryField()
+    coordinates = models.BinaryField()
+    timings = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def arrays(self):
+        """Идентификаторы жалоб и их координаты (n, 2)"""
+        return (np.frombuffer(bytes(self.ids), dtype=np.int64),
+                np.frombuffer(bytes(self.coordinates), dtype=np.float64).reshape(-1, 2))
+
+
+class SpatialGrid(models.Model):
+    """
+    Uniform grid over the layout of a project.
+
+    Every complaint stores the number of its cell (``row * side + col``) in
+    ``Complaint.grid_cell``; a bounding box query turns into a few index
+    ranges on ``(project, grid_cell)``. Points outside the grid bounds are
+    clamped to the border cells. Rebuilt whenever a layout is written.
+    """
+    project = models.OneToOneField(Project, on_delete=models.CASCADE)
+    min_x = models.FloatField()
+    min_y = models.FloatField()
+    cell_width = models.FloatField()
+    cell_height = models.FloatField()
+    side = models.IntegerField()
+    n_points = models.IntegerField()
+    built_at = models.DateTimeField(auto_now=True)
+
+    def cell_of(self, x, y):
+        """Столбец и строка ячейки для координат (массивов координат), прижатые к границам сетки"""
+        col = np.clip(np.floor((np.asarray(x) - self.min_x) / self.cell_width), 0, self.side - 1)
+        row = np.clip(np.floor((np.asarray(y) - self.min_y) / self.cell_height), 0, self.side - 1)
+        return col.astype(np.int64), row.astype(np.int64)
+
+
+class TilePyramid(models.Model):
+    """
+    Multi-resolution aggregation of a project layout for drawing at low zoom.
+
+    Zoom level ``z`` splits the square ``[min_x, min_x + extent] x
+    [min_y, min_y + extent]`` into ``2**z x 2**z`` tiles of ``tile_size x
+    tile_size`` cells. Recreated (with a new id) whenever coordinates or
+    cluster labels change.
+    """
+    project = models.OneToOneField(Project, on_delete=models.CASCADE)
+    min_x = models.FloatField()
+    min_y = models.FloatField()
+    extent = models.FloatField()
+    tile_size = models.IntegerField()
+    max_zoom = models.IntegerField()
+    n_points = models.IntegerField()
+    built_at = models.DateTimeField(auto_now_add=True)
+
+
+class AggregateTile(models.Model):
+    """
+    Non-empty cells of one tile: ``n`` (uint32), then ``n`` point counts
+    (uint32), dominant cluster ids (int32, -1 for no cluster) and cell
+    indices ``row * tile_size + col`` inside the tile (uint16), little-endian.
+    """
+    pyramid = models.ForeignKey(TilePyramid, on_delete=models.CASCADE, related_name='tiles')
+    zoom = models.IntegerField()
+    tx = models.IntegerField()
+    ty = models.IntegerField()
+    n_points = models.IntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        unique_together = ('pyramid', 'zoom', 'tx', 'ty')
+
+
+class ChangeLog(models.Model):
+    """
+    One write to the complaints or clusters of a project.
+
+    ``version`` is the project's ``data_version`` right after the write, so
+    the log holds exactly one entry per version. ``ids`` are the written
+    rows as zlib-compressed deltas of the sorted ids (see ``changes.pack_ids``);
+    None means any row of the model may have changed.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    version = models.PositiveBigIntegerField()
+    model = models.CharField(max_length=20)
+    ids = models.BinaryField(null=True, default=None)
+    columns = models.JSONField(default=list)
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['project', 'version'])]
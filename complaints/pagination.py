@@ -0,0 +1,23 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """
+    Keyset pagination by id, enabled only when the client asks for it with
+    ``?page_size=`` or ``?cursor=``; without them the full list is returned
+    as before.
+    """
+    ordering = 'id'
+    page_size = 1000
+    page_size_query_param = 'page_size'
+    max_page_size = 10000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class NewestFirstCursorPagination(OptionalCursorPagination):
+    ordering = '-id'
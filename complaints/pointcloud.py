@@ -0,0 +1,93 @@
+import json
+import struct
+
+import numpy as np
+
+from clusters.models import Cluster
+from projects.models import Project
+from .models import Complaint
+
+MAGIC = b'PCLD'
+FORMAT_VERSION = 1
+# Массивы выравниваются по 4 байта, чтобы браузер мог читать их через Float32Array/Int32Array без копирования
+ALIGNMENT = 4
+# Кластер точки без кластера
+NO_CLUSTER = -1
+
+
+def _pad(data):
+    return data + b' ' * (-len(data) % ALIGNMENT)
+
+
+def pack_point_cloud(project_id):
+    """
+    Pack every complaint of a project for drawing: ids, coordinates and clusters.
+
+    Layout of the payload (little-endian)::
+
+        b'PCLD' | uint32 header length | JSON header padded to 4 bytes | arrays
+
+    The header holds the point count, the offset and length of every array
+    and the cluster list, so the page needs no second request, plus the
+    project's ``data_version`` to ask ``changes/`` for later deltas. Arrays are
+    ``id`` (int32), ``x`` and ``y`` (float32) and ``cluster`` (int32, -1
+    for complaints without a cluster).
+
+    Returns:
+        bytes: packed point cloud
+    """
+    # Версия читается до данных: изменения, сделанные во время чтения, придут в следующей дельте
+    version = Project.objects.filter(id=project_id).values_list('data_version', flat=True).first() or 0
+    rows = Complaint.objects.filter(project_id=project_id).order_by('id').values_list('id', 'x', 'y', 'cluster_id')
+    count = rows.count()
+    ids = np.empty(count, dtype='<i4')
+    xs = np.empty(count, dtype='<f4')
+    ys = np.empty(count, dtype='<f4')
+    clusters = np.empty(count, dtype='<i4')
+    n = 0
+    for complaint_id, x, y, cluster_id in rows.iterator(chunk_size=5000):
+        if n == count:
+            break
+        ids[n], xs[n], ys[n] = complaint_id, x, y
+        clusters[n] = NO_CLUSTER if cluster_id is None else cluster_id
+        n += 1
+    arrays = {'id': ids[:n], 'x': xs[:n], 'y': ys[:n], 'cluster': clusters[:n]}
+
+    descriptors = []
+    offset = 0
+    for name, array in arrays.items():
+        descriptors.append({'name': name, 'dtype': array.dtype.str, 'offset': offset, 'length': len(array)})
+        offset += array.nbytes
+    header = {
+        'version': FORMAT_VERSION,
+        'data_version': version,
+        'count': n,
+        'arrays': descriptors,
+        'clusters': list(
+            Cluster.objects.filter(project_id=project_id).order_by('id')
+            .values('id', 'name', 'summary', 'keywords', 'size')),
+    }
+    header = _pad(json.dumps(header, ensure_ascii=False).encode('utf-8'))
+    return b''.join([MAGIC, struct.pack('<I', len(header)), header] + [array.tobytes() for array in arrays.values()])
+
+
+def unpack_point_cloud(data):
+    """
+    Inverse of ``pack_point_cloud``.
+
+    Returns:
+        Tuple[dict, Dict[str, np.ndarray]]: header and arrays by name
+
+    Raises:
+        ValueError: if the payload is not a packed point cloud
+    """
+    if data[:4] != MAGIC:
+        raise ValueError("Not a point cloud payload")
+    (header_length,) = struct.unpack_from('<I', data, 4)
+    start = 8 + header_length
+    header = json.loads(data[8:start].decode('utf-8'))
+    arrays = {
+        item['name']: np.frombuffer(data, dtype=item['dtype'], count=item['length'], offset=start + item['offset'])
+        for item in header['arrays']
+    }
+    return header, arrays
@@ -24,7 +24,46 @@ class ProjectValidatorSerializer(serializers.ModelSerializer):
         
         return data
 
-class ComplaintSerializer(ProjectValidatorSerializer):
+class FieldProjectionMixin:
+    """
+    Поддержка проекции полей: ``?fields=id,x,y`` оставляет в ответе только
+    перечисленные поля, а тяжёлые поля из ``default_excluded`` (векторы)
+    отдаются только по явному запросу.
+
+    Список полей можно передать и через контекст (ключ ``fields``), если
+    у вложенного сериализатора свой параметр запроса.
+    """
+    default_excluded = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'data' in kwargs:
+            # При записи доступны все поля
+            return
+        requested = self.requested_fields(self.context)
+        for name in list(self.fields):
+            if (name not in requested) if requested else (name in self.default_excluded):
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, context):
+        if 'fields' in context:
+            value = context['fields']
+        else:
+            request = context.get('request')
+            value = request.query_params.get('fields') if request is not None else None
+        return {name.strip() for name in value.split(',') if name.strip()} if value else set()
+
+    @classmethod
+    def deferred_fields(cls, context):
+        """Тяжёлые поля, которые не нужно загружать из базы для этого запроса"""
+        requested = cls.requested_fields(context)
+        return [name for name in cls.default_excluded if name not in requested]
+
+
+class ComplaintSerializer(FieldProjectionMixin, ProjectValidatorSerializer):
+    default_excluded = ('embedding', 'pending_embedding')
+
     class Meta:
         model = Complaint
         fields = '__all__'
\ No newline at end of file
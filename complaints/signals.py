@@ -0,0 +1,69 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from clusters.models import Cluster
+from projects.models import Project
+from .bulk import columns_updated, rows_deleted
+from .changes import record_changes
+from .models import Complaint
+
+# Служебные поля: их запись не меняет данные, которые отдаёт API
+UNVERSIONED_FIELDS = {'grid_cell', 'pending_embedding'}
+# Порция id при поиске проектов изменённых строк
+PROJECT_LOOKUP_CHUNK = 5000
+
+
+@receiver(post_save, sender=Complaint)
+@receiver(post_save, sender=Cluster)
+def log_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= UNVERSIONED_FIELDS:
+        return
+    record_changes([instance.project_id], sender, [instance.pk], update_fields or ())
+
+
+def _deleted_with_project(origin):
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, Project)
+
+
+@receiver(post_delete, sender=Complaint)
+@receiver(post_delete, sender=Cluster)
+def log_delete(sender, instance, origin=None, **kwargs):
+    # При удалении проекта его журнал удаляется вместе с ним: записывать в него нечего
+    if origin is not None and _deleted_with_project(origin):
+        return
+    record_changes([instance.project_id], sender, [instance.pk], deleted=True)
+
+
+@receiver(post_delete, sender=Project)
+def log_project_delete(sender, instance, **kwargs):
+    # Жалобы и кластеры удалённого проекта переносятся в проект по умолчанию (SET_DEFAULT)
+    # одним UPDATE без сигналов, поэтому его карта перезагружается целиком
+    for model in (Complaint, Cluster):
+        default_project_id = model._meta.get_field('project').get_default()
+        if default_project_id != instance.pk:
+            record_changes([default_project_id], model)
+
+
+@receiver(columns_updated)
+def log_bulk_update(sender, ids, columns, project_id=None, **kwargs):
+    if set(columns) <= UNVERSIONED_FIELDS or sender not in (Complaint, Cluster):
+        return
+    if project_id is not None:
+        project_ids = [project_id]
+    else:
+        project_ids = set()
+        for start in range(0, len(ids), PROJECT_LOOKUP_CHUNK):
+            project_ids.update(sender.objects.filter(id__in=ids[start:start + PROJECT_LOOKUP_CHUNK])
+                               .values_list('project_id', flat=True).distinct())
+    # Массовая запись — одна запись журнала со сжатым списком id
+    record_changes(project_ids, sender, ids, columns)
+
+
+@receiver(rows_deleted)
+def log_bulk_delete(sender, project_ids, **kwargs):
+    if sender not in (Complaint, Cluster):
+        return
+    # Удалённые строки не перечислены: клиенты перезагружают модель целиком
+    record_changes(project_ids, sender, deleted=True)
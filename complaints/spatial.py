@@ -0,0 +1,114 @@
+import logging
+import time
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+
+from .bulk import bulk_update_columns
+from .models import Complaint, SpatialGrid
+
+logger = logging.getLogger(__name__)
+
+# Среднее число точек в ячейке, по нему выбирается размер сетки
+CELL_POINTS = 64
+MAX_GRID_SIDE = 1024
+# Если прямоугольник задевает больше строк сетки, запрос идёт одним диапазоном ячеек
+MAX_ROW_RANGES = 64
+# Прямоугольник больше этой доли сетки читается без индекса: почти все точки и так подходят
+MAX_INDEXED_SHARE = 0.25
+DEFAULT_BOX_LIMIT = 5000
+MAX_BOX_LIMIT = 50000
+
+
+def grid_side(n_points):
+    """Число ячеек по каждой оси, чтобы в ячейке было в среднем CELL_POINTS точек"""
+    return int(np.clip(np.ceil(np.sqrt(n_points / CELL_POINTS)), 1, MAX_GRID_SIDE))
+
+
+def project_points(project_id):
+    """
+    Coordinates and clusters of all complaints of a project, read straight into arrays.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: ids (n,), coordinates (n, 2)
+        and cluster ids (n,), -1 for complaints without a cluster
+    """
+    rows = Complaint.objects.filter(project_id=project_id).values_list('id', 'x', 'y', 'cluster_id')
+    total = rows.count()
+    ids = np.empty(total, dtype=np.int64)
+    coordinates = np.empty((total, 2))
+    clusters = np.empty(total, dtype=np.int64)
+    count = 0
+    for complaint_id, x, y, cluster_id in rows.iterator(chunk_size=5000):
+        if count == total:
+            break
+        ids[count], coordinates[count] = complaint_id, (x, y)
+        clusters[count] = -1 if cluster_id is None else cluster_id
+        count += 1
+    return ids[:count], coordinates[:count], clusters[:count]
+
+
+def rebuild_spatial_index(project_id):
+    """
+    Rebuild the grid of a project from the current coordinates of its complaints.
+
+    Returns:
+        SpatialGrid: the new grid, or None if the project has no complaints
+    """
+    started = time.perf_counter()
+    ids, coordinates, _ = project_points(project_id)
+    count = len(ids)
+    if not count:
+        SpatialGrid.objects.filter(project_id=project_id).delete()
+        return None
+
+    side = grid_side(count)
+    low, high = coordinates.min(axis=0), coordinates.max(axis=0)
+    # Вырожденная ось (все точки на одной прямой) получает ячейку единичного размера
+    size = np.where(high > low, (high - low) / side, 1.0)
+    grid = SpatialGrid(project_id=project_id, min_x=low[0], min_y=low[1],
+                       cell_width=size[0], cell_height=size[1], side=side, n_points=count)
+    col, row = grid.cell_of(coordinates[:, 0], coordinates[:, 1])
+
+    with transaction.atomic():
+        bulk_update_columns(Complaint, ids, {'grid_cell': row * side + col}, project_id=project_id)
+        SpatialGrid.objects.filter(project_id=project_id).delete()
+        grid.save()
+    logger.info(f"Spatial index of project {project_id}: {side}x{side} grid over {count} complaints "
+                f"in {time.perf_counter() - started:.2f}s")
+    return grid
+
+
+def points_in_box(project_id, x0, y0, x1, y1, limit=DEFAULT_BOX_LIMIT):
+    """
+    Complaints of a project whose coordinates lie inside the box.
+
+    Only the grid cells the box touches are read; complaints moved since the
+    last rebuild (``grid_cell`` is None) are checked by their coordinates.
+    At most ``limit`` points are returned, in id order, so a truncated answer
+    is an even sample rather than one corner of the box.
+
+    Returns:
+        Tuple[List[tuple], bool]: (id, x, y, cluster_id) rows and whether the result was truncated
+    """
+    x0, x1 = sorted((x0, x1))
+    y0, y1 = sorted((y0, y1))
+    queryset = Complaint.objects.filter(
+        project_id=project_id, x__gte=x0, x__lte=x1, y__gte=y0, y__lte=y1
+    ).values_list('id', 'x', 'y', 'cluster_id')
+    grid = SpatialGrid.objects.filter(project_id=project_id).first()
+    if grid is not None:
+        (c0, c1), (r0, r1) = grid.cell_of([x0, x1], [y0, y1])
+        covered = (c1 - c0 + 1) * (r1 - r0 + 1)
+    if grid is not None and covered <= MAX_INDEXED_SHARE * grid.side ** 2:
+        if r1 - r0 + 1 > MAX_ROW_RANGES:
+            ranges = [(r0 * grid.side + c0, r1 * grid.side + c1)]
+        else:
+            ranges = [(row * grid.side + c0, row * grid.side + c1) for row in range(r0, r1 + 1)]
+        # Каждый диапазон — отдельный SELECT: в UNION ALL планировщик SQLite берёт индекс
+        # (project, grid_cell) для каждой части, а не общий индекс по проекту
+        parts = [queryset.filter(grid_cell__range=cells) for cells in ranges]
+        queryset = queryset.filter(grid_cell__isnull=True).union(*parts, all=True)
+    rows = list(queryset.order_by('id')[:limit + 1])
+    return rows[:limit], len(rows) > limit
@@ -2,7 +2,20 @@ from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
-from complaints.models import Complaint
+from django.core.management import call_command
+from complaints.models import Complaint, EmbeddingMigration, LayoutRun, SpatialGrid
+from unittest.mock import patch
+import importlib
+from complaints.embeddings import HashingEmbeddingProvider, get_embedding_provider
+from complaints.bulk import bulk_delete, bulk_update_columns
+from complaints.pointcloud import unpack_point_cloud
+from complaints.spatial import rebuild_spatial_index
+from complaints.tiles import rebuild_tiles, unpack_tile
+from complaints.changes import pack_ids, unpack_ids
+from complaints.models import AggregateTile, ChangeLog
+from clusters.models import Cluster
+from complaints.layout import compute_layout, choose_engine, knn_place, select_landmarks
+import numpy as np
 from projects.models import Project
 
 
@@ -36,6 +49,20 @@ class ComplaintsAPITests(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 2)
+        # Эмбеддинги не отдаются без явного запроса
+        self.assertNotIn('embedding', response.data[0])
+
+    def test_complaints_cursor_pagination_and_fields(self):
+        """Тест постраничной выдачи по курсору и проекции полей"""
+        url = reverse('complaint-list-create', kwargs={'project_id': self.project.id})
+        response = self.client.get(url, {'page_size': 1, 'fields': 'id,x,y,embedding'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.complaint1.id])
+        self.assertEqual(set(response.data['results'][0]), {'id', 'x', 'y', 'embedding'})
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['id'] for row in response.data['results']], [self.complaint2.id])
+        self.assertIsNone(response.data['next'])
 
     def test_create_complaint(self):
         """Тест создания новой жалобы через API"""
@@ -59,4 +86,336 @@ class ComplaintsAPITests(TestCase):
         new_complaint = Complaint.objects.get(email='new@example.com')
         self.assertEqual(new_complaint.name, 'New API Complaint')
         self.assertEqual(new_complaint.text, 'This is a new complaint via API')
-        self.assertEqual(new_complaint.project, self.project)
\ No newline at end of file
+        self.assertEqual(new_complaint.project, self.project)
+
+
+    def test_bulk_update_columns(self):
+        """Тест массовой записи столбцов по массивам id и значений"""
+        ids = [self.complaint1.id, self.complaint2.id]
+        written = bulk_update_columns(Complaint, ids, {
+            'x': np.array([1.5, 2.5]),
+            'in_layout': np.array([True, False]),
+            'pending_embedding': [[0.1, 0.2], None],
+        })
+        self.assertEqual(written, 2)
+        self.complaint1.refresh_from_db()
+        self.complaint2.refresh_from_db()
+        self.assertEqual((self.complaint1.x, self.complaint1.in_layout), (1.5, True))
+        self.assertEqual(self.complaint1.pending_embedding, [0.1, 0.2])
+        self.assertEqual((self.complaint2.x, self.complaint2.pending_embedding), (2.5, None))
+        with self.assertRaises(ValueError):
+            bulk_update_columns(Complaint, ids, {'x': np.array([1.0])})
+
+
+    def test_point_cloud(self):
+        """Тест упакованного облака точек и ответа 304 по ETag"""
+        cluster = Cluster.objects.create(name="Доставка", summary="", project=self.project, size=1)
+        Complaint.objects.filter(id=self.complaint1.id).update(x=1.25, y=-2.5, cluster=cluster)
+        url = reverse('point-cloud', kwargs={'project_id': self.project.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        header, arrays = unpack_point_cloud(response.content)
+        self.assertEqual(header['count'], 2)
+        self.assertEqual([item['name'] for item in header['clusters']], ["Доставка"])
+        self.assertEqual(arrays['id'].tolist(), [self.complaint1.id, self.complaint2.id])
+        self.assertEqual((arrays['x'][0], arrays['y'][0]), (1.25, -2.5))
+        self.assertEqual(arrays['cluster'].tolist(), [cluster.id, -1])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+    def test_points_in_box(self):
+        """Тест выборки точек в прямоугольнике по сеточному индексу"""
+        points = np.random.default_rng(0).uniform(-10, 10, size=(2000, 2))
+        Complaint.objects.bulk_create([
+            Complaint(text="Точка", x=x, y=y, project=self.project) for x, y in points])
+        grid = rebuild_spatial_index(self.project.id)
+        self.assertGreater(grid.side, 2)
+        # Перемещённая после построения индекса жалоба находится по координатам
+        moved = Complaint.objects.filter(project=self.project).order_by('-id').first()
+        moved.x, moved.y = 0.5, 0.5
+        moved.save()
+        self.assertIsNone(moved.grid_cell)
+
+        url = reverse('points-in-box', kwargs={'project_id': self.project.id})
+        response = self.client.get(url, {'x0': 0, 'y0': 0, 'x1': 2, 'y1': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = Complaint.objects.filter(project=self.project, x__gte=0, x__lte=2, y__gte=0, y__lte=2)
+        self.assertEqual(response.json()['id'], list(expected.order_by('id').values_list('id', flat=True)))
+        self.assertIn(moved.id, response.json()['id'])
+        self.assertFalse(response.json()['truncated'])
+
+        response = self.client.get(url, {'x0': -10, 'y0': -10, 'x1': 10, 'y1': 10, 'limit': 5})
+        self.assertEqual((response.json()['count'], response.json()['truncated']), (5, True))
+        self.assertEqual(self.client.get(url, {'x0': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_data_version_etag_and_cache(self):
+        """Тест версии данных проекта: ETag, ответ 304 и кэш ответа до следующей записи"""
+        url = reverse('complaint-list-create', kwargs={'project_id': self.project.id})
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        # Повторный запрос отдаётся из кэша: только чтение версии проекта
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).content, response.content)
+
+        def version():
+            return Project.objects.get(id=self.project.id).data_version
+
+        before = version()
+        bulk_update_columns(Complaint, [self.complaint1.id], {'grid_cell': np.array([3])})
+        self.assertEqual(version(), before)
+        bulk_update_columns(Complaint, [self.complaint1.id], {'x': np.array([7.0])})
+        self.assertEqual(version(), before + 1)
+        self.complaint2.save()
+        self.assertEqual(version(), before + 2)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data[0]['x'], 7.0)
+
+
+    def test_changes_feed(self):
+        """Тест ленты изменений: только строки, изменённые после версии, и полная перезагрузка при пропуске"""
+        self.assertEqual(unpack_ids(pack_ids([9, 3, 4, 3])).tolist(), [3, 4, 9])
+        cluster = Cluster.objects.create(name="Доставка", summary="", project=self.project, size=0)
+        third = Complaint.objects.create(text="Третья", project=self.project)
+        since = Project.objects.get(id=self.project.id).data_version
+
+        bulk_update_columns(Complaint, [self.complaint1.id, third.id], {
+            'x': np.array([1.0, 2.0]), 'cluster': np.array([cluster.id, cluster.id])})
+        deleted_id = self.complaint2.id
+        self.complaint2.delete()
+        cluster.name = "Доставка и возвраты"
+        cluster.save()
+
+        url = reverse('changes-feed', kwargs={'project_id': self.project.id})
+        delta = self.client.get(url, {'since': since}).json()
+        self.assertEqual(delta['version'], since + 3)
+        self.assertFalse(delta['complaints']['reset'])
+        self.assertEqual(delta['complaints']['changed'], [
+            {'id': self.complaint1.id, 'x': 1.0, 'y': 0.0, 'cluster': cluster.id},
+            {'id': third.id, 'x': 2.0, 'y': 0.0, 'cluster': cluster.id},
+        ])
+        self.assertEqual(delta['complaints']['deleted'], [deleted_id])
+        self.assertEqual([row['name'] for row in delta['clusters']['changed']], ["Доставка и возвраты"])
+
+        empty = self.client.get(url, {'since': delta['version']}).json()
+        self.assertEqual((empty['complaints']['changed'], empty['clusters']['changed']), ([], []))
+        # Запись в обход журнала: дельта недоступна, клиент перезагружает данные целиком
+        Project.objects.filter(id=self.project.id).update(data_version=delta['version'] + 1)
+        self.assertTrue(self.client.get(url, {'since': since}).json()['complaints']['reset'])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_delete_project(self):
+        """Тест удаления проекта: его жалобы и кластеры переходят в проект по умолчанию, который перезагружается"""
+        other = Project.objects.create()
+        cluster = Cluster.objects.create(name="Доставка", summary="", project=other, size=1)
+        moved = Complaint.objects.create(text="Жалоба другого проекта", project=other, cluster=cluster)
+        self.assertTrue(ChangeLog.objects.filter(project=other).exists())
+        since = Project.objects.get(id=self.project.id).data_version
+
+        other.delete()
+
+        self.assertFalse(ChangeLog.objects.filter(project_id=other.id).exists())
+        moved.refresh_from_db()
+        self.assertEqual(moved.project_id, self.project.id)
+        url = reverse('changes-feed', kwargs={'project_id': self.project.id})
+        delta = self.client.get(url, {'since': since}).json()
+        self.assertTrue(delta['complaints']['reset'])
+        self.assertTrue(delta['clusters']['reset'])
+
+
+    def test_bulk_delete(self):
+        """Тест массового удаления: один DELETE без сигналов на строку и одна запись журнала на проект"""
+        since = Project.objects.get(id=self.project.id).data_version
+        with patch('complaints.signals.record_changes') as mock_record:
+            self.assertEqual(bulk_delete(Complaint.objects.filter(project=self.project)), 2)
+        mock_record.assert_called_once_with({self.project.id}, Complaint, deleted=True)
+        self.assertFalse(Complaint.objects.exists())
+
+        Complaint.objects.create(text="Новая", project=self.project)
+        bulk_delete(Complaint.objects.all())
+        url = reverse('changes-feed', kwargs={'project_id': self.project.id})
+        self.assertTrue(self.client.get(url, {'since': since}).json()['complaints']['reset'])
+        with self.assertRaises(ValueError):
+            bulk_delete(Cluster.objects.all())
+
+class EmbeddingProviderTests(TestCase):
+    def test_hashing_provider_is_deterministic(self):
+        """Тест локального провайдера: одинаковый текст даёт одинаковый вектор"""
+        provider = HashingEmbeddingProvider(dim=32)
+        first, second, other = provider.embed(["Задержка доставки", "Задержка доставки", "Списали деньги"])
+        self.assertEqual(len(first), 32)
+        self.assertEqual(first, HashingEmbeddingProvider(dim=32).embed(["Задержка доставки"])[0])
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_batch_records_provider_and_model(self):
+        """Тест пакетной обработки: у жалоб сохраняются провайдер и версия модели"""
+        provider = get_embedding_provider('hashing')
+        complaints = [Complaint(text="Первая жалоба"), Complaint(text="Вторая жалоба")]
+        Complaint.batch_process_embeddings(complaints, [c.text for c in complaints], provider)
+        for complaint in complaints:
+            self.assertEqual(len(complaint.embedding), provider.dim)
+            self.assertEqual(complaint.embedding_dim, provider.dim)
+            self.assertEqual(complaint.embedding_provider, 'hashing')
+            self.assertEqual(complaint.embedding_model, provider.model)
+
+    def test_reembed_resumes_and_switches_atomically(self):
+        """Тест миграции эмбеддингов: старые векторы используются до переключения проекта"""
+        project = Project.objects.create()
+        for i in range(3):
+            Complaint.objects.create(text=f"Жалоба номер {i}", embedding=[0.1, 0.2, 0.3],
+                                     embedding_dim=3, project=project)
+
+        call_command('reembed', project_id=project.id, provider='hashing', batch_size=2, sleep=0, max_batches=1)
+        project.refresh_from_db()
+        self.assertEqual(project.embedding_version, 0)
+        self.assertEqual(EmbeddingMigration.objects.get(project=project).processed, 2)
+        self.assertTrue(all(c.embedding == [0.1, 0.2, 0.3] for c in Complaint.objects.filter(project=project)))
+
+        call_command('reembed', project_id=project.id, provider='hashing', batch_size=2, sleep=0)
+        project.refresh_from_db()
+        provider = get_embedding_provider('hashing')
+        self.assertEqual((project.embedding_provider, project.embedding_version), ('hashing', 1))
+        for complaint in Complaint.objects.filter(project=project):
+            self.assertEqual(len(complaint.embedding), provider.dim)
+            self.assertEqual(complaint.embedding_dim, provider.dim)
+            self.assertEqual(complaint.embedding_version, 1)
+            self.assertEqual(complaint.embedding_model, provider.model)
+            self.assertIsNone(complaint.pending_embedding)
+
+
+class LayoutTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create()
+        rng = np.random.default_rng(0)
+        for i in range(30):
+            center = 0.0 if i % 2 else 5.0
+            Complaint.objects.create(text=f"Жалоба {i}", embedding=(center + rng.normal(size=8)).tolist(),
+                                     embedding_dim=8, project=self.project)
+
+    def test_compute_layout_reports_timings(self):
+        """Тест движка раскладки: координаты для каждой точки и время по фазам"""
+        vectors = np.random.default_rng(1).normal(size=(40, 60))
+        coordinates, timings = compute_layout(vectors, engine='barnes_hut', perplexity=500, max_iter=250)
+        self.assertEqual(coordinates.shape, (40, 2))
+        self.assertEqual(set(timings), {'pca', 'barnes_hut'})
+        self.assertEqual(choose_engine(100), 'barnes_hut')
+        with self.assertRaises(ValueError):
+            compute_layout(vectors, engine='unknown')
+
+    def test_apply_tsne_command(self):
+        """Тест команды applying_T-sne: координаты записываются для всех жалоб проекта"""
+        call_command('applying_T-sne', project_id=self.project.id, perplexity=5, engine='barnes_hut')
+        coordinates = list(Complaint.objects.filter(project=self.project).values_list('x', 'y'))
+        self.assertEqual(len(set(coordinates)), 30)
+        self.assertEqual(SpatialGrid.objects.get(project=self.project).n_points, 30)
+        self.assertFalse(Complaint.objects.filter(project=self.project, grid_cell__isnull=True).exists())
+
+    def test_knn_place_weighted_mean(self):
+        """Тест размещения новой точки по ближайшим соседям"""
+        known = np.array([[0.0, 0.0], [1.0, 0.0], [10.0, 0.0]])
+        coordinates = np.array([[0.0, 0.0], [4.0, 0.0], [100.0, 100.0]])
+        placed = knn_place(known, coordinates, np.array([[0.25, 0.0]]), k=2)
+        # Вес обратно пропорционален расстоянию: 1/0.25 против 1/0.75
+        np.testing.assert_allclose(placed, [[1.0, 0.0]])
+
+    def test_warm_start_keeps_layout(self):
+        """Тест тёплого старта: новые жалобы получают координаты, старые начинают с текущих"""
+        call_command('applying_T-sne', project_id=self.project.id, perplexity=5, engine='barnes_hut')
+        before = dict(Complaint.objects.filter(project=self.project).values_list('id', 'x'))
+        new = Complaint.objects.create(text="Новая жалоба", embedding=[5.0] * 8, embedding_dim=8,
+                                       project=self.project)
+
+        call_command('applying_T-sne', project_id=self.project.id, perplexity=5, engine='barnes_hut',
+                     warm_start=True)
+        new.refresh_from_db()
+        self.assertTrue(new.in_layout)
+        after = dict(Complaint.objects.filter(id__in=before).values_list('id', 'x'))
+        # Карта не перемешивается: порядок точек по оси x в основном сохраняется
+        order_before = sorted(before, key=before.get)
+        order_after = sorted(after, key=after.get)
+        self.assertGreater(np.corrcoef([order_before.index(i) for i in before],
+                                       [order_after.index(i) for i in before])[0, 1], 0.8)
+
+    def test_new_complaints_placed_by_neighbours(self):
+        """Тест размещения новых жалоб рядом с ближайшими соседями без пересчёта раскладки"""
+        call_command('applying_T-sne', project_id=self.project.id, perplexity=5, engine='barnes_hut')
+        new = Complaint(text="Новая жалоба", embedding=[0.0] * 8, embedding_dim=8, project=self.project)
+        self.assertEqual(Complaint.place_by_neighbours([new, Complaint(text="Без эмбеддинга")]), 1)
+        self.assertTrue(new.in_layout)
+        # Точка попадает в пределы своей группы (жалобы с нечётными номерами около нуля)
+        xs = [c.x for c in Complaint.objects.filter(project=self.project) if c.embedding[0] < 2.5]
+        self.assertTrue(min(xs) <= new.x <= max(xs))
+
+        # Опорные точки кэшируются до следующей раскладки: повторное размещение читает только её id
+        again = Complaint(text="Ещё одна", embedding=[0.0] * 8, embedding_dim=8, project=self.project)
+        with self.assertNumQueries(1):
+            Complaint.place_by_neighbours([again])
+        self.assertEqual((again.x, again.y), (new.x, new.y))
+
+    def test_landmark_layout(self):
+        """Тест режима опорных точек: раскладка строится по выборке, остальные точки интерполируются"""
+        vectors = np.random.default_rng(2).normal(size=(60, 8)).astype(np.float32)
+        self.assertEqual(len(select_landmarks(vectors, 12, 'stratified', np.arange(60) % 3)), 12)
+        self.assertLessEqual(len(select_landmarks(vectors, 12, 'kmeans')), 12)
+        # k-means ограничен LANDMARK_KMEANS_CLUSTERS центрами, опорные точки берутся внутри кластеров
+        with patch('complaints.layout.LANDMARK_KMEANS_CLUSTERS', 3):
+            self.assertEqual(len(select_landmarks(vectors, 12, 'kmeans')), 12)
+
+        call_command('applying_T-sne', project_id=self.project.id, perplexity=3, engine='barnes_hut',
+                     landmarks=12)
+        complaints = Complaint.objects.filter(project=self.project)
+        self.assertTrue(all(complaint.in_layout for complaint in complaints))
+        self.assertGreater(len(set(complaints.values_list('x', 'y'))), 12)
+
+    def test_layout_cache_reused(self):
+        """Тест кэша раскладок: повторный запуск с теми же параметрами не пересчитывает t-SNE"""
+        call_command('applying_T-sne', project_id=self.project.id, perplexity=5, engine='barnes_hut')
+        call_command('applying_T-sne', project_id=self.project.id, perplexity=6, engine='barnes_hut')
+        self.assertEqual(LayoutRun.objects.filter(project=self.project).count(), 2)
+        first = LayoutRun.objects.filter(project=self.project).order_by('id').first()
+        ids, coordinates = first.arrays()
+
+        command = importlib.import_module('complaints.management.commands.applying_T-sne')
+        with patch.object(command, 'compute_layout') as mock_layout:
+            call_command('applying_T-sne', project_id=self.project.id, perplexity=5, engine='barnes_hut')
+            mock_layout.assert_not_called()
+        stored = dict((c.id, (c.x, c.y)) for c in Complaint.objects.filter(id__in=ids.tolist()))
+        self.assertEqual(stored[int(ids[0])], tuple(coordinates[0]))
+
+        # Новая жалоба меняет отпечаток набора эмбеддингов
+        Complaint.objects.create(text="Новая", embedding=[1.0] * 8, embedding_dim=8, project=self.project)
+        call_command('applying_T-sne', project_id=self.project.id, perplexity=5, engine='barnes_hut')
+        self.assertEqual(LayoutRun.objects.filter(project=self.project).count(), 3)
+
+    def test_aggregate_tiles(self):
+        """Тест пирамиды плиток: после раскладки каждый уровень покрывает все точки"""
+        client = APIClient()
+        call_command('applying_T-sne', project_id=self.project.id, perplexity=5, engine='barnes_hut')
+        meta = client.get(reverse('tile-pyramid', kwargs={'project_id': self.project.id})).json()
+        self.assertEqual(meta['n_points'], 30)
+        for zoom in range(meta['max_zoom'] + 1):
+            tiles = AggregateTile.objects.filter(pyramid_id=meta['version'], zoom=zoom)
+            self.assertEqual(sum(int(unpack_tile(bytes(tile.data))[0].sum()) for tile in tiles), 30)
+
+        url = reverse('aggregate-tile', kwargs={'project_id': self.project.id, 'zoom': 0, 'tx': 0, 'ty': 0})
+        counts, dominant, cells = unpack_tile(client.get(url).content)
+        self.assertEqual((int(counts.sum()), set(dominant.tolist())), (30, {-1}))
+        self.assertLess(int(cells.max()), meta['tile_size'] ** 2)
+
+        # После кластеризации доминирующий кластер ячеек меняется
+        cluster = Cluster.objects.create(name="Все", summary="", project=self.project, size=30)
+        Complaint.objects.filter(project=self.project).update(cluster=cluster)
+        pyramid = rebuild_tiles(self.project.id)
+        response = client.get(url)
+        self.assertEqual(response['ETag'], f'"{pyramid.id}-0-0-0"')
+        self.assertEqual(set(unpack_tile(response.content)[1].tolist()), {cluster.id})
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
@@ -0,0 +1,115 @@
+import logging
+import struct
+import time
+
+import numpy as np
+from django.db import transaction
+
+from .models import AggregateTile, TilePyramid
+from .spatial import project_points
+
+logger = logging.getLogger(__name__)
+
+# Ячеек по стороне плитки; индекс ячейки внутри плитки помещается в uint16
+TILE_SIZE = 64
+# На самом подробном уровне 2**MAX_ZOOM плиток по стороне; ближе карта берёт точки через points/bbox/
+MAX_ZOOM = 5
+
+
+def aggregate_level(coordinates, clusters, min_x, min_y, extent, zoom, tile_size=TILE_SIZE):
+    """
+    Histogram points into the cells of one zoom level.
+
+    Points are binned with integer arithmetic and ``np.unique`` over
+    ``(cell, cluster)`` keys, so only non-empty cells are materialised.
+
+    Returns:
+        Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        (tx, ty) -> counts, dominant clusters and cell indices inside the tile
+    """
+    side = tile_size << zoom
+    cells_xy = np.floor((coordinates - (min_x, min_y)) / (extent / side)).astype(np.int64)
+    np.clip(cells_xy, 0, side - 1, out=cells_xy)
+    cells = cells_xy[:, 1] * side + cells_xy[:, 0]
+
+    labels, label_index = np.unique(clusters, return_inverse=True)
+    keys, key_counts = np.unique(cells * len(labels) + label_index.ravel(), return_counts=True)
+    key_cells = keys // len(labels)
+    cells, starts = np.unique(key_cells, return_index=True)
+    counts = np.add.reduceat(key_counts, starts)
+    # Внутри каждой ячейки ключи упорядочиваются по убыванию числа точек: первый — доминирующий кластер
+    order = np.lexsort((-key_counts, key_cells))
+    dominant = labels[keys[order][starts] % len(labels)]
+
+    row, col = cells // side, cells % side
+    tiles = (row // tile_size) * (1 << zoom) + col // tile_size
+    local = ((row % tile_size) * tile_size + col % tile_size).astype(np.uint16)
+    # Ячейки уже отсортированы по строкам сетки; для плиток нужна устойчивая сортировка по номеру плитки
+    order = np.argsort(tiles, kind='stable')
+    tiles, counts, dominant, local = tiles[order], counts[order], dominant[order], local[order]
+    numbers, starts = np.unique(tiles, return_index=True)
+    bounds = list(starts[1:]) + [len(tiles)]
+    return {
+        (int(number % (1 << zoom)), int(number // (1 << zoom))): (counts[start:end], dominant[start:end],
+                                                                    local[start:end])
+        for number, start, end in zip(numbers, starts, bounds)
+    }
+
+
+def pack_tile(counts, dominant, cells):
+    """Упаковывает непустые ячейки плитки в формат AggregateTile.data"""
+    return b''.join([
+        struct.pack('<I', len(counts)),
+        counts.astype('<u4').tobytes(),
+        dominant.astype('<i4').tobytes(),
+        cells.astype('<u2').tobytes(),
+    ])
+
+
+def unpack_tile(data):
+    """
+    Inverse of ``pack_tile``.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: counts, dominant clusters and cell indices
+    """
+    (n,) = struct.unpack_from('<I', data)
+    return (np.frombuffer(data, dtype='<u4', count=n, offset=4),
+            np.frombuffer(data, dtype='<i4', count=n, offset=4 + 4 * n),
+            np.frombuffer(data, dtype='<u2', count=n, offset=4 + 8 * n))
+
+
+def rebuild_tiles(project_id, max_zoom=MAX_ZOOM, tile_size=TILE_SIZE):
+    """
+    Recompute the tile pyramid of a project from its current coordinates and clusters.
+
+    Returns:
+        TilePyramid: the new pyramid, or None if the project has no complaints
+    """
+    started = time.perf_counter()
+    _, coordinates, clusters = project_points(project_id)
+    if not len(coordinates):
+        TilePyramid.objects.filter(project_id=project_id).delete()
+        return None
+
+    low, high = coordinates.min(axis=0), coordinates.max(axis=0)
+    # Квадратная область, чтобы ячейки были квадратными на экране
+    extent = float(max(high - low)) or 1.0
+    pyramid = TilePyramid(project_id=project_id, min_x=low[0], min_y=low[1], extent=extent,
+                          tile_size=tile_size, max_zoom=max_zoom, n_points=len(coordinates))
+    tiles = []
+    for zoom in range(max_zoom + 1):
+        level = aggregate_level(coordinates, clusters, low[0], low[1], extent, zoom, tile_size)
+        for (tx, ty), (counts, dominant, cells) in level.items():
+            tiles.append(AggregateTile(zoom=zoom, tx=tx, ty=ty, n_points=int(counts.sum()),
+                                       data=pack_tile(counts, dominant, cells)))
+
+    with transaction.atomic():
+        TilePyramid.objects.filter(project_id=project_id).delete()
+        pyramid.save()
+        for tile in tiles:
+            tile.pyramid = pyramid
+        AggregateTile.objects.bulk_create(tiles, batch_size=500)
+    logger.info(f"Tile pyramid of project {project_id}: {len(tiles)} tiles, zoom 0-{max_zoom}, "
+                f"{len(coordinates)} complaints in {time.perf_counter() - started:.2f}s")
+    return pyramid
@@ -2,12 +2,18 @@ from django.urls import path
 from .views import (
     ComplaintListCreate, ComplaintDetail, CreateClusterWithComplaints, 
     apply_tsne_api, get_cluster_details, regenerate_summary,
-    add_youtube_api, search_complaints, clusterise
+    add_youtube_api, search_complaints, clusterise, point_cloud,
+    points_in_box_api, tile_pyramid, aggregate_tile, changes_feed
 )
 
 urlpatterns = [
     path('complaints/', ComplaintListCreate.as_view(), name='complaint-list-create'),
     path('complaints/<int:pk>/', ComplaintDetail.as_view(), name='complaint-detail'),
+    path('points/', point_cloud, name='point-cloud'),
+    path('points/bbox/', points_in_box_api, name='points-in-box'),
+    path('changes/', changes_feed, name='changes-feed'),
+    path('tiles/', tile_pyramid, name='tile-pyramid'),
+    path('tiles/<int:zoom>/<int:tx>/<int:ty>/', aggregate_tile, name='aggregate-tile'),
     path('create-cluster/', CreateClusterWithComplaints.as_view(), name='create-cluster'),
     path('apply_tsne/', apply_tsne_api, name='apply_tsne_api'),
     path('clusters/<int:cluster_id>/details/', get_cluster_details, name='cluster-details'),
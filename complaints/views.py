@@ -1,14 +1,23 @@
 from django.shortcuts import render
 from rest_framework import generics
 from clusters.models import Cluster
+from clusters.router import INTERACTIVE_LATENCY_BUDGET
 from .serializers import ComplaintSerializer
-from .models import Complaint
+from .pagination import OptionalCursorPagination
+from .caching import VersionedReadMixin, versioned
+from .models import Complaint, TilePyramid, AggregateTile
+from .layout import ENGINES
+from .pointcloud import pack_point_cloud
+from .spatial import points_in_box, DEFAULT_BOX_LIMIT, MAX_BOX_LIMIT
+from .tiles import pack_tile
+from .changes import changes_since
+import numpy as np
 import random as rnd
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified
 import json
 from django.views.decorators.csrf import csrf_exempt
 from django.core.management import call_command, CommandError
@@ -19,19 +28,22 @@ from projects.models import Project
 from sklearn.metrics.pairwise import cosine_similarity
 logger = logging.getLogger(__name__)
 
-class ComplaintListCreate(generics.ListCreateAPIView):
+class ComplaintListCreate(VersionedReadMixin, generics.ListCreateAPIView):
     serializer_class = ComplaintSerializer
+    pagination_class = OptionalCursorPagination
     
     def get_queryset(self):
         project_id = self.kwargs.get('project_id')
         logger.info(f"ComplaintListCreate.get_queryset called with project_id={project_id}")
+        # Эмбеддинги не загружаются, если их не запросили через fields=
+        deferred = ComplaintSerializer.deferred_fields({'request': self.request})
         
         if project_id:
-            queryset = Complaint.objects.filter(project_id=project_id)
+            queryset = Complaint.objects.filter(project_id=project_id).defer(*deferred)
             logger.info(f"Found {queryset.count()} complaints for project_id={project_id}")
             return queryset
         
-        queryset = Complaint.objects.all()
+        queryset = Complaint.objects.defer(*deferred)
         logger.info(f"Found {queryset.count()} complaints (all)")
         return queryset
     
@@ -40,7 +52,7 @@ class ComplaintListCreate(generics.ListCreateAPIView):
         context.update({'view': self})
         return context
 
-class ComplaintDetail(generics.RetrieveUpdateDestroyAPIView):
+class ComplaintDetail(VersionedReadMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ComplaintSerializer
     
     def get_queryset(self):
@@ -97,7 +109,9 @@ def create_complaint(request, project_id=None):
             
             # Генерируем эмбеддинги для жалобы
             try:
-                new_item.call_gigachat_embeddings()
+                new_item.compute_embedding()
+                # Координаты по ближайшим соседям вместо случайных, без пересчёта всей раскладки
+                Complaint.place_by_neighbours([new_item])
                 new_item.save()
             except Exception as e:
                 logger.error(f"Error generating embeddings for complaint {new_item.id}: {str(e)}")
@@ -162,12 +176,7 @@ class CreateClusterWithComplaints(APIView):
         
         # Генерируем и сохраняем суммаризацию
         try:
-            data = new_cluster.generate_summary(model)
-            new_cluster.name = data[0]
-            new_cluster.summary = data[1]
-            if len(data) > 2:
-                new_cluster.model = data[2]
-            new_cluster.save()
+            new_cluster.refresh_summary(model)
             logger.info(f"Generated summary for cluster id={new_cluster.id}")
         except Exception as e:
             logger.error(f"Error generating summary for cluster id={new_cluster.id}: {str(e)}")
@@ -177,6 +186,78 @@ class CreateClusterWithComplaints(APIView):
             status=status.HTTP_201_CREATED
         )
 
+@versioned
+def point_cloud(request, project_id):
+    """Все точки проекта упакованными массивами вместе со списком кластеров (см. pointcloud.py)"""
+    return HttpResponse(pack_point_cloud(project_id), content_type='application/octet-stream')
+
+def points_in_box_api(request, project_id):
+    """Точки проекта внутри прямоугольника x0..x1, y0..y1 (не больше limit) по пространственному индексу"""
+    try:
+        box = [float(request.GET[name]) for name in ('x0', 'y0', 'x1', 'y1')]
+        limit = int(request.GET.get('limit', DEFAULT_BOX_LIMIT))
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Нужны числовые параметры x0, y0, x1, y1 и limit"}, status=400)
+    limit = max(1, min(limit, MAX_BOX_LIMIT))
+
+    rows, truncated = points_in_box(project_id, *box, limit=limit)
+    ids, xs, ys, clusters = zip(*rows) if rows else ((), (), (), ())
+    # Столбцы вместо списка объектов: ответ в несколько раз короче
+    return JsonResponse({
+        'count': len(rows),
+        'truncated': truncated,
+        'id': ids,
+        'x': xs,
+        'y': ys,
+        'cluster': clusters,
+    })
+
+@versioned
+def changes_feed(request, project_id):
+    """Жалобы и кластеры проекта, изменённые после версии данных since (см. changes.py)"""
+    try:
+        since = int(request.GET['since'])
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Нужен целочисленный параметр since"}, status=400)
+    if since < 0:
+        return JsonResponse({"error": "Параметр since не может быть отрицательным"}, status=400)
+    try:
+        return JsonResponse(changes_since(project_id, since))
+    except Project.DoesNotExist:
+        return JsonResponse({"error": "Проект не найден"}, status=404)
+
+def tile_pyramid(request, project_id):
+    """Границы и параметры пирамиды плиток проекта, по ним клиент вычисляет номера видимых плиток"""
+    pyramid = get_object_or_404(TilePyramid, project_id=project_id)
+    return JsonResponse({
+        'version': pyramid.id,
+        'min_x': pyramid.min_x,
+        'min_y': pyramid.min_y,
+        'extent': pyramid.extent,
+        'tile_size': pyramid.tile_size,
+        'max_zoom': pyramid.max_zoom,
+        'n_points': pyramid.n_points,
+    })
+
+def aggregate_tile(request, project_id, zoom, tx, ty):
+    """Одна плитка агрегатов: число точек и доминирующий кластер непустых ячеек (формат AggregateTile)"""
+    pyramid = get_object_or_404(TilePyramid, project_id=project_id)
+    if zoom > pyramid.max_zoom or not (0 <= tx < 2 ** zoom and 0 <= ty < 2 ** zoom):
+        return JsonResponse({"error": "Плитка вне пирамиды"}, status=404)
+    # Пирамида пересоздаётся при каждом обновлении, поэтому её id однозначно задаёт содержимое плитки
+    etag = f'"{pyramid.id}-{zoom}-{tx}-{ty}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        tile = AggregateTile.objects.filter(pyramid=pyramid, zoom=zoom, tx=tx, ty=ty).values_list(
+            'data', flat=True).first()
+        empty = np.empty(0)
+        data = bytes(tile) if tile is not None else pack_tile(empty, empty, empty)
+        response = HttpResponse(data, content_type='application/octet-stream')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
 # API для вызова apply_tsne
 @csrf_exempt
 def apply_tsne_api(request, project_id):
@@ -187,7 +268,12 @@ def apply_tsne_api(request, project_id):
             if perplexity is None:
                 return JsonResponse({"error": "Параметр perplexity отсутствует"}, status=400)
 
-            call_command('applying_T-sne', perplexity=perplexity, project_id=project_id)
+            engine = data.get('engine', 'auto')
+            if engine != 'auto' and engine not in ENGINES:
+                return JsonResponse({"error": f"Неизвестный движок раскладки: {engine}"}, status=400)
+
+            call_command('applying_T-sne', perplexity=perplexity, project_id=project_id, engine=engine,
+                         warm_start=bool(data.get('warm_start')))
 
             return JsonResponse({"message": f"Функция apply_tsne вызвана успешно для проекта {project_id}"})
         except json.JSONDecodeError:
@@ -208,6 +294,7 @@ def clusterise(request, project_id):
     else:
         return JsonResponse({"error": "Метод не разрешен"}, status=405)
 
+@versioned
 def get_cluster_details(request, cluster_id, project_id=None):
     try:
         if project_id:
@@ -256,26 +343,25 @@ def regenerate_summary(request, project_id):
                 cluster.model = 'OpenRouter'
                 cluster.save()
             
-            # Регенерируем и сохраняем суммаризацию, используя модель из кластера
-            result = cluster.generate_summary(cluster.model)
-            
-            if isinstance(result, tuple):
-                cluster.name = result[0]
-                cluster.summary = result[1]
-                if len(result) > 2:
-                    cluster.model = result[2]
-                cluster.save()
-                
-                return JsonResponse({
-                    "message": "Суммаризация кластера успешно обновлена",
-                    "name": cluster.name,
-                    "summary": cluster.summary,
-                    "model": cluster.model,
-                    "size": cluster.size
-                })
-            else:
+            # Регенерируем суммаризацию, используя модель из кластера;
+            # без force описание обновляется только при изменении состава кластера
+            try:
+                cluster.refresh_summary(
+                    cluster.model,
+                    force=bool(data.get('force', False)),
+                    budget=INTERACTIVE_LATENCY_BUDGET,
+                )
+            except ValueError:
                 return JsonResponse({"error": "Некорректный результат генерации"}, status=500)
-                
+
+            return JsonResponse({
+                "message": "Суммаризация кластера успешно обновлена",
+                "name": cluster.name,
+                "summary": cluster.summary,
+                "model": cluster.model,
+                "size": cluster.size
+            })
+
         except json.JSONDecodeError:
             return JsonResponse({"error": "Неверный формат JSON"}, status=400)
         except Exception as e:
@@ -301,7 +387,8 @@ def run_add_youtube_command(task_id, video_url, project_id):
         }
 
         call_command('applying_T-sne', perplexity=25, project_id=project_id)
-        call_command('clusterising', project_id = project_id, auto_clusters=True)
+        # Полная перекластеризация запускается только при превышении порогов дрейфа
+        call_command('clusterising', project_id=project_id, auto_clusters=True, incremental=True)
 
     except Exception as e:
         # Update task status to failure
@@ -349,6 +436,7 @@ def add_youtube_api(request, project_id):
     return JsonResponse({"error": "Method not allowed"}, status=405)
 
 @csrf_exempt
+@versioned
 def search_complaints(request, project_id=None):
     """
     API endpoint for searching complaints based on different criteria.
@@ -396,10 +484,16 @@ def search_complaints(request, project_id=None):
                 try:
                     # Generate embedding for the search query
                     query_complaint = Complaint(text=search_query)
-                    query_embedding = query_complaint.call_gigachat_embeddings()
+                    if project_id:
+                        query_complaint.project_id = project_id
+                    query_embedding = query_complaint.compute_embedding()
                     
-                    # Filter complaints with embeddings
-                    complaints_with_embeddings = complaints.exclude(embedding=None)
+                    # Filter complaints with embeddings of the same model version and dimension
+                    complaints_with_embeddings = complaints.exclude(embedding=None).filter(
+                        embedding_dim=len(query_embedding))
+                    if project_id:
+                        complaints_with_embeddings = complaints_with_embeddings.filter(
+                            embedding_version=query_complaint.embedding_version)
                     
                     # Calculate similarities and get top results
                     similar_complaints = []
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.17 on 2026-10-19 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='embedding_provider',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='embedding_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
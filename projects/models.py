@@ -2,4 +2,17 @@ from django.db import models
 
 class Project(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
\ No newline at end of file
+    updated_at = models.DateTimeField(auto_now=True)
+    # Активная модель эмбеддингов проекта; пустое значение — EMBEDDING_PROVIDER
+    embedding_provider = models.CharField(max_length=50, blank=True, default='')
+    # Увеличивается при каждом переходе проекта на новую модель эмбеддингов
+    embedding_version = models.PositiveIntegerField(default=0)
+    # Растёт при любом изменении жалоб, кластеров или раскладки проекта; из него строятся ETag ответов API
+    data_version = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def bump_data_version(cls, project_ids):
+        """Увеличивает data_version проектов одним UPDATE"""
+        project_ids = {project_id for project_id in project_ids if project_id is not None}
+        if project_ids:
+            cls.objects.filter(id__in=project_ids).update(data_version=models.F('data_version') + 1)